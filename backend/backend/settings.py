@@ -43,6 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so their timings cover the rest of the stack
+    'deals.metrics.PrometheusMiddleware',
+    'deals.instrumentation.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +59,8 @@ ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Standard Django templates, with render time reported to RequestTimingMiddleware
+        'BACKEND': 'deals.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,15 +78,38 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+#
+# SQLite and PostgreSQL get the trigger-maintained status counters and the
+# full-text search index. Other backends (e.g. MySQL) migrate without them
+# and fall back to plain COUNT queries.
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts. With the default
+            # (deferred) mode, concurrent save_email calls that read and then
+            # write fail at once with "database is locked" instead of waiting.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
 
+# Per-request SQL / timing instrumentation (deals/instrumentation.py): a
+# Server-Timing header on every response (by default only with DEBUG, as it
+# tells anyone how the server spends its time), plus warnings on the
+# "deals.requests" logger for slow requests and statements repeated more than
+# N_PLUS_ONE_THRESHOLD times
+REQUEST_TIMING_ENABLED = os.environ.get('REQUEST_TIMING_ENABLED', 'True') == 'True'
+REQUEST_TIMING_HEADERS = os.environ.get('REQUEST_TIMING_HEADERS', str(DEBUG)) == 'True'
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_QUERIES = int(os.environ.get('SLOW_REQUEST_QUERIES', 50))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -114,6 +141,19 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Directory of the flask_ai package (classifier, text model), importable in-process via deals/ai.py
+FLASK_AI_DIR = os.environ.get('FLASK_AI_DIR', str(BASE_DIR.parent / 'flask_ai'))
+
+# Directory `python manage.py train_classifier` writes trained text model versions to
+TEXT_MODEL_PATH = os.environ.get('TEXT_MODEL_PATH', str(BASE_DIR.parent / 'flask_ai' / 'models' / 'text_model'))
+
+# In-process AI pipeline used by /api/process-email/ (same files as the Flask service;
+# unset means the built-in keyword rules / reply templates)
+AI_CLASSIFIER_RULES = os.environ.get('CLASSIFIER_RULES') or None
+AI_REPLY_TEMPLATES = os.environ.get('REPLY_TEMPLATES') or None
+AI_DEFAULT_TEMPLATE = os.environ.get('REPLY_DEFAULT_TEMPLATE', 'counter_offer')
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
@@ -128,6 +168,22 @@ LOGIN_REDIRECT_URL = '/dashboard/'
 
 N8N_WEBHOOK_URL = "http://localhost:5678/webhook-test/deal-action"
 
+# n8n webhook client (deals/webhooks.py): connection pool, retries and circuit breaker
+N8N_WEBHOOK_POOL_SIZE = int(os.environ.get('N8N_WEBHOOK_POOL_SIZE', 10))
+N8N_WEBHOOK_TIMEOUT = float(os.environ.get('N8N_WEBHOOK_TIMEOUT', 5))
+N8N_WEBHOOK_RETRIES = int(os.environ.get('N8N_WEBHOOK_RETRIES', 2))
+N8N_WEBHOOK_BACKOFF_SECONDS = float(os.environ.get('N8N_WEBHOOK_BACKOFF_SECONDS', 0.5))
+N8N_WEBHOOK_BREAKER_THRESHOLD = int(os.environ.get('N8N_WEBHOOK_BREAKER_THRESHOLD', 5))       # consecutive failed calls
+N8N_WEBHOOK_BREAKER_RESET_SECONDS = float(os.environ.get('N8N_WEBHOOK_BREAKER_RESET_SECONDS', 30))
+
+# Maximum number of emails and request body size accepted by one POST /api/save-emails/ request
+BULK_INGEST_MAX_ITEMS = int(os.environ.get('BULK_INGEST_MAX_ITEMS', 10000))
+BULK_INGEST_MAX_BYTES = int(os.environ.get('BULK_INGEST_MAX_BYTES', 50 * 1024 * 1024))
+
+# In-process cache of known thread_ids for /api/deals/check/ (per worker process)
+THREAD_CACHE_SIZE = int(os.environ.get('THREAD_CACHE_SIZE', 100000))
+THREAD_CACHE_TTL = float(os.environ.get('THREAD_CACHE_TTL', 300))   # seconds; bounds how long a deal deleted by another process is still reported
+
 
 # Email (SMTP) settings - configure via environment variables in production
 # Example (Windows PowerShell):
@@ -144,3 +200,9 @@ DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'kavyavankayalapati999
 
 # Log email errors to console (helpful for debugging)
 EMAIL_DEBUG = os.environ.get('EMAIL_DEBUG', 'True') == 'True'
+
+# Outbox worker (python manage.py process_outbox) - webhook/email delivery retries
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))          # then dead-lettered
+OUTBOX_BACKOFF_SECONDS = int(os.environ.get('OUTBOX_BACKOFF_SECONDS', 30))   # doubles per attempt
+OUTBOX_BACKOFF_MAX_SECONDS = int(os.environ.get('OUTBOX_BACKOFF_MAX_SECONDS', 3600))
+OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', 300))
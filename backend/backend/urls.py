@@ -18,11 +18,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
 
+from deals.metrics import metrics_view
+
 def home(request):
     return HttpResponse("This is Deals Backend Server")
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),   # Prometheus scrape endpoint
     path('api/', include('deals.urls')),     # API endpoints
     path('', include('deals.urls')),         # Dashboard and authentication URLs
 ]
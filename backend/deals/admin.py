@@ -1,6 +1,78 @@
+from django import forms
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import Client, Deal, EmailMessage
+from .models import Client, Deal, EmailMessage, OutboxMessage
+from .search import matching_email_ids
+from .services import deal_status_totals
+
+
+# Unfiltered changelists of tables at least this big show an estimated total
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def estimated_row_count(model):
+    """
+    Approximate number of rows in `model`'s table without a COUNT(*): the
+    planner statistics on PostgreSQL, the primary key range on SQLite (one
+    index lookup at each end; deleted rows are still counted). None if unknown.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == "sqlite":
+            # Two scalar subqueries: SQLite only optimises a lone MIN() or MAX()
+            cursor.execute(f"SELECT (SELECT MAX(rowid) FROM {table}) - (SELECT MIN(rowid) FROM {table}) + 1")
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator that doesn't COUNT(*) a whole big table: without
+    filters or a search it uses estimated_row_count(). Filtered lists, and
+    tables under ESTIMATED_COUNT_THRESHOLD rows, are still counted exactly.
+    """
+
+    def unfiltered_count(self):
+        estimate = estimated_row_count(self.object_list.model)
+        if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return None
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            count = self.unfiltered_count()
+            if count is not None:
+                return count
+        return super().count
+
+
+class DealPaginator(EstimatedCountPaginator):
+    def unfiltered_count(self):
+        # Exact, from the trigger-maintained per-status counters
+        return sum(deal_status_totals().values())
+
+
+def related_count(model, field):
+    """Subquery counting the `model` rows whose `field` points at the outer row (0 if none)."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")}).order_by()
+            .values(field).annotate(count=Count("pk")).values("count")
+        ),
+        0,
+    )
 
 
 @admin.register(Client)
@@ -9,18 +81,29 @@ class ClientAdmin(admin.ModelAdmin):
     list_filter = ['created_at']
     search_fields = ['email', 'brand_name']
     readonly_fields = ['created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        # Counted in the page query, only for the rows on the page
+        return super().get_queryset(request).annotate(deal_count=related_count(Deal, "client"))
     
     def deal_count(self, obj):
-        count = obj.deal_set.count()
-        return count
+        return obj.deal_count
     deal_count.short_description = 'Deals'
+    deal_count.admin_order_field = 'deal_count'
 
 
 @admin.register(Deal)
 class DealAdmin(admin.ModelAdmin):
     list_display = ['id', 'client_email', 'subject', 'status_badge', 'thread_id', 'created_at', 'updated_at', 'email_count']
     list_filter = ['status', 'created_at', 'updated_at']
+    # Shown as the search box; get_search_results does the matching
     search_fields = ['subject', 'thread_id', 'client__email', 'client__brand_name']
+    ordering = ['-created_at', '-id']
+    list_select_related = ['client']
+    paginator = DealPaginator
+    show_full_result_count = False
     readonly_fields = ['created_at', 'updated_at', 'thread_id']
     fieldsets = (
         ('Deal Information', {
@@ -34,9 +117,37 @@ class DealAdmin(admin.ModelAdmin):
         }),
     )
     
+    def changelist_view(self, request, extra_context=None):
+        # Status summary above the list, from the trigger-maintained counters
+        counts = deal_status_totals()
+        extra_context = extra_context or {}
+        extra_context['status_counts'] = [
+            (label, counts[status]) for status, label in Deal.STATUS_CHOICES
+        ]
+        return super().changelist_view(request, extra_context=extra_context)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(email_count=related_count(EmailMessage, "deal"))
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Deals with a matching email (full-text index), an exact thread id, or
+        # a matching client; no LIKE scan over the deal table
+        matches = matching_email_ids(search_term)
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        clients = Client.objects.filter(Q(email__icontains=term) | Q(brand_name__icontains=term))
+        queryset = queryset.filter(
+            Q(pk__in=EmailMessage.objects.filter(pk__in=matches).values("deal_id"))
+            | Q(thread_id=term)
+            | Q(client__in=clients.values("pk"))
+        )
+        return queryset, False
+    
     def client_email(self, obj):
         return obj.client.email
     client_email.short_description = 'Client Email'
+    client_email.admin_order_field = 'client__email'
     
     def status_badge(self, obj):
         colors = {
@@ -56,16 +167,40 @@ class DealAdmin(admin.ModelAdmin):
     status_badge.short_description = 'Status'
     
     def email_count(self, obj):
-        count = obj.emails.count()
-        return count
+        return obj.email_count
     email_count.short_description = 'Emails'
+    email_count.admin_order_field = 'email_count'
+
+
+class EmailMessageAdminForm(forms.ModelForm):
+    """Edits the body through EmailMessage.body, which stores it compressed."""
+    body = forms.CharField(widget=forms.Textarea)
+
+    class Meta:
+        model = EmailMessage
+        exclude = ['body_blob', 'inline_body']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial['body'] = self.instance.body
+
+    def save(self, commit=True):
+        self.instance.body = self.cleaned_data['body']
+        return super().save(commit)
 
 
 @admin.register(EmailMessage)
 class EmailMessageAdmin(admin.ModelAdmin):
+    form = EmailMessageAdminForm
     list_display = ['id', 'deal_link', 'direction_badge', 'from_email', 'to_email', 'subject_preview', 'created_at']
     list_filter = ['direction', 'created_at', 'deal__status']
-    search_fields = ['subject', 'body', 'from_email', 'to_email', 'deal__thread_id']
+    # Searches the full-text index (see get_search_results)
+    search_fields = ['subject', 'from_email', 'to_email', 'deal__thread_id']
+    ordering = ['-created_at', '-id']
+    list_select_related = ['deal']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ['created_at']
     fieldsets = (
         ('Email Information', {
@@ -79,13 +214,24 @@ class EmailMessageAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_search_results(self, request, queryset, search_term):
+        # Subject, body and addresses through the full-text index instead of
+        # LIKE '%term%' over every body; thread ids by exact match
+        matches = matching_email_ids(search_term)
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        threads = Deal.objects.filter(thread_id=search_term.strip())
+        queryset = queryset.filter(Q(pk__in=matches) | Q(deal__in=threads.values("pk")))
+        return queryset, False
+    
     def deal_link(self, obj):
         return format_html(
-            '<a href="/admin/deals/deal/{}/change/">{}</a>',
-            obj.deal.id,
-            f"Deal #{obj.deal.id} - {obj.deal.subject[:30]}..."
+            '<a href="{}">{}</a>',
+            reverse('admin:deals_deal_change', args=[obj.deal_id]),
+            f"Deal #{obj.deal_id} - {obj.deal.subject[:30]}..."
         )
     deal_link.short_description = 'Deal'
+    deal_link.admin_order_field = 'deal'
     
     def direction_badge(self, obj):
         color = 'blue' if obj.direction == 'INCOMING' else 'green'
@@ -101,6 +247,22 @@ class EmailMessageAdmin(admin.ModelAdmin):
     subject_preview.short_description = 'Subject'
 
 
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'deal', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    list_select_related = ['deal__client']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ['created_at', 'sent_at', 'attempts', 'last_error']
+    actions = ['retry_now']
+    
+    @admin.action(description='Retry selected messages now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='SENT').update(status='PENDING', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{updated} message(s) queued for retry.")
+
+
 admin.site.site_header = "Deals Admin"
 admin.site.site_title = "Deals Admin Portal"
 admin.site.index_title = "Welcome to Deals Admin Portal"
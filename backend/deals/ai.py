@@ -0,0 +1,37 @@
+import importlib
+import importlib.util
+import sys
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+
+def import_ai_module(name):
+    """
+    Import a module of the flask_ai package, e.g. import_ai_module("text_model")
+    for flask_ai.text_model, so Django code can reuse it in-process. Unless the
+    package is already importable (installed), the directory containing
+    FLASK_AI_DIR is added to sys.path.
+    """
+    if "flask_ai" not in sys.modules and importlib.util.find_spec("flask_ai") is None:
+        sys.path.append(str(Path(settings.FLASK_AI_DIR).resolve().parent))
+    return importlib.import_module(f"flask_ai.{name}")
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """Process-wide flask_ai EmailPipeline configured from the AI_* / TEXT_MODEL_PATH settings."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = import_ai_module("pipeline").EmailPipeline.from_settings(
+                classifier_rules=getattr(settings, "AI_CLASSIFIER_RULES", None),
+                text_model_path=getattr(settings, "TEXT_MODEL_PATH", None),
+                reply_templates=getattr(settings, "AI_REPLY_TEMPLATES", None),
+                default_template=getattr(settings, "AI_DEFAULT_TEMPLATE", "counter_offer"),
+            )
+        return _pipeline
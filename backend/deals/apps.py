@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DealsConfig(AppConfig):
     name = 'deals'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,146 @@
+import contextvars
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger("deals.requests")
+
+# RequestStats of the request being handled in this thread / context
+current_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """
+    SQL and timing figures for one request. Installed as a
+    connection.execute_wrapper, so it sees every query the request runs.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_ms = 0.0
+        self.template_ms = 0.0
+        self.db_ms = 0.0
+        self.queries = 0
+        self.statements = Counter()  # SQL text (placeholders, not values) -> executions
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.statements[sql] += 1
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def repeated_statements(self, threshold):
+        """[(sql, count)] for statements run more than `threshold` times: likely N+1 queries."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count > threshold]
+
+    def server_timing(self, total_ms):
+        return ", ".join([
+            f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"',
+            f"view;dur={self.view_ms:.1f}",
+            f"tpl;dur={self.template_ms:.1f}",
+            f"total;dur={total_ms:.1f}",
+        ])
+
+
+class TimedTemplate:
+    """Backend template wrapper that adds its render time to the current RequestStats."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_ms += (time.perf_counter() - started) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The standard Django template engine, with render time reported to RequestTimingMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestTimingMiddleware:
+    """
+    Records SQL query count, DB time, view time and template time for every
+    request, and sends them back as a Server-Timing header (visible in the
+    browser dev tools' network tab) when REQUEST_TIMING_HEADERS is set, which
+    defaults to DEBUG.
+
+    Logs a warning on the "deals.requests" logger when a request is slower
+    than SLOW_REQUEST_MS or runs more than SLOW_REQUEST_QUERIES queries, and
+    when one SQL statement runs more than N_PLUS_ONE_THRESHOLD times (the
+    usual sign of a per-row lookup in a loop). Put it first in MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "REQUEST_TIMING_ENABLED", True)
+        self.headers = getattr(settings, "REQUEST_TIMING_HEADERS", settings.DEBUG)
+        self.slow_ms = getattr(settings, "SLOW_REQUEST_MS", 500)
+        self.slow_queries = getattr(settings, "SLOW_REQUEST_QUERIES", 50)
+        self.n_plus_one_threshold = getattr(settings, "N_PLUS_ONE_THRESHOLD", 10)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+
+        if stats.view_started is not None:
+            stats.view_ms = (time.perf_counter() - stats.view_started) * 1000
+        total_ms = stats.total_ms
+        if self.headers:
+            response["Server-Timing"] = stats.server_timing(total_ms)
+        self.report(request, response, stats, total_ms)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = current_stats.get()
+        if stats is not None:
+            stats.view_started = time.perf_counter()
+
+    def report(self, request, response, stats, total_ms):
+        if total_ms > self.slow_ms or stats.queries > self.slow_queries:
+            logger.warning(
+                "Slow request %s %s (%s): %.1f ms total, %.1f ms view, %.1f ms template, %d queries in %.1f ms",
+                request.method, request.path, response.status_code, total_ms, stats.view_ms,
+                stats.template_ms, stats.queries, stats.db_ms,
+            )
+        for sql, count in stats.repeated_statements(self.n_plus_one_threshold):
+            logger.warning("Possible N+1 on %s %s: query ran %d times: %s",
+                           request.method, request.path, count, sql)
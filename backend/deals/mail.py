@@ -0,0 +1,108 @@
+import smtplib
+import time
+
+from django.core.mail import get_connection
+
+from .metrics import SMTP_FAILURES, SMTP_LATENCY
+
+
+def _is_connection_error(error):
+    """
+    True for errors that mean the SMTP connection itself is gone (worth a
+    reconnect), False for per-message rejections such as refused recipients.
+    smtplib.SMTPException subclasses OSError, so check it first.
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)
+
+
+class MailDispatcher:
+    """
+    Sends email over one long-lived connection from get_connection().
+
+    The connection (and its TLS handshake) is opened lazily, reused for every
+    message until close() is called, and reopened once if the server drops it
+    mid-batch. `metrics()` reports how well the connection is being reused.
+    """
+
+    def __init__(self, connection_factory=get_connection):
+        self.connection_factory = connection_factory
+        self.connection = None
+        self.connections_opened = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+        self.handshake_seconds = 0.0
+
+    def open(self):
+        if self.connection is None:
+            started = time.perf_counter()
+            connection = self.connection_factory(fail_silently=False)
+            connection.open()
+            self.handshake_seconds += time.perf_counter() - started
+            self.connections_opened += 1
+            self.connection = connection
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def _send_one(self, message):
+        message.connection = self.open()
+        try:
+            self.connection.send_messages([message])
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            # Server dropped us (idle timeout, restart): reconnect and retry once
+            self.close()
+            message.connection = self.open()
+            self.connection.send_messages([message])
+
+    def send_messages(self, messages):
+        """
+        Send `messages` over the shared connection.
+        Returns one error (or None on success) per message, in order, so the
+        caller can retry only the ones that failed.
+        """
+        errors = []
+        for message in messages:
+            started = time.perf_counter()
+            try:
+                self._send_one(message)
+            except Exception as e:
+                SMTP_LATENCY.labels("error").observe(time.perf_counter() - started)
+                SMTP_FAILURES.inc()
+                self.messages_failed += 1
+                errors.append(e)
+                if _is_connection_error(e):
+                    self.close()
+            else:
+                SMTP_LATENCY.labels("ok").observe(time.perf_counter() - started)
+                self.messages_sent += 1
+                errors.append(None)
+        return errors
+
+    def metrics(self):
+        connections = self.connections_opened
+        return {
+            "connections_opened": connections,
+            "messages_sent": self.messages_sent,
+            "messages_failed": self.messages_failed,
+            "messages_per_connection": self.messages_sent / connections if connections else 0.0,
+            "handshake_seconds_total": self.handshake_seconds,
+            "handshake_seconds_avg": self.handshake_seconds / connections if connections else 0.0,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,194 @@
+import json
+import random
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from deals.models import Deal, EmailMessage
+
+
+ENDPOINTS = ["save_email", "dashboard", "deal_detail", "check_deal_exists"]
+BENCHMARK_USER = "benchmark"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test save_email, dashboard, deal_detail and check_deal_exists through the "
+        "Django test client at a fixed concurrency. Reports throughput, p50/p95/p99 "
+        "latency and SQL queries per request, and saves the results as JSON. "
+        "save_email writes rows: run it against a scratch database (see generate_data)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000, help="Requests per endpoint (default 1000).")
+        parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients (threads, default 4).")
+        parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                            help=f"Comma-separated subset of {', '.join(ENDPOINTS)}.")
+        parser.add_argument("--output", default=None,
+                            help="Results file (default benchmark-<timestamp>.json in the current directory).")
+        parser.add_argument("--keep", action="store_true", help="Keep the deals created by the save_email run.")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options["endpoints"].split(",") if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+
+        self.rng = random.Random(options["seed"])
+        self.run_id = uuid.uuid4().hex[:8]
+        self.user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+        self.deal_ids, self.thread_ids = self.sample_deals(1000)
+        if not self.deal_ids and {"deal_detail", "check_deal_exists"} & set(endpoints):
+            raise CommandError("No deals to read; run `python manage.py generate_data` first.")
+
+        report = {
+            "started_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "deals": Deal.objects.count(),
+            "emails": EmailMessage.objects.count(),
+            "requests_per_endpoint": options["requests"],
+            "concurrency": options["concurrency"],
+            "results": {},
+        }
+        self.stdout.write(f"{report['deals']} deals, {report['emails']} emails, "
+                          f"concurrency {options['concurrency']}")
+        self.stdout.write(f"{'endpoint':<18} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'queries':>8} {'errors':>7}")
+
+        try:
+            for name in endpoints:
+                requests = [getattr(self, f"request_{name}")(i) for i in range(options["requests"])]
+                result = self.run(requests, options["concurrency"])
+                report["results"][name] = result
+                self.stdout.write(
+                    f"{name:<18} {result['throughput']:>9.1f} {result['latency_ms']['p50']:>8.2f} "
+                    f"{result['latency_ms']['p95']:>8.2f} {result['latency_ms']['p99']:>8.2f} "
+                    f"{result['queries']['mean']:>8.1f} {result['errors']:>7}"
+                )
+        finally:
+            if not options["keep"]:
+                Deal.objects.filter(thread_id__startswith=f"bench-{self.run_id}-").delete()
+
+        output = options["output"] or f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        with open(output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Saved results to {output}"))
+
+    def sample_deals(self, count):
+        """Up to `count` random existing (deal ids, thread ids), without ORDER BY RANDOM() on big tables."""
+        bounds = Deal.objects.aggregate(low=Min("id"), high=Max("id"))
+        if bounds["low"] is None:
+            return [], []
+        candidates = {self.rng.randint(bounds["low"], bounds["high"]) for _ in range(count * 2)}
+        rows = list(Deal.objects.filter(id__in=candidates).values_list("id", "thread_id")[:count])
+        if not rows:
+            rows = list(Deal.objects.values_list("id", "thread_id")[:count])
+        return [row[0] for row in rows], [row[1] for row in rows]
+
+    #  REQUESTS: (method, path, payload) per request index
+
+    def request_save_email(self, i):
+        # Half the requests open a thread, the other half reply on one
+        thread = i // 2
+        payload = {
+            "thread_id": f"bench-{self.run_id}-{thread}",
+            "subject": "Benchmark collab",
+            "body": "Hi, we'd love to sponsor a video on your channel.",
+            "from_email": f"brand{thread % 500}@bench.example.com" if i % 2 == 0 else "creator@example.com",
+            "to_email": "creator@example.com" if i % 2 == 0 else f"brand{thread % 500}@bench.example.com",
+            "direction": "INCOMING" if i % 2 == 0 else "OUTGOING",
+        }
+        return "post", reverse("save_email"), json.dumps(payload)
+
+    def request_dashboard(self, i):
+        return "get", reverse("dashboard"), None
+
+    def request_deal_detail(self, i):
+        return "get", reverse("deal_detail", args=[self.rng.choice(self.deal_ids)]), None
+
+    def request_check_deal_exists(self, i):
+        # Mix of known and unknown threads
+        thread_id = self.rng.choice(self.thread_ids) if i % 2 == 0 else f"missing-{self.run_id}-{i}"
+        return "get", f"{reverse('check_deal_exists')}?thread_id={thread_id}", None
+
+    #  RUNNER
+
+    def run(self, requests, concurrency):
+        samples = []
+        lock = threading.Lock()
+        pending = iter(requests)
+
+        def worker(close_connection):
+            client = TestClient()
+            client.force_login(self.user)
+            local = []
+            while True:
+                with lock:
+                    request = next(pending, None)
+                if request is None:
+                    break
+                local.append(self.timed(client, *request))
+            with lock:
+                samples.extend(local)
+            if close_connection:
+                connection.close()
+
+        started = time.perf_counter()
+        if concurrency == 1:
+            worker(close_connection=False)
+        else:
+            threads = [threading.Thread(target=worker, args=(True,)) for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(sample[0] for sample in samples)
+        queries = [sample[1] for sample in samples]
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for sample in samples if sample[2] >= 400),
+            "seconds": round(elapsed, 3),
+            "throughput": len(samples) / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                "mean": sum(latencies) / len(latencies),
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": latencies[-1],
+            },
+            "queries": {"mean": sum(queries) / len(queries), "max": max(queries)},
+        }
+
+    def timed(self, client, method, path, body):
+        """Return (latency ms, SQL queries, status code) for one request."""
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            try:
+                if method == "post":
+                    status = client.post(path, data=body, content_type="application/json").status_code
+                else:
+                    status = client.get(path).status_code
+            except Exception:
+                status = 599
+            elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, len(captured.captured_queries), status
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from deals.models import TRIGGER_VENDORS, EmailBody, EmailMessage, body_digest, sync_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Move email bodies still stored inline in the email table into "
+        "compressed, deduplicated EmailBody rows, in batches (safe to re-run)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Emails converted per transaction (default 2000).")
+        parser.add_argument("--prune", action="store_true", help="Also delete bodies no email points at any more.")
+        parser.add_argument("--vacuum", action="store_true",
+                            help="VACUUM afterwards so SQLite gives the freed pages back to the file system.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+        if connection.vendor not in TRIGGER_VENDORS:
+            raise CommandError(f"Bodies stay inline on {connection.vendor}, where search has to read them.")
+        if options["vacuum"] and connection.vendor != "sqlite":
+            raise CommandError("--vacuum is only supported on SQLite; use VACUUM FULL or pg_repack on PostgreSQL.")
+
+        converted = raw_bytes = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    EmailMessage.objects.filter(body_blob__isnull=True, id__gt=last_id)
+                    .exclude(inline_body="")
+                    .only("id", "inline_body")
+                    .order_by("id")[:batch_size]
+                )
+                if not batch:
+                    break
+                stored = EmailBody.objects.store_many([message.inline_body for message in batch])
+                raw_bytes += sum(len(message.inline_body.encode("utf-8")) for message in batch)
+                # One prepared statement per row; bulk_update's CASE
+                # expressions cost far more to build than to run
+                with connection.cursor() as cursor:
+                    if connection.vendor == "sqlite":
+                        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM deals_email_fts_pending")
+                        queued_before = cursor.fetchone()[0]
+                    cursor.executemany(
+                        "UPDATE deals_emailmessage SET body_blob_id = %s, body = '' WHERE id = %s",
+                        [(stored[body_digest(message.inline_body)].id, message.id) for message in batch],
+                    )
+                    if connection.vendor == "sqlite":
+                        # The text is the same, so the index already has it
+                        cursor.execute("DELETE FROM deals_email_fts_pending WHERE id > %s", [queued_before])
+            converted += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"  {converted} emails converted")
+
+        if options["prune"]:
+            # Queued changes may still need an old body to clear the index
+            sync_search_index()
+            unused = EmailBody.objects.filter(~Exists(EmailMessage.objects.filter(body_blob=OuterRef("pk"))))
+            pruned, _ = unused.delete()
+            self.stdout.write(f"Deleted {pruned} unused bodies.")
+
+        if options["vacuum"]:
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {converted} emails ({raw_bytes} bytes of text). "
+            f"{EmailBody.objects.count()} distinct bodies take {self.stored_bytes()} bytes compressed."
+        ))
+
+    def stored_bytes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM deals_emailbody")
+            return cursor.fetchone()[0]
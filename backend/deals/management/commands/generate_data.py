@@ -0,0 +1,159 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from deals.models import Client, Deal, EmailMessage, attach_bodies, sync_search_index
+
+
+# (status, weight, message directions in the thread). The threads follow the
+# save_email status rules: we reply → WAITING_FOR_CLIENT, the client answers
+# → PENDING_CREATOR, then the creator accepts or rejects.
+STATUS_THREADS = [
+    ("NEW", 30, ["INCOMING"]),
+    ("WAITING_FOR_CLIENT", 30, ["INCOMING", "OUTGOING"]),
+    ("PENDING_CREATOR", 15, ["INCOMING", "OUTGOING", "INCOMING"]),
+    ("COMPLETED", 12, ["INCOMING", "OUTGOING", "INCOMING"]),
+    ("REJECTED", 8, ["INCOMING", "OUTGOING", "INCOMING"]),
+    ("AUTO_REJECTED", 5, ["INCOMING"]),
+]
+
+BRANDS = ["Acme", "Glow", "Nimbus", "Fable", "Orbit", "Zest", "Pixel", "Summit", "Tidal", "Ember", "Lumen", "Nova"]
+PRODUCTS = ["skincare line", "fitness app", "headphones", "coffee subscription", "travel backpack", "mobile game"]
+DELIVERABLES = ["one Instagram reel", "two stories", "a YouTube integration", "a dedicated video", "three TikToks"]
+
+# Incoming bodies on deals that end up COMPLETED read like real offers, the
+# rejected ones lean spammy, so the data is also usable by train_classifier.
+OFFER_BODIES = [
+    "Hi! We're {brand} and we'd love to collaborate with you on our new {product}. "
+    "We're thinking {deliverable}. What are your rates?",
+    "Hello, {brand} here. We want to sponsor {deliverable} about our {product}. Budget is flexible, "
+    "please share your media kit.",
+    "Hey, our team at {brand} loved your last video. Would you be open to a paid partnership "
+    "for our {product} launch? Looking at {deliverable}.",
+]
+SPAM_BODIES = [
+    "Congratulations! You have been selected for an exclusive offer from {brand}. Click here to claim your prize.",
+    "Boost your followers fast with {brand}! Cheap growth packages, guaranteed results, limited time only.",
+    "Dear creator, {brand} is giving free {product} to influencers. Just pay shipping and post about it.",
+]
+FOLLOW_UP_BODIES = [
+    "Thanks for getting back to us. That works for our budget, can you share a timeline?",
+    "Appreciate the quick reply! Could you do {deliverable} within that fee?",
+    "That's a bit above what we planned. Is there any flexibility on the price?",
+]
+REPLY_BODY = (
+    "Hi,\n\nThanks for reaching out for collaboration.\n"
+    "Our standard collaboration fee starts from ₹{price}.\nPlease let us know if this works for you.\n\n"
+    "Regards,\nInfluencer"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic clients, deals and email threads for load testing "
+        "(scales to millions of rows; rows are bulk inserted in batches)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--deals", type=int, default=10000, help="Number of deals (threads) to create (default 10000).")
+        parser.add_argument("--clients", type=int, default=None,
+                            help="Number of clients to spread them over (default: deals / 5).")
+        parser.add_argument("--extra-rounds", type=int, default=2,
+                            help="Up to this many extra back-and-forth messages per thread (default 2).")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Deals inserted per transaction (default 5000).")
+        parser.add_argument("--creator-email", default="creator@example.com")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        deal_count = options["deals"]
+        client_count = options["clients"] or max(1, deal_count // 5)
+        batch_size = options["batch_size"]
+        if deal_count < 1 or client_count < 1 or batch_size < 1:
+            raise CommandError("--deals, --clients and --batch-size must be positive.")
+
+        rng = random.Random(options["seed"])
+        # Unique per run so the command can be run repeatedly on the same database
+        run = uuid.uuid4().hex[:8]
+        started = time.perf_counter()
+
+        clients = self.create_clients(rng, run, client_count, batch_size)
+        statuses = [status for status, _, _ in STATUS_THREADS]
+        weights = [weight for _, weight, _ in STATUS_THREADS]
+        threads = {status: directions for status, _, directions in STATUS_THREADS}
+
+        emails_created = 0
+        for offset in range(0, deal_count, batch_size):
+            size = min(batch_size, deal_count - offset)
+            with transaction.atomic():
+                deals = []
+                for i in range(offset, offset + size):
+                    client = clients[rng.randrange(len(clients))]
+                    product = rng.choice(PRODUCTS)
+                    deals.append(Deal(
+                        client=client,
+                        subject=f"{client.brand_name} x creator: {product}",
+                        thread_id=f"synthetic-{run}-{i}",
+                        status=rng.choices(statuses, weights)[0],
+                    ))
+                Deal.objects.bulk_create(deals, batch_size=1000)
+
+                messages = []
+                for deal in deals:
+                    messages.extend(self.thread_messages(rng, deal, threads[deal.status], options))
+                attach_bodies(messages)
+                EmailMessage.objects.bulk_create(messages, batch_size=1000)
+                sync_search_index(messages)
+                emails_created += len(messages)
+
+            self.stdout.write(f"  {offset + size}/{deal_count} deals, {emails_created} emails")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(clients)} clients, {deal_count} deals and {emails_created} emails "
+            f"in {elapsed:.1f}s (run {run})"
+        ))
+
+    def create_clients(self, rng, run, count, batch_size):
+        clients = []
+        for offset in range(0, count, batch_size):
+            batch = [
+                Client(email=f"client{i}-{run}@brand{i}.example.com",
+                       brand_name=f"{rng.choice(BRANDS)} {i}")
+                for i in range(offset, min(count, offset + batch_size))
+            ]
+            clients.extend(Client.objects.bulk_create(batch, batch_size=1000))
+        return clients
+
+    def thread_messages(self, rng, deal, directions, options):
+        directions = list(directions)
+        if deal.status in ("PENDING_CREATOR", "COMPLETED", "REJECTED"):
+            for _ in range(rng.randint(0, options["extra_rounds"])):
+                directions += ["OUTGOING", "INCOMING"]
+
+        values = {
+            "brand": deal.client.brand_name,
+            "product": rng.choice(PRODUCTS),
+            "deliverable": rng.choice(DELIVERABLES),
+            "price": rng.choice([5000, 7500, 10000, 15000, 25000]),
+        }
+        opener = SPAM_BODIES if deal.status in ("REJECTED", "AUTO_REJECTED") else OFFER_BODIES
+        messages = []
+        for position, direction in enumerate(directions):
+            if direction == "OUTGOING":
+                body = REPLY_BODY
+                sender, recipient = options["creator_email"], deal.client.email
+            else:
+                body = rng.choice(opener if position == 0 else FOLLOW_UP_BODIES)
+                sender, recipient = deal.client.email, options["creator_email"]
+            messages.append(EmailMessage(
+                deal=deal,
+                direction=direction,
+                subject=deal.subject if position == 0 else f"Re: {deal.subject}",
+                body=body.format(**values),
+                from_email=sender,
+                to_email=recipient,
+            ))
+        return messages
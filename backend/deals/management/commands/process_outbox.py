@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from deals.mail import MailDispatcher
+from deals.outbox import process_due
+
+
+class Command(BaseCommand):
+    help = "Deliver queued n8n webhooks and client emails from the outbox, with retries and backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the due messages once and exit.")
+        parser.add_argument("--batch-size", type=int, default=100, help="Messages claimed per batch (default 100).")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to sleep when nothing is due (default 5).")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        # One SMTP connection for the whole run; closed whenever the queue is idle
+        # so the server's idle timeout doesn't kill it between batches.
+        dispatcher = MailDispatcher()
+        try:
+            while True:
+                sent, failed = process_due(batch_size, dispatcher=dispatcher)
+                if sent or failed:
+                    self.stdout.write(f"Outbox: {sent} sent, {failed} failed")
+                if sent + failed >= batch_size:
+                    continue
+                dispatcher.close()
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Outbox worker stopped.")
+        finally:
+            dispatcher.close()
+            self.report(dispatcher.metrics())
+
+    def report(self, metrics):
+        if metrics["connections_opened"]:
+            self.stdout.write(
+                "SMTP: {messages_sent} sent / {messages_failed} failed over {connections_opened} connection(s), "
+                "{messages_per_connection:.1f} msgs/connection, "
+                "avg handshake {handshake_seconds_avg:.3f}s".format(**metrics)
+            )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from deals.models import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SQLite email search index, e.g. after emails were changed outside the app."
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index()
+        if indexed is None:
+            self.stdout.write("This database maintains its own search index.")
+            return
+        self.stdout.write(f"Indexed {indexed} emails.")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from deals.services import recount_deal_statuses
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-status deal counters from the deal table and fix any drift."
+
+    def handle(self, *args, **options):
+        drift = recount_deal_statuses()
+        if not drift:
+            self.stdout.write("Deal status counters are accurate.")
+            return
+        for status, (old, new) in sorted(drift.items()):
+            self.stdout.write(f"{status}: {old} -> {new}")
+        self.stdout.write(f"Fixed {len(drift)} counter(s).")
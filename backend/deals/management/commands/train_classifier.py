@@ -0,0 +1,87 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from deals.ai import import_ai_module
+from deals.models import EmailMessage
+
+
+USEFUL_STATUSES = ["COMPLETED"]
+NOT_USEFUL_STATUSES = ["REJECTED", "AUTO_REJECTED"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the local TF-IDF + naive Bayes email classifier from incoming emails on "
+        "COMPLETED (useful) and REJECTED / AUTO_REJECTED (not useful) deals, benchmark it "
+        "against the keyword rule on a holdout split, and save it for the Flask AI service."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=settings.TEXT_MODEL_PATH, help="Model directory to write a new version into.")
+        parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of deals held out for evaluation (default 0.2).")
+        parser.add_argument("--min-df", type=int, default=2, help="Ignore terms seen in fewer emails (default 2).")
+        parser.add_argument("--max-features", type=int, default=50000, help="Vocabulary size cap (default 50000).")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        text_model = import_ai_module("text_model")
+        classifier = import_ai_module("classifier")
+
+        rows = [
+            (email.deal_id, email.body, email.deal.status)
+            for email in EmailMessage.objects.filter(
+                direction="INCOMING",
+                deal__status__in=USEFUL_STATUSES + NOT_USEFUL_STATUSES,
+            ).select_related("deal", "body_blob").only(
+                "deal_id", "inline_body", "body_blob__data", "deal__status",
+            ).iterator(chunk_size=2000)
+        ]
+        if not rows:
+            raise CommandError("No incoming emails on COMPLETED / REJECTED deals to train on.")
+
+        # Split by deal so messages from one thread never land on both sides
+        deal_ids = sorted({deal_id for deal_id, _, _ in rows})
+        random.Random(options["seed"]).shuffle(deal_ids)
+        holdout_deals = set(deal_ids[:int(len(deal_ids) * options["holdout"])])
+        train = [(body, status in USEFUL_STATUSES) for deal_id, body, status in rows if deal_id not in holdout_deals]
+        test = [(body, status in USEFUL_STATUSES) for deal_id, body, status in rows if deal_id in holdout_deals]
+        self.stdout.write(f"{len(rows)} emails from {len(deal_ids)} deals: {len(train)} train, {len(test)} holdout")
+
+        train_options = {"min_df": options["min_df"], "max_features": options["max_features"]}
+        try:
+            if test:
+                model = text_model.TextModel.train([b for b, _ in train], [y for _, y in train], **train_options)
+                keywords = classifier.KeywordClassifier.from_rules(classifier.DEFAULT_RULES)
+                self.benchmark("text model", model, test)
+                self.benchmark("keyword rule", keywords, test)
+
+            # Final model uses every labelled email
+            model = text_model.TextModel.train([body for _, body, _ in rows],
+                                               [status in USEFUL_STATUSES for _, _, status in rows], **train_options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        version = model.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved model version {version} with {len(model.terms)} terms to {options['output']}"
+        ))
+
+    def benchmark(self, name, model, test):
+        bodies = [body for body, _ in test]
+        labels = [label for _, label in test]
+
+        # Repeat small holdouts so the timing isn't dominated by noise
+        repeats = max(1, 10000 // len(bodies))
+        started = time.perf_counter()
+        for _ in range(repeats):
+            results = model.classify_many(bodies)
+        elapsed = time.perf_counter() - started
+
+        correct = sum((r["category"] == "useful") == label for r, label in zip(results, labels))
+        self.stdout.write(
+            f"  {name:<12} accuracy {correct / len(labels):.3f}  "
+            f"{repeats * len(bodies) / elapsed:,.0f} emails/s"
+        )
@@ -0,0 +1,102 @@
+"""
+Prometheus metrics for the backend, served at /metrics.
+
+Counters and histograms come from prometheus_client. With several worker
+processes (gunicorn, uwsgi) set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory before the workers start: each process then writes its
+values to its own memory-mapped file with no cross-process locking, and
+/metrics sums them at scrape time.
+"""
+
+import os
+import time
+from collections import Counter as Tally
+
+from django.db import transaction
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUESTS = Counter(
+    "deals_http_requests_total", "HTTP requests by URL route, method and status code.",
+    ["route", "method", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "deals_http_request_duration_seconds", "HTTP request latency by URL route and method.",
+    ["route", "method"], buckets=LATENCY_BUCKETS,
+)
+EMAILS_INGESTED = Counter(
+    "deals_emails_ingested_total", "Emails saved by save_email, save-emails and process-email, by direction.",
+    ["direction"],
+)
+EMAILS_DEDUPLICATED = Counter(
+    "deals_emails_deduplicated_total", "Ingested emails recognised as retries of emails already saved (nothing written).",
+)
+STATUS_TRANSITIONS = Counter(
+    "deals_status_transitions_total", 'Deal status changes; from_status is "none" for new deals.',
+    ["from_status", "to_status"],
+)
+WEBHOOK_LATENCY = Histogram(
+    "deals_webhook_attempt_duration_seconds", "n8n webhook HTTP attempts by outcome (ok / error).",
+    ["outcome"], buckets=LATENCY_BUCKETS,
+)
+WEBHOOK_FAILURES = Counter(
+    "deals_webhook_failures_total", "n8n webhook calls that failed after retries or were skipped (circuit_open).",
+    ["reason"],
+)
+SMTP_LATENCY = Histogram(
+    "deals_smtp_send_duration_seconds", "SMTP sends by outcome (ok / error).",
+    ["outcome"], buckets=LATENCY_BUCKETS,
+)
+SMTP_FAILURES = Counter("deals_smtp_failures_total", "Emails that could not be sent over SMTP.")
+
+
+def record_deal_events(directions=(), transitions=()):
+    """
+    Count ingested email `directions` and deal status `transitions`
+    ((from, to) pairs; from is None for a new deal) once the current
+    transaction commits, so rolled-back writes aren't counted.
+    """
+    directions, transitions = Tally(directions), Tally(transitions)
+    if not directions and not transitions:
+        return
+
+    def record():
+        for direction, count in directions.items():
+            EMAILS_INGESTED.labels(direction).inc(count)
+        for (old, new), count in transitions.items():
+            STATUS_TRANSITIONS.labels(old or "none", new).inc(count)
+
+    transaction.on_commit(record)
+
+
+class PrometheusMiddleware:
+    """Request count and latency per URL route (the pattern, not the raw path). Put it first in MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "unmatched"
+        HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        HTTP_LATENCY.labels(route, request.method).observe(elapsed)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus text exposition of every metric in this process, or all workers in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0006_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['created_at', 'id'], name='deal_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='deal_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(fields=['deal', 'created_at'], name='email_deal_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(fields=['direction', 'created_at', 'id'], name='email_direction_created_idx'),
+        ),
+    ]
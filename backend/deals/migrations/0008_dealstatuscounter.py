@@ -0,0 +1,115 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:09
+
+from django.db import migrations, models
+
+
+UPSERT_NEW = (
+    'INSERT INTO deals_dealstatuscounter (status, "count") VALUES (NEW.status, 1) '
+    'ON CONFLICT (status) DO UPDATE SET "count" = deals_dealstatuscounter."count" + 1;'
+)
+DECREMENT_OLD = (
+    'UPDATE deals_dealstatuscounter SET "count" = "count" - 1 WHERE status = OLD.status;'
+)
+
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER deal_status_counter_insert AFTER INSERT ON deals_deal
+    BEGIN
+        {UPSERT_NEW}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER deal_status_counter_update AFTER UPDATE OF status ON deals_deal
+    WHEN OLD.status <> NEW.status
+    BEGIN
+        {DECREMENT_OLD}
+        {UPSERT_NEW}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER deal_status_counter_delete AFTER DELETE ON deals_deal
+    BEGIN
+        {DECREMENT_OLD}
+    END;
+    """,
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS deal_status_counter_insert;",
+    "DROP TRIGGER IF EXISTS deal_status_counter_update;",
+    "DROP TRIGGER IF EXISTS deal_status_counter_delete;",
+]
+
+POSTGRESQL_TRIGGERS = [
+    f"""
+    CREATE FUNCTION deal_status_counter() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {DECREMENT_OLD}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {UPSERT_NEW}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER deal_status_counter_insert_delete AFTER INSERT OR DELETE ON deals_deal
+    FOR EACH ROW EXECUTE FUNCTION deal_status_counter();
+    """,
+    """
+    CREATE TRIGGER deal_status_counter_update AFTER UPDATE OF status ON deals_deal
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status) EXECUTE FUNCTION deal_status_counter();
+    """,
+]
+POSTGRESQL_DROP = [
+    "DROP TRIGGER IF EXISTS deal_status_counter_insert_delete ON deals_deal;",
+    "DROP TRIGGER IF EXISTS deal_status_counter_update ON deals_deal;",
+    "DROP FUNCTION IF EXISTS deal_status_counter();",
+]
+
+SEED = (
+    'INSERT INTO deals_dealstatuscounter (status, "count") '
+    'SELECT status, COUNT(*) FROM deals_deal GROUP BY status;'
+)
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_TRIGGERS + [SEED])
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_TRIGGERS + [SEED])
+    # Other databases get no triggers: deal_status_totals() counts the deal
+    # table instead (see TRIGGER_VENDORS)
+
+
+def drop_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_DROP)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0007_deal_and_email_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DealStatusCounter',
+            fields=[
+                ('status', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
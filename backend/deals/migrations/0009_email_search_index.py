@@ -0,0 +1,99 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:10
+
+from django.db import migrations
+
+
+# SQLite: an external-content FTS5 table over deals_emailmessage (the index
+# only; the text itself is read from the email table), kept in sync by
+# triggers. Porter stemming, so "collaborating" matches "collaboration".
+COLUMNS = "subject, body, from_email, to_email"
+NEW_VALUES = "NEW.id, NEW.subject, NEW.body, NEW.from_email, NEW.to_email"
+OLD_VALUES = "'delete', OLD.id, OLD.subject, OLD.body, OLD.from_email, OLD.to_email"
+
+SQLITE_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE deals_email_fts USING fts5(
+        {COLUMNS},
+        content='deals_emailmessage', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    );
+    """,
+    f"""
+    CREATE TRIGGER email_fts_insert AFTER INSERT ON deals_emailmessage
+    BEGIN
+        INSERT INTO deals_email_fts (rowid, {COLUMNS}) VALUES ({NEW_VALUES});
+    END;
+    """,
+    f"""
+    CREATE TRIGGER email_fts_update AFTER UPDATE OF {COLUMNS} ON deals_emailmessage
+    BEGIN
+        INSERT INTO deals_email_fts (deals_email_fts, rowid, {COLUMNS}) VALUES ({OLD_VALUES});
+        INSERT INTO deals_email_fts (rowid, {COLUMNS}) VALUES ({NEW_VALUES});
+    END;
+    """,
+    f"""
+    CREATE TRIGGER email_fts_delete AFTER DELETE ON deals_emailmessage
+    BEGIN
+        INSERT INTO deals_email_fts (deals_email_fts, rowid, {COLUMNS}) VALUES ({OLD_VALUES});
+    END;
+    """,
+    # Index the emails that already exist
+    "INSERT INTO deals_email_fts (deals_email_fts) VALUES ('rebuild');",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS email_fts_insert;",
+    "DROP TRIGGER IF EXISTS email_fts_update;",
+    "DROP TRIGGER IF EXISTS email_fts_delete;",
+    "DROP TABLE IF EXISTS deals_email_fts;",
+]
+
+# PostgreSQL: a generated tsvector column (subject weighted above body, body
+# above addresses) with a GIN index. The database recomputes it on every
+# insert and update. Addresses are split into words like FTS5 does.
+POSTGRESQL_CREATE = [
+    """
+    ALTER TABLE deals_emailmessage ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B') ||
+        setweight(to_tsvector('simple', translate(from_email || ' ' || to_email, '@.-_+', '     ')), 'C')
+    ) STORED;
+    """,
+    "CREATE INDEX email_search_idx ON deals_emailmessage USING GIN (search_vector);",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS email_search_idx;",
+    "ALTER TABLE deals_emailmessage DROP COLUMN IF EXISTS search_vector;",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_CREATE)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_CREATE)
+    # Other databases get no index: deals.search falls back to substring matches
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_DROP)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0008_dealstatuscounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0009_email_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(fields=['created_at', 'id'], name='email_created_idx'),
+        ),
+    ]
@@ -0,0 +1,178 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:50
+
+import importlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+search_0009 = importlib.import_module("deals.migrations.0009_email_search_index")
+
+# SQLite: triggers can't read compressed bodies, so the FTS5 table becomes
+# contentless, one row per email, written by the app. Plain SQL triggers
+# queue every inserted, changed or deleted email in deals_email_fts_pending,
+# with the values the index holds for it (a contentless row is removed by
+# passing them back), and the app applies the queue
+# (deals.models.sync_search_index). The index is filled here while every
+# body is still inline.
+COLUMNS = search_0009.COLUMNS
+OLD_VALUES = "OLD.id, 1, OLD.subject, OLD.body, OLD.from_email, OLD.to_email, OLD.body_blob_id"
+
+SQLITE_CREATE = search_0009.SQLITE_DROP + [
+    f"""
+    CREATE VIRTUAL TABLE deals_email_fts USING fts5(
+        {COLUMNS},
+        content='', tokenize='porter unicode61 remove_diacritics 2'
+    );
+    """,
+    # `indexed` is 0 for new emails, which have nothing in the index yet
+    """
+    CREATE TABLE deals_email_fts_pending (
+        id INTEGER PRIMARY KEY,
+        email_id INTEGER NOT NULL,
+        indexed INTEGER NOT NULL,
+        subject TEXT, body TEXT, from_email TEXT, to_email TEXT, body_blob_id INTEGER
+    );
+    """,
+    """
+    CREATE TRIGGER email_fts_queue_insert AFTER INSERT ON deals_emailmessage
+    BEGIN
+        INSERT INTO deals_email_fts_pending (email_id, indexed) VALUES (NEW.id, 0);
+    END;
+    """,
+    f"""
+    CREATE TRIGGER email_fts_queue_update AFTER UPDATE OF {COLUMNS}, body_blob_id ON deals_emailmessage
+    BEGIN
+        INSERT INTO deals_email_fts_pending (email_id, indexed, {COLUMNS}, body_blob_id)
+        VALUES ({OLD_VALUES});
+    END;
+    """,
+    f"""
+    CREATE TRIGGER email_fts_queue_delete AFTER DELETE ON deals_emailmessage
+    BEGIN
+        INSERT INTO deals_email_fts_pending (email_id, indexed, {COLUMNS}, body_blob_id)
+        VALUES ({OLD_VALUES});
+    END;
+    """,
+    f"INSERT INTO deals_email_fts (rowid, {COLUMNS}) SELECT id, {COLUMNS} FROM deals_emailmessage;",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS email_fts_queue_insert;",
+    "DROP TRIGGER IF EXISTS email_fts_queue_update;",
+    "DROP TRIGGER IF EXISTS email_fts_queue_delete;",
+    "DROP TABLE IF EXISTS deals_email_fts_pending;",
+    "DROP TABLE IF EXISTS deals_email_fts;",
+]
+
+# PostgreSQL: the generated column can't follow the body into another table,
+# so a trigger builds the vector, taking the body part from
+# EmailBody.search_vector (set from the plain text when the body is stored).
+POSTGRESQL_CREATE = [
+    "ALTER TABLE deals_emailbody ADD COLUMN search_vector tsvector;",
+    "ALTER TABLE deals_emailmessage DROP COLUMN search_vector;",
+    "ALTER TABLE deals_emailmessage ADD COLUMN search_vector tsvector;",
+    """
+    CREATE FUNCTION email_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.subject, '')), 'A') ||
+            setweight(coalesce(
+                (SELECT b.search_vector FROM deals_emailbody b WHERE b.id = NEW.body_blob_id),
+                to_tsvector('english', coalesce(NEW.body, ''))
+            ), 'B') ||
+            setweight(to_tsvector('simple', translate(NEW.from_email || ' ' || NEW.to_email, '@.-_+', '     ')), 'C');
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER email_search_vector BEFORE INSERT OR UPDATE ON deals_emailmessage
+    FOR EACH ROW EXECUTE FUNCTION email_search_vector();
+    """,
+    # Fill the new column through the trigger
+    "UPDATE deals_emailmessage SET search_vector = NULL;",
+    "CREATE INDEX email_search_idx ON deals_emailmessage USING GIN (search_vector);",
+]
+POSTGRESQL_DROP = [
+    "DROP TRIGGER IF EXISTS email_search_vector ON deals_emailmessage;",
+    "DROP FUNCTION IF EXISTS email_search_vector();",
+    "ALTER TABLE deals_emailmessage DROP COLUMN IF EXISTS search_vector;",
+    "ALTER TABLE deals_emailbody DROP COLUMN IF EXISTS search_vector;",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def rebuild_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_CREATE)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_CREATE)
+    # Other databases have no index to rebuild (see deals.search)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_DROP)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_DROP)
+
+
+def inline_bodies(apps, schema_editor):
+    # Reverse only: put compressed bodies back in the email table
+    EmailMessage = apps.get_model("deals", "EmailMessage")
+    messages = EmailMessage.objects.filter(body_blob__isnull=False).select_related("body_blob")
+    for message in messages.iterator(chunk_size=1000):
+        message.inline_body = zlib.decompress(message.body_blob.data).decode("utf-8")
+        message.body_blob = None
+        message.save(update_fields=["inline_body", "body_blob"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0010_email_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailBody',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+            ],
+        ),
+        # Same column, new attribute name: `body` is now a property
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='emailmessage',
+                    old_name='body',
+                    new_name='inline_body',
+                ),
+                migrations.AlterField(
+                    model_name='emailmessage',
+                    name='inline_body',
+                    field=models.TextField(blank=True, db_column='body', default=''),
+                ),
+            ],
+        ),
+        # Reverse only, after body_blob is removed: SQLite removes the column
+        # by copying the table, which drops any triggers on it
+        migrations.RunPython(migrations.RunPython.noop, search_0009.create_index),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='body_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='deals.emailbody'),
+        ),
+        migrations.RunPython(rebuild_search_index, drop_search_index),
+        migrations.RunPython(migrations.RunPython.noop, inline_bodies),
+    ]
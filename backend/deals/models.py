@@ -1,4 +1,10 @@
-from django.db import models
+import hashlib
+import zlib
+from itertools import islice
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 
 class Client(models.Model):
@@ -33,10 +39,241 @@ class Deal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Dashboard / deals API pages: newest first, keyset on (created_at, id)
+            models.Index(fields=["created_at", "id"], name="deal_created_idx"),
+            # Status-filtered pages and the per-status counts (covering index)
+            models.Index(fields=["status", "created_at", "id"], name="deal_status_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.client.email} - {self.subject}"
 
 
+# Database vendors the raw-SQL migrations create triggers for. On any other
+# backend the tables still exist but nothing maintains them, and the code
+# falls back to plain ORM queries.
+TRIGGER_VENDORS = ("sqlite", "postgresql")
+
+
+class DealStatusCounter(models.Model):
+    """
+    Number of deals per status. Kept in step by database triggers on the deal
+    table (migration 0008), so creates, status changes, deletes, bulk updates
+    and admin edits are all counted in the same transaction.
+    Run `python manage.py recount` to repair drift. Unused on databases
+    outside TRIGGER_VENDORS.
+    """
+    status = models.CharField(max_length=30, primary_key=True)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.status}: {self.count}"
+
+
+def body_digest(text):
+    """Content address of an email body: SHA-256 of its UTF-8 text, hex."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmailBodyManager(models.Manager):
+    def store_many(self, texts, batch_size=1000):
+        """
+        Store each distinct text once. Returns {digest: EmailBody}; texts that
+        are already stored (by this or an earlier call) reuse their row.
+        """
+        by_digest = {body_digest(text): text for text in texts}
+        stored = {}
+        digests = list(by_digest)
+        for start in range(0, len(digests), batch_size):
+            chunk = digests[start:start + batch_size]
+            stored.update((body.digest, body) for body in self.filter(digest__in=chunk))
+
+        missing = [digest for digest in digests if digest not in stored]
+        if missing:
+            self.bulk_create(
+                [EmailBody.compress(by_digest[digest], digest) for digest in missing],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            for start in range(0, len(missing), batch_size):
+                chunk = missing[start:start + batch_size]
+                stored.update((body.digest, body) for body in self.filter(digest__in=chunk))
+            if connection.vendor == "postgresql":
+                # Body half of the email search vector (migration 0011); the
+                # database can't read the compressed text itself
+                with connection.cursor() as cursor:
+                    cursor.executemany(
+                        "UPDATE deals_emailbody SET search_vector = to_tsvector('english', %s) WHERE digest = %s",
+                        [(by_digest[digest], digest) for digest in missing],
+                    )
+        # Saves decompressing what the caller is about to index
+        for digest, body in stored.items():
+            body.__dict__["text"] = by_digest[digest]
+        return stored
+
+
+class EmailBody(models.Model):
+    """
+    An email body, zlib-compressed and stored once per distinct text (keyed
+    by its SHA-256). Messages point at it, so quoted reply chains and
+    template replies repeated across threads take the space of one copy,
+    and the email table itself stays small. Run `python manage.py
+    compress_bodies` to move bodies stored inline by older versions.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()  # uncompressed UTF-8 bytes
+
+    objects = EmailBodyManager()
+
+    @classmethod
+    def compress(cls, text, digest=None):
+        raw = text.encode("utf-8")
+        return cls(digest=digest or body_digest(text), data=zlib.compress(raw, 6), size=len(raw))
+
+    @cached_property
+    def text(self):
+        return zlib.decompress(self.data).decode("utf-8")
+
+    @staticmethod
+    def text_prefix(data, max_bytes):
+        """
+        The start of a body's text (at most `max_bytes` of UTF-8) from its
+        compressed data, or from just the leading bytes of it.
+        """
+        raw = zlib.decompressobj().decompress(bytes(data), max_bytes)
+        # A prefix can end inside a multi-byte character
+        return raw.decode("utf-8", "ignore")
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.size} bytes)"
+
+
+def attach_bodies(messages):
+    """
+    Store the bodies assigned to unsaved or edited `messages` (one
+    EmailBody per distinct text) and point the messages at them. Called by
+    EmailMessage.save(); call it yourself before bulk_create.
+
+    Databases outside TRIGGER_VENDORS keep bodies inline: their search is a
+    substring match, which can't read compressed text.
+    """
+    pending = [message for message in messages if message._pending_body is not None]
+    if not pending:
+        return
+    if connection.vendor not in TRIGGER_VENDORS:
+        for message in pending:
+            message.body_blob = None
+            message.inline_body = message._pending_body
+            message._pending_body = None
+        return
+    stored = EmailBody.objects.store_many([message._pending_body for message in pending])
+    for message in pending:
+        message.body_blob = stored[body_digest(message._pending_body)]
+        message.inline_body = ""
+        message._pending_body = None
+
+
+def _search_values(message):
+    return (message.pk, message.subject, message.body, message.from_email, message.to_email)
+
+
+def _chunked(values, size=500):
+    values = list(values)
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+
+def sync_search_index(messages=()):
+    """
+    Apply the email changes queued by the SQLite search triggers (migration
+    0011) to the index. `messages` are instances just saved, whose text is
+    already at hand. Called by EmailMessage.save() and before every search;
+    call it yourself after bulk_create. PostgreSQL's triggers index emails
+    themselves, and other databases have no index.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        if not messages:
+            # Nothing written by the caller: check before taking the write lock
+            cursor.execute("SELECT MAX(id) FROM deals_email_fts_pending")
+            if cursor.fetchone()[0] is None:
+                return
+        with transaction.atomic(savepoint=False):
+            cursor.execute(
+                "DELETE FROM deals_email_fts_pending "
+                "RETURNING id, email_id, indexed, subject, body, from_email, to_email, body_blob_id"
+            )
+            # An email's first queued change has the values the index holds
+            queued = {}
+            for row in sorted(cursor.fetchall()):
+                queued.setdefault(row[1], row)
+            if not queued:
+                return
+
+            indexed = [row for row in queued.values() if row[2]]
+            texts = {}
+            for chunk in _chunked({row[7] for row in indexed if row[7] is not None}):
+                texts.update(
+                    (body_id, zlib.decompress(data).decode("utf-8"))
+                    for body_id, data in EmailBody.objects.filter(pk__in=chunk).values_list("id", "data")
+                )
+            # A body pruned before its change was synced can't be passed back;
+            # rebuild_search_index clears what it leaves behind
+            deleted = [
+                (email_id, subject, body if body_id is None else texts[body_id], from_email, to_email)
+                for _, email_id, _, subject, body, from_email, to_email, body_id in indexed
+                if body_id is None or body_id in texts
+            ]
+            if deleted:
+                cursor.executemany(
+                    "INSERT INTO deals_email_fts (deals_email_fts, rowid, subject, body, from_email, to_email) "
+                    "VALUES ('delete', %s, %s, %s, %s, %s)",
+                    deleted,
+                )
+
+            known = {message.pk: message for message in messages}
+            current = [known[email_id] for email_id in queued if email_id in known]
+            for chunk in _chunked(email_id for email_id in queued if email_id not in known):
+                current.extend(
+                    EmailMessage.objects.filter(pk__in=chunk).select_related("body_blob")
+                    .only("subject", "inline_body", "body_blob__data", "from_email", "to_email")
+                )
+            cursor.executemany(
+                "INSERT INTO deals_email_fts (rowid, subject, body, from_email, to_email) VALUES (%s, %s, %s, %s, %s)",
+                [_search_values(message) for message in current],
+            )
+
+
+def rebuild_search_index(batch_size=1000):
+    """
+    Index every email afresh on SQLite, discarding the queue. Returns the
+    number of emails indexed, or None where the database keeps its own
+    index.
+    """
+    if connection.vendor != "sqlite":
+        return None
+    emails = (
+        EmailMessage.objects.select_related("body_blob")
+        .only("subject", "inline_body", "body_blob__data", "from_email", "to_email")
+        .order_by("id").iterator(chunk_size=batch_size)
+    )
+    indexed = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("INSERT INTO deals_email_fts (deals_email_fts) VALUES ('delete-all')")
+        cursor.execute("DELETE FROM deals_email_fts_pending")
+        while batch := list(islice(emails, batch_size)):
+            cursor.executemany(
+                "INSERT INTO deals_email_fts (rowid, subject, body, from_email, to_email) VALUES (%s, %s, %s, %s, %s)",
+                [_search_values(message) for message in batch],
+            )
+            indexed += len(batch)
+        cursor.execute("INSERT INTO deals_email_fts (deals_email_fts) VALUES ('optimize')")
+    return indexed
+
+
 class EmailMessage(models.Model):
     DIRECTION_CHOICES = [
         ("INCOMING", "Incoming"),
@@ -50,12 +287,108 @@ class EmailMessage(models.Model):
     )
     direction = models.CharField(max_length=10, choices=DIRECTION_CHOICES)
     subject = models.CharField(max_length=255, default='')
-    body = models.TextField()
+    # The text lives in EmailBody; read and assign it through `body`. Rows
+    # written before bodies were compressed keep it inline until
+    # `compress_bodies` moves it.
+    body_blob = models.ForeignKey(EmailBody, null=True, blank=True, on_delete=models.PROTECT, related_name="+")
+    inline_body = models.TextField(db_column="body", blank=True, default="")
 
     from_email = models.EmailField()
     to_email = models.EmailField()
 
+    # Identifies the email across ingest retries (see services.email_dedup_key);
+    # NULL for emails saved before deduplication existed
+    dedup_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Partial, so SQLite can add it without copying the table
+            models.UniqueConstraint(
+                fields=["dedup_key"], condition=models.Q(dedup_key__isnull=False), name="email_dedup_key_uniq",
+            ),
+        ]
+        indexes = [
+            # A deal's thread in order (deal detail)
+            models.Index(fields=["deal", "created_at"], name="email_deal_created_idx"),
+            # Admin changelist filtered by direction, newest first
+            models.Index(fields=["direction", "created_at", "id"], name="email_direction_created_idx"),
+            # Unfiltered admin changelist, newest first
+            models.Index(fields=["created_at", "id"], name="email_created_idx"),
+        ]
+
+    _pending_body = None
+
     def __str__(self):
         return f"{self.direction} - Deal {self.deal.id}"
+
+    @property
+    def body(self):
+        """
+        The full text. Only decompressed when read; select_related("body_blob")
+        when reading many messages to avoid one query each.
+        """
+        if self._pending_body is not None:
+            return self._pending_body
+        if self.body_blob_id is None:
+            return self.inline_body
+        return self.body_blob.text
+
+    @body.setter
+    def body(self, text):
+        if text is None:
+            raise ValueError("EmailMessage.body cannot be None.")
+        self._pending_body = text
+
+    def save(self, *args, **kwargs):
+        if self._pending_body is not None:
+            attach_bodies([self])
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "body_blob", "inline_body"}
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            sync_search_index([self])
+
+
+class OutboxMessage(models.Model):
+    """
+    Side effect (n8n webhook call or client email) recorded in the same
+    transaction as the deal change that caused it, and delivered later by
+    the `process_outbox` management command.
+    """
+    KIND_CHOICES = [
+        ("WEBHOOK", "n8n Webhook"),
+        ("EMAIL", "Email"),
+    ]
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("SENT", "Sent"),
+        ("DEAD", "Dead Letter"),
+    ]
+
+    deal = models.ForeignKey(
+        Deal,
+        related_name="outbox_messages",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
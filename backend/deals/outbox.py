@@ -0,0 +1,260 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.utils import timezone
+
+from .mail import MailDispatcher
+from .models import OutboxMessage
+from .webhooks import CircuitOpenError, get_webhook_client
+
+
+def _sanitize_header(value):
+    """Sanitize header values by removing newlines and collapsing whitespace."""
+    if value is None:
+        return ""
+    return " ".join(str(value).splitlines()).strip()
+
+
+#  ENQUEUE (call inside the transaction that changes the deal)
+def enqueue_webhook(deal, action):
+    """Queue the n8n deal-action webhook, if N8N_WEBHOOK_URL is configured."""
+    url = getattr(settings, "N8N_WEBHOOK_URL", None)
+    if not url:
+        return None
+    return OutboxMessage.objects.create(deal=deal, kind="WEBHOOK", payload={
+        "url": url,
+        "body": {
+            "action": action,
+            "thread_id": deal.thread_id,
+            "deal_id": deal.id,
+            "ai_reply": deal.ai_generated_reply,
+            "from_email": deal.client.email
+        }
+    })
+
+
+def enqueue_email(deal, subject, plain_body, html_body):
+    """Queue an email (plain text + HTML alternative) to the deal's client."""
+    return OutboxMessage.objects.create(deal=deal, kind="EMAIL", payload={
+        "subject": subject,
+        "body": plain_body,
+        "html_body": html_body,
+        "to": [deal.client.email],
+    })
+
+
+def enqueue_acceptance_email(deal):
+    sanitized_subject = _sanitize_header(deal.subject)
+    subject = f"Congratulations — your deal '{sanitized_subject}' is complete"
+    plain_body = (
+        f"Hello {deal.client.brand_name or deal.client.email},\n\n"
+        f"Congratulations! Your deal titled '{deal.subject}' has been completed successfully.\n\n"
+        "Thank you for working with us.\n\n"
+        "Best regards,\n"
+        "The Team"
+    )
+    html_body = (
+        f"<p>Hello {deal.client.brand_name or deal.client.email},</p>"
+        f"<p>Congratulations! Your deal titled <strong>{deal.subject}</strong> has been completed successfully.</p>"
+        "<p>Thank you for working with us.</p>"
+        "<p>Best regards,<br/>The Team</p>"
+    )
+    return enqueue_email(deal, subject, plain_body, html_body)
+
+
+def enqueue_rejection_email(deal):
+    sanitized_subject = _sanitize_header(deal.subject)
+    subject = f"Update on your deal '{sanitized_subject}'"
+    plain_body = (
+        f"Hello {deal.client.brand_name or deal.client.email},\n\n"
+        "Thank you for reaching out and for your interest in collaborating with us. "
+        "After careful consideration, we regret to inform you that we are unable to proceed with this collaboration at this time.\n\n"
+        "We appreciate your understanding and hope we can work together on future opportunities.\n\n"
+        "Best regards,\n"
+        "The Team"
+    )
+    html_body = (
+        f"<p>Hello {deal.client.brand_name or deal.client.email},</p>"
+        "<p>Thank you for reaching out and for your interest in collaborating with us. "
+        "After careful consideration, we regret to inform you that we are unable to proceed with this collaboration at this time.</p>"
+        "<p>We appreciate your understanding and hope we can work together on future opportunities.</p>"
+        "<p>Best regards,<br/>The Team</p>"
+    )
+    return enqueue_email(deal, subject, plain_body, html_body)
+
+
+#  DELIVERY (process_outbox worker)
+def send_webhook(payload):
+    get_webhook_client().post(payload["url"], payload["body"])
+
+
+def build_email(payload):
+    msg = EmailMultiAlternatives(
+        subject=payload["subject"],
+        body=payload["body"],
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=payload["to"]
+    )
+    msg.attach_alternative(payload["html_body"], "text/html")
+    return msg
+
+
+def check_email_credentials():
+    if not settings.EMAIL_HOST_USER or not settings.EMAIL_HOST_PASSWORD:
+        raise Exception("Email credentials not configured. Set EMAIL_HOST_USER and EMAIL_HOST_PASSWORD environment variables.")
+
+
+# Senders for non-email kinds; EMAIL goes through MailDispatcher in batches
+SENDERS = {
+    "WEBHOOK": send_webhook,
+}
+
+
+def backoff_delay(attempts):
+    """Exponential backoff after `attempts` failed deliveries, capped at OUTBOX_BACKOFF_MAX_SECONDS."""
+    base = getattr(settings, "OUTBOX_BACKOFF_SECONDS", 30)
+    cap = getattr(settings, "OUTBOX_BACKOFF_MAX_SECONDS", 3600)
+    return timedelta(seconds=min(cap, base * 2 ** max(0, attempts - 1)))
+
+
+def mark_sent(message, now=None):
+    message.status = "SENT"
+    message.sent_at = now or timezone.now()
+    message.last_error = ""
+    message.save(update_fields=["status", "sent_at", "last_error"])
+
+
+def mark_failed(message, error, now=None):
+    """Record a failed attempt; schedule a retry or move the message to the dead letters."""
+    now = now or timezone.now()
+    message.attempts += 1
+    message.last_error = str(error)
+    if message.attempts >= getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8):
+        message.status = "DEAD"
+    else:
+        message.next_attempt_at = now + backoff_delay(message.attempts)
+    message.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def defer(message, seconds):
+    """Push a message back without counting an attempt (e.g. n8n circuit open)."""
+    message.next_attempt_at = timezone.now() + timedelta(seconds=max(1, seconds))
+    message.save(update_fields=["next_attempt_at"])
+
+
+def claim_due(batch_size=100, kinds=None):
+    """
+    Claim up to `batch_size` pending messages whose next attempt is due.
+
+    Claiming pushes next_attempt_at forward by OUTBOX_LEASE_SECONDS with one
+    conditional UPDATE, so concurrent workers don't pick the same rows and a
+    worker that dies mid-delivery only delays its batch until the lease
+    expires (process_due renews it before each delivery). Delivery happens outside any transaction, keeping the database
+    write lock free while we wait on SMTP or n8n.
+    """
+    now = timezone.now()
+    due = OutboxMessage.objects.filter(status="PENDING", next_attempt_at__lte=now)
+    if kinds:
+        due = due.filter(kind__in=kinds)
+    ids = list(due.order_by("next_attempt_at", "id").values_list("id", flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    lease_until = now + _lease()
+    OutboxMessage.objects.filter(
+        id__in=ids, status="PENDING", next_attempt_at__lte=now
+    ).update(next_attempt_at=lease_until)
+    return list(
+        OutboxMessage.objects.filter(id__in=ids, next_attempt_at=lease_until).order_by("id")
+    )
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, "OUTBOX_LEASE_SECONDS", 300))
+
+
+def renew_lease(messages):
+    """
+    Extend the lease on claimed `messages` right before delivering them, so
+    a batch of slow deliveries doesn't outlive the lease it was claimed
+    with. Returns the messages still held; one whose lease ran out may have
+    been claimed by another worker and must not be delivered twice.
+    """
+    lease_until = timezone.now() + _lease()
+    held = []
+    with transaction.atomic():
+        for message in messages:
+            renewed = OutboxMessage.objects.filter(
+                id=message.id, status="PENDING", next_attempt_at=message.next_attempt_at
+            ).update(next_attempt_at=lease_until)
+            if renewed:
+                message.next_attempt_at = lease_until
+                held.append(message)
+    return held
+
+
+def _record(message, error):
+    """Store one delivery outcome. Returns True if the message was sent."""
+    if error is None:
+        mark_sent(message)
+        return True
+    if isinstance(error, CircuitOpenError):
+        defer(message, error.retry_in)
+    else:
+        mark_failed(message, error)
+    return False
+
+
+def _deliver_emails(batch, dispatcher):
+    """Send a batch of EMAIL messages over the dispatcher's shared connection."""
+    try:
+        check_email_credentials()
+        emails = [build_email(message.payload) for message in batch]
+    except Exception as e:
+        return [e] * len(batch)
+    return dispatcher.send_messages(emails)
+
+
+def process_due(batch_size=100, dispatcher=None):
+    """
+    Deliver one batch of due messages. Emails go out over one pooled SMTP
+    connection (pass a long-lived MailDispatcher to reuse it across batches).
+    Each delivery renews its lease first and is recorded as soon as it's
+    done. Returns (sent, failed).
+    """
+    batch = claim_due(batch_size)
+    emails = [message for message in batch if message.kind == "EMAIL"]
+    others = [message for message in batch if message.kind != "EMAIL"]
+
+    sent = failed = 0
+    for message in others:
+        if not renew_lease([message]):
+            continue
+        try:
+            SENDERS[message.kind](message.payload)
+        except Exception as e:
+            error = e
+        else:
+            error = None
+        if _record(message, error):
+            sent += 1
+        else:
+            failed += 1
+
+    emails = renew_lease(emails)
+    if emails:
+        own_dispatcher = dispatcher is None
+        dispatcher = dispatcher or MailDispatcher()
+        try:
+            errors = _deliver_emails(emails, dispatcher)
+        finally:
+            if own_dispatcher:
+                dispatcher.close()
+        for message, error in zip(emails, errors):
+            if _record(message, error):
+                sent += 1
+            else:
+                failed += 1
+    return sent, failed
@@ -0,0 +1,216 @@
+"""
+Full-text search over email subjects, bodies and addresses.
+
+The index is created by migrations 0009 and 0011. On PostgreSQL it is a
+trigger-maintained tsvector column with a GIN index. On SQLite it is a
+contentless FTS5 table, one row per email: triggers queue every insert,
+update and delete (bulk ones, cascades and other connections included) and
+the app indexes the queued emails' text (models.sync_search_index), since
+the database can't read compressed bodies itself. Other databases have no
+index and fall back to unranked substring matches.
+
+Queries are reduced to words: every word must match (stemmed) and the last
+one also matches as a prefix, so "collab" finds "collaboration".
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Max, Q
+from django.db.models.expressions import RawSQL
+
+from .models import TRIGGER_VENDORS, Deal, EmailMessage, sync_search_index
+
+
+MAX_TERMS = 16
+MAX_RESULTS = 100
+# Ranked searches score only this many of the newest matching emails, so a
+# common word costs the same however many emails contain it
+MAX_CANDIDATES = 1000
+SNIPPET_CHARS = 160
+
+WORD_RE = re.compile(r"\w+")
+
+# Emails matching a match expression, as (id, score) rows. SQLite's bm25 is
+# "lower is better", so it is negated to give one "higher is better" score.
+SQLITE_EMAIL_MATCHES = (
+    "SELECT rowid AS id, -bm25(deals_email_fts, 2.0, 1.0, 0.5, 0.5) AS score FROM deals_email_fts "
+    "WHERE deals_email_fts MATCH %s"
+)
+POSTGRESQL_EMAIL_MATCHES = (
+    "SELECT id, ts_rank(search_vector, to_tsquery('english', %s)) AS score FROM deals_emailmessage "
+    "WHERE search_vector @@ to_tsquery('english', %s)"
+)
+
+
+def search_terms(query):
+    """The lower-cased words of a user query (at most MAX_TERMS)."""
+    return WORD_RE.findall((query or "").lower())[:MAX_TERMS]
+
+
+def _match_expression(terms, newest=None):
+    """
+    (sql, params) scoring matching emails as (id, score) rows, or None
+    without terms. With `newest`, only that many of the newest matches: the
+    index stops reading there, and only those are scored.
+    """
+    if not terms:
+        return None
+    vendor = connection.vendor
+    if vendor == "sqlite":
+        # Quoted words are literal strings to FTS5, so operators in the input do nothing
+        words = [f'"{term}"' for term in terms]
+        words[-1] += "*"
+        sql, params = SQLITE_EMAIL_MATCHES, [" ".join(words)]
+    elif vendor == "postgresql":
+        tsquery = " & ".join(terms) + ":*"
+        sql, params = POSTGRESQL_EMAIL_MATCHES, [tsquery, tsquery]
+    else:
+        raise NotImplementedError(f"No email search index for {vendor}")
+    if newest is None:
+        return sql, params
+    return f"{sql} ORDER BY id DESC LIMIT %s", params + [newest]
+
+
+def _containing(terms):
+    """
+    Emails with every term somewhere in their subject, body or addresses
+    (case-insensitive substrings): the search on databases without an index,
+    where bodies are kept inline (models.attach_bodies).
+    """
+    queryset = EmailMessage.objects.all()
+    for term in terms:
+        queryset = queryset.filter(
+            Q(subject__icontains=term) | Q(inline_body__icontains=term)
+            | Q(from_email__icontains=term) | Q(to_email__icontains=term)
+        )
+    return queryset
+
+
+def matching_email_ids(query):
+    """
+    Subquery of the ids of every email matching `query`, for
+    `.filter(pk__in=...)`; None if the query has no words.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return None
+    if connection.vendor not in TRIGGER_VENDORS:
+        return _containing(terms).values("id")
+    sync_search_index()
+    sql, params = _match_expression(terms)
+    return RawSQL(f"SELECT id FROM ({sql}) AS matches", params)
+
+
+def make_snippet(text, terms, length=SNIPPET_CHARS):
+    """Plain-text excerpt of `text` around the first word starting with one of `terms`."""
+    text = " ".join((text or "").split())
+    start = 0
+    if terms:
+        found = re.search(r"\b(?:%s)" % "|".join(re.escape(term) for term in terms), text, re.IGNORECASE)
+        if found and found.start() > length // 4:
+            # Start on a word boundary a little before the match
+            start = text.rfind(" ", 0, found.start() - length // 4) + 1
+    snippet = text[start:start + length]
+    if start > 0:
+        snippet = "…" + snippet
+    if start + length < len(text):
+        snippet += "…"
+    return snippet
+
+
+def search_emails(query, limit=20):
+    """
+    The `limit` best-matching emails, best first, with their deal and client
+    loaded. Each email gets `score` and `snippet` attributes.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(int(limit), MAX_RESULTS))
+    if connection.vendor not in TRIGGER_VENDORS:
+        # Unranked: the newest matches, all scored 0
+        emails = _containing(terms).select_related("deal__client", "body_blob").order_by("-created_at", "-id")
+        results = list(emails[:limit])
+        for email in results:
+            email.score = 0.0
+            email.snippet = make_snippet(email.body, terms)
+        return results
+
+    sync_search_index()
+    sql, params = _match_expression(terms, newest=MAX_CANDIDATES)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT id, score FROM ({sql}) AS matches ORDER BY score DESC LIMIT %s", params + [limit])
+        scores = dict(cursor.fetchall())
+
+    emails = EmailMessage.objects.select_related("deal__client", "body_blob").in_bulk(list(scores))
+    results = []
+    for email_id, score in scores.items():
+        email = emails.get(email_id)
+        if email is None:
+            continue
+        email.score = score
+        email.snippet = make_snippet(email.body, terms)
+        results.append(email)
+    return results
+
+
+def _ranked_deals(terms, limit):
+    """
+    ({deal_id: score}, {deal_id: (best_email_id, score)}) for the `limit`
+    deals whose emails best match `terms`, best first, from the index.
+    """
+    sql, params = _match_expression(terms, newest=MAX_CANDIDATES)
+    with connection.cursor() as cursor:
+        # Each deal's best email, numbered 1, from the one set of matches
+        cursor.execute(
+            "SELECT deal_id, id, score FROM ("
+            "SELECT e.deal_id, matches.id, matches.score, ROW_NUMBER() OVER ("
+            "PARTITION BY e.deal_id ORDER BY matches.score DESC, matches.id DESC) AS n "
+            f"FROM ({sql}) AS matches JOIN deals_emailmessage e ON e.id = matches.id"
+            ") AS ranked WHERE n = 1 ORDER BY score DESC LIMIT %s",
+            params + [limit],
+        )
+        rows = cursor.fetchall()
+    scores = {deal_id: score for deal_id, _, score in rows}
+    best = {deal_id: (email_id, score) for deal_id, email_id, score in rows}
+    return scores, best
+
+
+def search_deals(query, limit=50):
+    """
+    The `limit` deals whose emails best match `query`, best first (a deal
+    scores as its best email), with the client loaded. Each deal gets
+    `score` and `snippet` (from its best email) attributes.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(int(limit), MAX_RESULTS))
+    if connection.vendor not in TRIGGER_VENDORS:
+        # Unranked: deals with the newest matching email first, all scored 0
+        newest = list(
+            _containing(terms).order_by().values("deal_id")
+            .annotate(email_id=Max("id")).order_by("-email_id")[:limit]
+        )
+        scores = {row["deal_id"]: 0.0 for row in newest}
+        best = {row["deal_id"]: (row["email_id"], 0.0) for row in newest}
+    else:
+        sync_search_index()
+        scores, best = _ranked_deals(terms, limit)
+
+    deals = Deal.objects.select_related("client").in_bulk(list(scores))
+    bodies = {
+        email.id: email.body
+        for email in EmailMessage.objects.select_related("body_blob")
+        .filter(pk__in=[email_id for email_id, _ in best.values()])
+    }
+    results = []
+    for deal_id, score in scores.items():
+        deal = deals.get(deal_id)
+        if deal is None:
+            continue
+        deal.score = score
+        deal.snippet = make_snippet(bodies.get(best.get(deal_id, (None,))[0], ""), terms)
+        results.append(deal)
+    return results
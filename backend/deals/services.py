@@ -0,0 +1,602 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BinaryField, Count, F, Q
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from .models import (
+    TRIGGER_VENDORS, Deal, DealStatusCounter, EmailBody, EmailMessage, Client, attach_bodies, body_digest,
+    sync_search_index,
+)
+from .ai import get_pipeline
+from .metrics import EMAILS_DEDUPLICATED, record_deal_events
+from .thread_cache import invalidate_threads, known_threads
+
+
+REQUIRED_EMAIL_FIELDS = ['thread_id', 'subject', 'body', 'from_email', 'to_email', 'direction']
+VALID_DIRECTIONS = ['INCOMING', 'OUTGOING']
+
+# SQLite caps the number of bound parameters per statement, so set-based
+# lookups (`__in`) and bulk writes are issued in chunks of this size.
+QUERY_CHUNK_SIZE = 500
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Columns the dashboard rows and the deals listing API actually read
+DEAL_LIST_FIELDS = (
+    "id", "subject", "thread_id", "status", "created_at", "updated_at",
+    "client__email", "client__brand_name",
+)
+
+# Emails per page of a deal's thread (deal detail)
+THREAD_PAGE_SIZE = 20
+MAX_THREAD_PAGE_SIZE = 100
+# Characters of each body shown until its full text is asked for
+PREVIEW_CHARS = 400
+# Compressed bytes read per body for its preview: enough for PREVIEW_CHARS
+# characters of up to 4 UTF-8 bytes each, even if zlib saved nothing
+PREVIEW_BYTES = PREVIEW_CHARS * 4 + 64
+
+EMAIL_HEADER_FIELDS = ("id", "deal_id", "direction", "subject", "from_email", "to_email", "created_at", "body_blob")
+
+
+def validate_email_payload(data):
+    """
+    Validate one save_email payload.
+    Returns (cleaned, error): `cleaned` is a dict with normalised fields,
+    `error` is a message string (cleaned is None when error is set).
+    """
+    if not isinstance(data, dict):
+        return None, "Each item must be a JSON object."
+
+    missing_fields = [field for field in REQUIRED_EMAIL_FIELDS if not data.get(field)]
+    if missing_fields:
+        return None, f"Missing required fields: {', '.join(missing_fields)}"
+
+    direction = str(data.get("direction", "INCOMING")).upper()
+    if direction not in VALID_DIRECTIONS:
+        return None, "direction must be either 'INCOMING' or 'OUTGOING'"
+
+    return {
+        "thread_id": data.get("thread_id"),
+        "subject": data.get("subject"),
+        "body": data.get("body"),
+        "from_email": data.get("from_email"),
+        "to_email": data.get("to_email"),
+        "direction": direction,
+        "brand_name": data.get("brand_name", ""),
+        "ai_generated_reply": data.get("ai_generated_reply", ""),
+        "idempotency_key": str(data.get("idempotency_key") or data.get("message_id") or "").strip(),
+    }, None
+
+
+def email_dedup_key(email):
+    """
+    Key identifying a validated email across ingest retries: derived from
+    its idempotency key (or message-ID) when the sender gave one, otherwise
+    from its thread, direction, sender and body. SHA-256, hex.
+    """
+    if email["idempotency_key"]:
+        parts = ["key", email["idempotency_key"]]
+    else:
+        parts = ["content", email["thread_id"], email["direction"], email["from_email"], body_digest(email["body"])]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+def _saved_results(keys):
+    """{dedup_key: save_email result} for the keys of emails already saved."""
+    found = {}
+    for chunk in _chunks(keys):
+        rows = EmailMessage.objects.filter(dedup_key__in=chunk).values_list("dedup_key", "id", "deal_id", "deal__status")
+        for key, message_id, deal_id, deal_status in rows:
+            found[key] = {
+                "deal_id": deal_id,
+                "deal_created": False,
+                "email_message_id": message_id,
+                "deal_status": deal_status,
+                "duplicate": True,
+            }
+    return found
+
+
+def find_duplicate(email, key=None):
+    """
+    The result for the already-saved copy of a validated email (a retry),
+    or None if it is new. One lookup on the dedup_key index.
+    """
+    key = key or email_dedup_key(email)
+    duplicate = _saved_results([key]).get(key)
+    if duplicate is not None:
+        EMAILS_DEDUPLICATED.inc()
+    return duplicate
+
+
+def apply_email_to_deal(deal, email, now):
+    """
+    Apply one ingested email to an in-memory Deal and return the set of
+    changed field names. Nothing is written to the database here.
+
+    Status rules:
+    - OUTGOING (we replied with AI) → WAITING_FOR_CLIENT
+    - INCOMING while WAITING_FOR_CLIENT (client's 2nd reply) → PENDING_CREATOR
+    - INCOMING on a NEW deal keeps it NEW (we haven't replied yet)
+    """
+    changed = set()
+
+    if deal.subject != email["subject"]:
+        deal.subject = email["subject"]
+        changed.add("subject")
+
+    if email["ai_generated_reply"]:
+        deal.ai_generated_reply = email["ai_generated_reply"]
+        changed.add("ai_generated_reply")
+
+    if email["direction"] == "OUTGOING":
+        deal.status = "WAITING_FOR_CLIENT"
+        deal.our_reply_sent_at = now
+        changed.update(["status", "our_reply_sent_at"])
+    elif email["direction"] == "INCOMING" and deal.status == "WAITING_FOR_CLIENT":
+        deal.status = "PENDING_CREATOR"
+        deal.client_replied_at = now
+        changed.update(["status", "client_replied_at"])
+
+    if changed:
+        deal.updated_at = now
+        changed.add("updated_at")
+    return changed
+
+
+def ingest_email(email):
+    """
+    Persist one validated email (see validate_email_payload) in a single
+    transaction: the Client/Deal lookups, one EmailMessage INSERT and at most
+    one Deal UPDATE limited to the columns that actually changed.
+    A retry of an email already saved (same email_dedup_key) writes nothing
+    and gets the original email's result, with "duplicate": True.
+    Returns the save_email result fields.
+    """
+    key = email_dedup_key(email)
+    duplicate = find_duplicate(email, key)
+    if duplicate is not None:
+        return duplicate
+    try:
+        return _save_email(email, key)
+    except IntegrityError:
+        # A concurrent retry of the same email was saved first
+        duplicate = find_duplicate(email, key)
+        if duplicate is None:
+            raise
+        return duplicate
+
+
+def _save_email(email, key):
+    now = timezone.now()
+    with transaction.atomic():
+        client, _ = Client.objects.get_or_create(
+            email=email["from_email"],
+            defaults={'brand_name': email["brand_name"]}
+        )
+
+        # 1 thread = 1 Deal; new deals start as NEW (not PENDING until we
+        # reply and the client replies back). The row lock serialises
+        # concurrent status transitions on backends that support it.
+        deal, deal_created = Deal.objects.select_for_update().get_or_create(
+            thread_id=email["thread_id"],
+            defaults={
+                "client": client,
+                "subject": email["subject"],
+                "status": "NEW",
+            }
+        )
+
+        email_message = EmailMessage.objects.create(
+            deal=deal,
+            direction=email["direction"],
+            subject=email["subject"],
+            body=email["body"],
+            from_email=email["from_email"],
+            to_email=email["to_email"],
+            dedup_key=key,
+        )
+
+        old_status = deal.status
+        changed = apply_email_to_deal(deal, email, now)
+        if changed:
+            deal.save(update_fields=sorted(changed))
+
+        transitions = [(None, "NEW")] if deal_created else []
+        if deal.status != old_status:
+            transitions.append((old_status, deal.status))
+        record_deal_events([email["direction"]], transitions)
+
+    return {
+        "deal_id": deal.id,
+        "deal_created": deal_created,
+        "email_message_id": email_message.id,
+        "deal_status": deal.status,
+        "duplicate": False,
+    }
+
+
+# Optional reply-template fields accepted by ingest_email_with_ai
+AI_REPLY_FIELDS = ("template", "min_price", "currency", "brand_name", "deliverables")
+
+
+def ingest_email_with_ai(email, data):
+    """
+    In-process AI ingest: classify an INCOMING email and draft its reply with
+    the flask_ai pipeline, then persist it with ingest_email (one transaction).
+    Classification runs before the transaction so no locks are held while it
+    does. `data` is the raw payload, for the AI_REPLY_FIELDS. A reply supplied
+    in ai_generated_reply is kept. Raises ValueError for bad reply fields.
+    Returns the save_email result fields plus "ai" (None for OUTGOING emails
+    and for retries of emails already saved, which are not classified again).
+    """
+    duplicate = find_duplicate(email)
+    if duplicate is not None:
+        return {**duplicate, "ai": None}
+
+    ai = None
+    if email["direction"] == "INCOMING":
+        params = {field: data[field] for field in AI_REPLY_FIELDS if data.get(field) is not None}
+        if email["brand_name"]:
+            params.setdefault("brand_name", email["brand_name"])
+        ai = get_pipeline().process(email["body"], params)
+        if ai["reply"] and not email["ai_generated_reply"]:
+            email = {**email, "ai_generated_reply": ai["reply"]}
+
+    return {**ingest_email(email), "ai": ai}
+
+
+def _chunks(items, size=QUERY_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _fetch_by(model, field, values):
+    """Fetch rows of `model` whose `field` is in `values`, keyed by that field."""
+    found = {}
+    for chunk in _chunks(values):
+        for obj in model.objects.filter(**{f"{field}__in": chunk}):
+            found[getattr(obj, field)] = obj
+    return found
+
+
+def _resolve_clients(emails):
+    """Return {email: Client}, creating any missing clients in bulk."""
+    first_by_email = {}
+    for email in emails:
+        first_by_email.setdefault(email["from_email"], email)
+
+    clients = _fetch_by(Client, "email", first_by_email.keys())
+    missing = [address for address in first_by_email if address not in clients]
+    if missing:
+        Client.objects.bulk_create(
+            [Client(email=address, brand_name=first_by_email[address]["brand_name"]) for address in missing],
+            batch_size=QUERY_CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+        clients.update(_fetch_by(Client, "email", missing))
+    return clients
+
+
+def _resolve_deals(emails, clients):
+    """Return ({thread_id: Deal}, {thread_ids created here}), creating missing deals in bulk."""
+    first_by_thread = {}
+    for email in emails:
+        first_by_thread.setdefault(email["thread_id"], email)
+
+    deals = _fetch_by(Deal, "thread_id", first_by_thread.keys())
+    missing = [thread_id for thread_id in first_by_thread if thread_id not in deals]
+    if missing:
+        # Initial status: NEW for new deals, same as save_email
+        Deal.objects.bulk_create(
+            [
+                Deal(
+                    client=clients[first_by_thread[thread_id]["from_email"]],
+                    subject=first_by_thread[thread_id]["subject"],
+                    thread_id=thread_id,
+                    status="NEW",
+                )
+                for thread_id in missing
+            ],
+            batch_size=QUERY_CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+        deals.update(_fetch_by(Deal, "thread_id", missing))
+        # bulk_create sends no post_save signals
+        invalidate_threads(missing)
+    return deals, set(missing)
+
+
+def ingest_emails(items):
+    """
+    Bulk variant of save_email.
+
+    Validates every item, resolves Clients and Deals with a handful of
+    set-based queries, inserts all EmailMessages with bulk_create and writes
+    each touched Deal once. Items are applied in order, so several messages on
+    the same thread go through the same status transitions as individual
+    save_email calls would. Retries of emails already saved, in an earlier
+    request or earlier in this one, are skipped like save_email skips them.
+
+    Returns a list with one result dict per input item (same order).
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, data in enumerate(items):
+        cleaned, error = validate_email_payload(data)
+        if error:
+            results[index] = {"index": index, "status": "error", "error": error}
+        else:
+            valid.append((index, cleaned))
+
+    keys = {index: email_dedup_key(cleaned) for index, cleaned in valid}
+    try:
+        deduplicated = _ingest_valid(valid, keys, results)
+    except IntegrityError:
+        # A concurrent retry of the same emails was saved first: look the
+        # keys up again, so those items get the original results
+        deduplicated = _ingest_valid(valid, keys, results)
+    if deduplicated:
+        EMAILS_DEDUPLICATED.inc(deduplicated)
+    return results
+
+
+def _ingest_valid(valid, keys, results):
+    """
+    Save the validated `valid` items of ingest_emails, skipping retries, and
+    fill in their `results`. Returns how many were retries.
+    """
+    saved = _saved_results(set(keys.values()))
+    first_index = {}  # dedup_key -> index of the item in this batch that saves it
+    repeats = []  # (index, first_index) of items repeating an earlier item
+    fresh = []
+    for index, cleaned in valid:
+        key = keys[index]
+        if key in saved:
+            results[index] = {"index": index, "status": "success", **saved[key]}
+        elif key in first_index:
+            repeats.append((index, first_index[key]))
+        else:
+            first_index[key] = index
+            fresh.append((index, cleaned))
+    deduplicated = len(valid) - len(fresh)
+    valid = fresh
+
+    if not valid:
+        return deduplicated
+
+    emails = [cleaned for _, cleaned in valid]
+    now = timezone.now()
+
+    with transaction.atomic():
+        clients = _resolve_clients(emails)
+        deals, created_threads = _resolve_deals(emails, clients)
+
+        changed_fields = {}
+        new_messages = []
+        reported_created = set()
+        transitions = [(None, "NEW")] * len(created_threads)
+        for index, email in valid:
+            deal = deals[email["thread_id"]]
+            old_status = deal.status
+            changed = apply_email_to_deal(deal, email, now)
+            if deal.status != old_status:
+                transitions.append((old_status, deal.status))
+            if changed:
+                changed_fields.setdefault(deal.thread_id, set()).update(changed)
+
+            new_messages.append(EmailMessage(
+                deal=deal,
+                direction=email["direction"],
+                subject=email["subject"],
+                body=email["body"],
+                from_email=email["from_email"],
+                to_email=email["to_email"],
+                dedup_key=keys[index],
+            ))
+
+            deal_created = deal.thread_id in created_threads and deal.thread_id not in reported_created
+            reported_created.add(deal.thread_id)
+            results[index] = {
+                "index": index,
+                "status": "success",
+                "deal_id": deal.id,
+                "deal_created": deal_created,
+                "deal_status": deal.status,
+                "duplicate": False,
+            }
+
+        attach_bodies(new_messages)
+        EmailMessage.objects.bulk_create(new_messages, batch_size=QUERY_CHUNK_SIZE)
+        sync_search_index(new_messages)
+
+        # Group deals by the exact set of changed columns so each UPDATE only
+        # touches what actually changed.
+        by_fields = {}
+        for thread_id, fields in changed_fields.items():
+            by_fields.setdefault(tuple(sorted(fields)), []).append(deals[thread_id])
+        for fields, group in by_fields.items():
+            Deal.objects.bulk_update(group, list(fields), batch_size=QUERY_CHUNK_SIZE)
+
+        record_deal_events([email["direction"] for email in emails], transitions)
+
+    for (index, _), message in zip(valid, new_messages):
+        results[index]["email_message_id"] = message.id
+    for index, first in repeats:
+        results[index] = {**results[first], "index": index, "deal_created": False, "duplicate": True}
+
+    return deduplicated
+
+
+def threads_exist(thread_ids):
+    """
+    Map each thread_id to whether a Deal exists for it, answering from the
+    in-process cache where possible and with chunked IN queries for the rest.
+    Only existing threads are cached; unknown ones are always checked against
+    the database, since another process may have just created their deal.
+    """
+    thread_ids = list(dict.fromkeys(thread_ids))
+    result, missing = known_threads.get_many(thread_ids)
+    if missing:
+        existing = set()
+        for chunk in _chunks(missing):
+            existing.update(Deal.objects.filter(thread_id__in=chunk).values_list("thread_id", flat=True))
+        known_threads.set_many(dict.fromkeys(existing, True))
+        result.update({thread_id: thread_id in existing for thread_id in missing})
+    return result
+
+
+def deal_status_counts(queryset=None):
+    """
+    Count deals per status with one conditional-aggregation query.
+    Returns {status: count} for every status in Deal.STATUS_CHOICES (statuses
+    with no deals map to 0). Pass a filtered queryset to count a subset.
+    """
+    if queryset is None:
+        queryset = Deal.objects.all()
+    statuses = [choice[0] for choice in Deal.STATUS_CHOICES]
+    counts = queryset.order_by().aggregate(**{
+        status: Count("pk", filter=Q(status=status)) for status in statuses
+    })
+    return {status: counts[status] or 0 for status in statuses}
+
+
+def deal_status_totals():
+    """
+    Deals per status from the trigger-maintained DealStatusCounter table:
+    one primary-key lookup per status, independent of how many deals exist.
+    Same shape as deal_status_counts(), which it falls back to on databases
+    without the triggers.
+    """
+    if connection.vendor not in TRIGGER_VENDORS:
+        return deal_status_counts()
+    statuses = [choice[0] for choice in Deal.STATUS_CHOICES]
+    counts = dict(
+        DealStatusCounter.objects.filter(status__in=statuses).values_list("status", "count")
+    )
+    return {status: counts.get(status, 0) for status in statuses}
+
+
+def recount_deal_statuses():
+    """
+    Rebuild DealStatusCounter from an exact aggregate over the deal table.
+    Returns {status: (old, new)} for every counter that drifted.
+    """
+    with transaction.atomic():
+        actual = deal_status_counts()
+        # Statuses no longer in STATUS_CHOICES still have rows in the deal table
+        for status, count in (
+            Deal.objects.exclude(status__in=list(actual)).order_by()
+            .values_list("status").annotate(count=Count("pk"))
+        ):
+            actual[status] = count
+        stored = dict(DealStatusCounter.objects.values_list("status", "count"))
+
+        drift = {}
+        for status in set(actual) | set(stored):
+            new = actual.get(status, 0)
+            old = stored.get(status, 0)
+            if old != new:
+                drift[status] = (old, new)
+                DealStatusCounter.objects.update_or_create(status=status, defaults={"count": new})
+    return drift
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just after `row` (a deal or email) in (-created_at, -id) order."""
+    raw = json.dumps([row.created_at.isoformat(), row.pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def _older_than(queryset, cursor):
+    """The rows of `queryset` older than `cursor` (after it in (-created_at, -id) order)."""
+    created_at, pk = decode_cursor(cursor)
+    # The leading created_at <= bound lets the created_at indexes seek
+    # straight to the cursor instead of walking from the newest row.
+    return queryset.filter(
+        Q(created_at__lte=created_at),
+        Q(created_at__lt=created_at) | Q(id__lt=pk),
+    )
+
+
+def deal_page(queryset=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of deals, newest first, using keyset pagination on
+    (created_at, id) so every page costs the same regardless of depth.
+    Client columns come from the same query (select_related) and only the
+    listed columns are loaded.
+    Returns (deals, next_cursor); next_cursor is None on the last page.
+    """
+    if queryset is None:
+        queryset = Deal.objects.all()
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    queryset = (
+        queryset.select_related("client")
+        .only(*DEAL_LIST_FIELDS)
+        .order_by("-created_at", "-id")
+    )
+    if cursor:
+        queryset = _older_than(queryset, cursor)
+
+    deals = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(deals[limit - 1]) if len(deals) > limit else None
+    return deals[:limit], next_cursor
+
+
+def thread_page(deal, before=None, limit=THREAD_PAGE_SIZE):
+    """
+    The newest `limit` emails of `deal` older than the `before` cursor, in
+    thread order (oldest first). Only the headers and the first
+    PREVIEW_BYTES of each compressed body are read, so a page costs the same
+    however long the thread or its bodies are. Each email gets `preview`
+    (its first PREVIEW_CHARS characters) and `truncated` attributes; read
+    `body` for the full text.
+    Returns (emails, older_cursor); older_cursor is None at the start of the thread.
+    """
+    limit = max(1, min(int(limit), MAX_THREAD_PAGE_SIZE))
+
+    queryset = (
+        EmailMessage.objects.filter(deal=deal)
+        .only(*EMAIL_HEADER_FIELDS)
+        .annotate(
+            inline_preview=Substr("inline_body", 1, PREVIEW_CHARS + 1),
+            blob_prefix=Substr("body_blob__data", 1, PREVIEW_BYTES, output_field=BinaryField()),
+            blob_size=F("body_blob__size"),
+        )
+        .order_by("-created_at", "-id")
+    )
+    if before:
+        queryset = _older_than(queryset, before)
+
+    emails = list(queryset[:limit + 1])
+    older_cursor = encode_cursor(emails[limit - 1]) if len(emails) > limit else None
+    emails = emails[:limit]
+    for email in emails:
+        if email.body_blob_id is None:
+            text, cut = email.inline_preview, False
+        else:
+            text = EmailBody.text_prefix(email.blob_prefix, PREVIEW_CHARS * 4)
+            cut = len(text.encode("utf-8")) < email.blob_size
+        email.preview = text[:PREVIEW_CHARS]
+        email.truncated = cut or len(text) > PREVIEW_CHARS
+    emails.reverse()
+    return emails, older_cursor
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Deal
+from .thread_cache import invalidate_threads
+
+
+@receiver(post_save, sender=Deal)
+def deal_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate_threads([instance.thread_id])
+
+
+@receiver(post_delete, sender=Deal)
+def deal_deleted(sender, instance, **kwargs):
+    invalidate_threads([instance.thread_id])
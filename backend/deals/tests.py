@@ -1,3 +1,1514 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import re
+import smtplib
+import sqlite3
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import services
+from .ai import import_ai_module
+from .instrumentation import RequestTimingMiddleware
+from .models import Deal, DealStatusCounter, EmailBody, EmailMessage, Client, OutboxMessage, attach_bodies
+from .mail import MailDispatcher
+from .metrics import REGISTRY
+from .search import make_snippet, matching_email_ids, search_deals, search_emails
+from .outbox import claim_due, enqueue_acceptance_email, enqueue_webhook, process_due
+from .thread_cache import ThreadCache, known_threads
+from .webhooks import CircuitBreaker, CircuitOpenError, WebhookClient, WebhookError
+from .services import (
+    PREVIEW_CHARS, deal_page, deal_status_counts, deal_status_totals, encode_cursor, find_duplicate, ingest_emails,
+    recount_deal_statuses, thread_page, validate_email_payload,
+)
+
+
+def email_payload(thread_id="thread-1", direction="INCOMING", **overrides):
+    data = {
+        "thread_id": thread_id,
+        "subject": "Collab proposal",
+        "body": "Hi, we'd love to sponsor a video.",
+        "from_email": "brand@example.com",
+        "to_email": "creator@example.com",
+        "direction": direction,
+    }
+    data.update(overrides)
+    return data
+
+
+class SaveEmailsBulkTests(TestCase):
+    def post_json(self, items):
+        return self.client.post(reverse("save_emails"), data=json.dumps(items), content_type="application/json")
+
+    def test_json_array_applies_status_transitions_in_order(self):
+        response = self.post_json([
+            email_payload(direction="INCOMING"),
+            email_payload(direction="OUTGOING", from_email="creator@example.com", to_email="brand@example.com"),
+            email_payload(direction="INCOMING", body="Sounds good, send the contract."),
+        ])
+
+        self.assertEqual(response.status_code, 201)
+        results = response.json()["results"]
+        self.assertEqual([r["deal_status"] for r in results], ["NEW", "WAITING_FOR_CLIENT", "PENDING_CREATOR"])
+        self.assertEqual([r["deal_created"] for r in results], [True, False, False])
+        self.assertTrue(all(r["email_message_id"] for r in results))
+
+        deal = Deal.objects.get(thread_id="thread-1")
+        self.assertEqual(deal.status, "PENDING_CREATOR")
+        self.assertIsNotNone(deal.our_reply_sent_at)
+        self.assertIsNotNone(deal.client_replied_at)
+        self.assertEqual(deal.emails.count(), 3)
+        self.assertEqual(deal.client.email, "brand@example.com")
+
+    def test_ndjson_stream(self):
+        lines = "\n".join(json.dumps(email_payload(thread_id=f"t-{i}")) for i in range(5))
+        response = self.client.post(reverse("save_emails"), data=lines, content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["saved"], 5)
+        self.assertEqual(Deal.objects.count(), 5)
+        self.assertEqual(Client.objects.count(), 1)
+
+    @override_settings(BULK_INGEST_MAX_BYTES=1000)
+    def test_oversized_body_is_rejected_before_parsing(self):
+        items = [email_payload(thread_id=f"t-{i}") for i in range(20)]
+        with mock.patch("deals.views.json.loads") as loads:
+            response = self.post_json(items)
+        self.assertEqual(response.status_code, 413)
+        loads.assert_not_called()
+
+        lines = "\n".join(json.dumps(item) for item in items)
+        response = self.client.post(reverse("save_emails"), data=lines, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(EmailMessage.objects.exists())
+
+    @override_settings(BULK_INGEST_MAX_ITEMS=2)
+    def test_ndjson_stops_at_item_limit(self):
+        lines = "\n".join(json.dumps(email_payload(thread_id=f"t-{i}")) for i in range(5))
+        with mock.patch("deals.views.json.loads", side_effect=json.loads) as loads:
+            response = self.client.post(reverse("save_emails"), data=lines, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(loads.call_count, 3)
+        self.assertFalse(EmailMessage.objects.exists())
+
+    def test_invalid_items_are_reported_per_item(self):
+        response = self.post_json([email_payload(), {"thread_id": "x"}, email_payload(direction="SIDEWAYS")])
+
+        body = response.json()
+        self.assertEqual(body["saved"], 1)
+        self.assertEqual(body["failed"], 2)
+        self.assertEqual(body["results"][1]["status"], "error")
+        self.assertIn("Missing required fields", body["results"][1]["error"])
+        self.assertEqual(EmailMessage.objects.count(), 1)
+
+    def test_existing_deal_is_reused(self):
+        self.client.post(reverse("save_email"), data=json.dumps(email_payload()), content_type="application/json")
+
+        response = self.post_json([email_payload(direction="OUTGOING", subject="Re: Collab proposal")])
+
+        result = response.json()["results"][0]
+        self.assertFalse(result["deal_created"])
+        deal = Deal.objects.get(thread_id="thread-1")
+        self.assertEqual(deal.subject, "Re: Collab proposal")
+        self.assertEqual(deal.status, "WAITING_FOR_CLIENT")
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        # Up to 100 items, below where Django splits an INSERT to stay under
+        # SQLite's 999 parameters (bigger batches add an INSERT per ~100 rows)
+        for size in (10, 100):
+            with self.subTest(size=size):
+                items = [email_payload(thread_id=f"t{size}-{i}", from_email=f"b{size}-{i}@example.com",
+                                       body=f"Offer {size}-{i}") for i in range(size)]
+                # dedup key lookup, client select + insert + reselect, deal
+                # select + insert + reselect, body select + insert + reselect,
+                # message insert, search queue drain + index insert, plus the
+                # savepoint/transaction statements
+                with self.assertNumQueries(15):
+                    self.post_json(items)
+        self.assertEqual(EmailMessage.objects.count(), 110)
+
+    def test_rejects_invalid_json(self):
+        response = self.client.post(reverse("save_emails"), data="[not json", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class IdempotentIngestTests(TestCase):
+    """Retried ingest calls return the first call's result and write nothing."""
+
+    def post(self, url="save_email", headers=None, **overrides):
+        return self.client.post(reverse(url), data=json.dumps(email_payload(**overrides)),
+                                content_type="application/json", headers=headers or {})
+
+    def test_retry_returns_original_without_status_change(self):
+        reply = {"direction": "OUTGOING", "from_email": "creator@example.com", "to_email": "brand@example.com",
+                 "body": "Our rate is 5000."}
+        first = self.post(**reply).json()
+        self.post(body="Deal, send the contract.")
+        self.assertEqual(Deal.objects.get().status, "PENDING_CREATOR")
+
+        # One indexed lookup, nothing written
+        with self.assertNumQueries(1):
+            response = self.post(**reply)
+
+        self.assertEqual(response.status_code, 200)
+        retry = response.json()
+        self.assertTrue(retry["duplicate"])
+        self.assertFalse(first["duplicate"])
+        self.assertEqual(retry["email_message_id"], first["email_message_id"])
+        self.assertEqual(retry["deal_status"], "PENDING_CREATOR")
+        self.assertEqual(EmailMessage.objects.count(), 2)
+        self.assertEqual(Deal.objects.get().status, "PENDING_CREATOR")
+
+    def test_idempotency_key_and_message_id(self):
+        first = self.post(idempotency_key="n8n-run-1").json()
+        # Same key, different content: still the same email
+        self.assertEqual(self.post(idempotency_key="n8n-run-1", body="edited").json()["email_message_id"],
+                         first["email_message_id"])
+        self.assertTrue(self.post(headers={"Idempotency-Key": "n8n-run-1"}, body="other").json()["duplicate"])
+        # Different message-IDs: two emails, even with the same content
+        self.assertFalse(self.post(message_id="<a@mail>").json()["duplicate"])
+        self.assertFalse(self.post(message_id="<b@mail>").json()["duplicate"])
+        self.assertEqual(EmailMessage.objects.count(), 3)
+
+    def test_bulk_skips_saved_and_repeated_emails(self):
+        saved = self.post().json()
+
+        response = self.client.post(reverse("save_emails"), data=json.dumps([
+            email_payload(),
+            email_payload(thread_id="thread-2"),
+            email_payload(thread_id="thread-2"),
+        ]), content_type="application/json")
+
+        results = response.json()["results"]
+        self.assertEqual([r["duplicate"] for r in results], [True, False, True])
+        self.assertEqual(results[0]["email_message_id"], saved["email_message_id"])
+        self.assertEqual(results[2]["email_message_id"], results[1]["email_message_id"])
+        self.assertEqual([r["deal_created"] for r in results], [False, True, False])
+        self.assertEqual(response.json()["saved"], 3)
+        self.assertEqual(EmailMessage.objects.count(), 2)
+
+    def test_process_email_retry_skips_classification(self):
+        first = self.post("process_email", body="Buy cheap products now!").json()
+        with mock.patch("deals.services.get_pipeline") as get_pipeline:
+            response = self.post("process_email", body="Buy cheap products now!")
+        get_pipeline.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["ai"])
+        self.assertEqual(response.json()["email_message_id"], first["email_message_id"])
+
+    def test_concurrent_retry_loses_to_unique_index(self):
+        first = self.post().json()
+        counter = "deals_emails_deduplicated_total"
+        before = REGISTRY.get_sample_value(counter) or 0.0
+
+        # The retry's first lookup runs before the first copy is visible
+        real_saved_results = services._saved_results
+        lookups = []
+
+        def saved_results(keys):
+            lookups.append(keys)
+            return {} if len(lookups) == 1 else real_saved_results(keys)
+
+        with mock.patch("deals.services._saved_results", side_effect=saved_results):
+            response = self.post()
+
+        self.assertEqual(len(lookups), 2)
+        self.assertTrue(response.json()["duplicate"])
+        self.assertEqual(response.json()["email_message_id"], first["email_message_id"])
+        self.assertEqual(EmailMessage.objects.count(), 1)
+        self.assertEqual(REGISTRY.get_sample_value(counter), before + 1)
+
+    def test_concurrent_bulk_retry_loses_to_unique_index(self):
+        first = self.post().json()
+        counter = "deals_emails_deduplicated_total"
+        before = REGISTRY.get_sample_value(counter) or 0.0
+
+        # The retried batch's first lookup runs before the first copy is visible
+        real_saved_results = services._saved_results
+        lookups = []
+
+        def saved_results(keys):
+            lookups.append(keys)
+            return {} if len(lookups) == 1 else real_saved_results(keys)
+
+        with mock.patch("deals.services._saved_results", side_effect=saved_results):
+            response = self.client.post(reverse("save_emails"), data=json.dumps([
+                email_payload(),
+                email_payload(thread_id="thread-2"),
+            ]), content_type="application/json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(lookups), 2)
+        results = response.json()["results"]
+        self.assertEqual([r["duplicate"] for r in results], [True, False])
+        self.assertEqual(results[0]["email_message_id"], first["email_message_id"])
+        self.assertEqual(EmailMessage.objects.count(), 2)
+        self.assertEqual(REGISTRY.get_sample_value(counter), before + 1)
+
+
+class SaveEmailQueryCountTests(TestCase):
+    """Pin the number of SQL statements one save_email call costs."""
+
+    def post(self, **overrides):
+        return self.client.post(reverse("save_email"), data=json.dumps(email_payload(**overrides)), content_type="application/json")
+
+    def test_reply_on_existing_thread_is_one_update(self):
+        self.post()
+        Client.objects.create(email="creator@example.com")
+
+        # dedup key lookup, savepoint, client select, deal select, body select, message insert,
+        # search queue drain + index insert, deal update, release
+        with self.assertNumQueries(10):
+            response = self.post(direction="OUTGOING", from_email="creator@example.com", ai_generated_reply="Our rate is 5000")
+
+        self.assertEqual(response.json()["deal_status"], "WAITING_FOR_CLIENT")
+        deal = Deal.objects.get(thread_id="thread-1")
+        self.assertEqual(deal.ai_generated_reply, "Our rate is 5000")
+
+    def test_incoming_without_changes_skips_deal_update(self):
+        self.post()
+
+        # dedup key lookup, savepoint, client select, deal select, body select, message insert,
+        # search queue drain + index insert, release
+        with self.assertNumQueries(9):
+            response = self.post(message_id="<second@brand.example.com>")
+
+        self.assertEqual(response.json()["deal_status"], "NEW")
+
+    def test_only_changed_columns_are_written(self):
+        self.post()
+        Deal.objects.filter(thread_id="thread-1").update(status="WAITING_FOR_CLIENT")
+
+        with self.assertNumQueries(10) as ctx:
+            self.post(subject="Re: Collab proposal", message_id="<second@brand.example.com>")
+
+        update_sql = next(q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE"))
+        for column in ("status", "client_replied_at", "subject", "updated_at"):
+            self.assertIn(f'"{column}"', update_sql)
+        for column in ("ai_generated_reply", "our_reply_sent_at", "thread_id", "client_id"):
+            self.assertNotIn(f'"{column}"', update_sql)
+
+
+class DealStatusCountsTests(TestCase):
+    def setUp(self):
+        client = Client.objects.create(email="brand@example.com")
+        for i, status in enumerate(["NEW", "NEW", "COMPLETED", "REJECTED"]):
+            Deal.objects.create(client=client, subject="s", thread_id=f"t-{i}", status=status)
+
+    def test_counts_every_status_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = deal_status_counts()
+
+        self.assertEqual(set(counts), {status for status, _ in Deal.STATUS_CHOICES})
+        self.assertEqual(counts["NEW"], 2)
+        self.assertEqual(counts["COMPLETED"], 1)
+        self.assertEqual(counts["WAITING_FOR_CLIENT"], 0)
+
+    def test_counts_a_filtered_queryset(self):
+        counts = deal_status_counts(Deal.objects.filter(thread_id__in=["t-0", "t-2"]))
+        self.assertEqual(counts["NEW"], 1)
+        self.assertEqual(counts["COMPLETED"], 1)
+        self.assertEqual(counts["REJECTED"], 0)
+
+
+class DealStatusCounterTests(TestCase):
+    def setUp(self):
+        self.brand = Client.objects.create(email="brand@example.com")
+
+    def assertCountersMatch(self):
+        self.assertEqual(deal_status_totals(), deal_status_counts())
+
+    def test_create_update_delete_keep_counters_exact(self):
+        deal = Deal.objects.create(client=self.brand, subject="s", thread_id="t-1")
+        Deal.objects.create(client=self.brand, subject="s", thread_id="t-2", status="COMPLETED")
+        self.assertEqual(deal_status_totals()["NEW"], 1)
+
+        deal.status = "PENDING_CREATOR"
+        deal.save()
+        deal.save()  # no status change, no double count
+        self.assertEqual(deal_status_totals()["PENDING_CREATOR"], 1)
+        self.assertEqual(deal_status_totals()["NEW"], 0)
+
+        deal.delete()
+        self.assertCountersMatch()
+
+    def test_bulk_paths_are_counted(self):
+        Deal.objects.bulk_create([Deal(client=self.brand, subject="s", thread_id=f"t-{i}") for i in range(5)])
+        Deal.objects.filter(thread_id__in=["t-0", "t-1"]).update(status="REJECTED")
+        self.assertEqual(deal_status_totals()["REJECTED"], 2)
+
+        self.brand.delete()  # cascades to every deal
+        self.assertEqual(sum(deal_status_totals().values()), 0)
+
+    def test_dashboard_reads_counters(self):
+        self.client.force_login(User.objects.create_user("creator", password="pw"))
+        Deal.objects.create(client=self.brand, subject="s", thread_id="t-1")
+
+        response = self.client.get(reverse("dashboard"))
+
+        self.assertEqual(response.context["stats"]["NEW"], 1)
+        self.assertEqual(response.context["total_deals"], 1)
+
+    def test_recount_repairs_drift(self):
+        Deal.objects.create(client=self.brand, subject="s", thread_id="t-1")
+        DealStatusCounter.objects.filter(status="NEW").update(count=42)
+        DealStatusCounter.objects.create(status="LEGACY", count=3)
+
+        drift = recount_deal_statuses()
+
+        self.assertEqual(drift, {"NEW": (42, 1), "LEGACY": (3, 0)})
+        self.assertCountersMatch()
+        self.assertEqual(recount_deal_statuses(), {})
+
+    def test_other_databases_skip_triggers_and_count_the_deal_table(self):
+        migration = importlib.import_module("deals.migrations.0008_dealstatuscounter")
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = "mysql"
+        migration.create_triggers(None, schema_editor)
+        migration.drop_triggers(None, schema_editor)
+        schema_editor.execute.assert_not_called()
+
+        Deal.objects.create(client=self.brand, subject="s", thread_id="t-1")
+        DealStatusCounter.objects.filter(status="NEW").update(count=42)
+        with mock.patch.object(connection, "vendor", "mysql"):
+            self.assertEqual(deal_status_totals()["NEW"], 1)
+
+
+class CheckDealsExistTests(TestCase):
+    def setUp(self):
+        known_threads.clear()
+        self.addCleanup(known_threads.clear)
+        self.brand = Client.objects.create(email="brand@example.com")
+        Deal.objects.create(client=self.brand, subject="s", thread_id="t-1")
+
+    def check_batch(self, thread_ids):
+        return self.client.post(reverse("check_deal_exists"), data=json.dumps({"thread_ids": thread_ids}),
+                                content_type="application/json")
+
+    def test_batch_returns_map_and_caches(self):
+        with self.assertNumQueries(1):
+            response = self.check_batch(["t-1", "t-2", "t-1"])
+        self.assertEqual(response.json()["exists"], {"t-1": True, "t-2": False})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("check_deal_exists"), {"thread_id": "t-1"})
+        self.assertEqual(response.json(), {"exists": True})
+
+    def test_unknown_threads_are_not_cached(self):
+        # Another worker process: its own cache, which this process's commits never invalidate
+        other_worker = ThreadCache()
+        with mock.patch("deals.services.known_threads", other_worker):
+            self.assertEqual(services.threads_exist(["t-2"]), {"t-2": False})
+
+        Deal.objects.create(client=self.brand, subject="s", thread_id="t-2")
+
+        with mock.patch("deals.services.known_threads", other_worker):
+            with self.assertNumQueries(1):
+                self.assertEqual(services.threads_exist(["t-2"]), {"t-2": True})
+            with self.assertNumQueries(0):
+                self.assertEqual(services.threads_exist(["t-2"]), {"t-2": True})
+
+    def test_cache_is_invalidated_when_deals_are_created_or_deleted(self):
+        self.check_batch(["t-1", "t-2", "t-3"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Deal.objects.create(client=self.brand, subject="s", thread_id="t-2")
+        with self.captureOnCommitCallbacks(execute=True):
+            Deal.objects.filter(thread_id="t-1").delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_emails([email_payload(thread_id="t-3")])
+
+        self.assertEqual(self.check_batch(["t-1", "t-2", "t-3"]).json()["exists"],
+                         {"t-1": False, "t-2": True, "t-3": True})
+
+    def test_batch_rejects_bad_payload(self):
+        self.assertEqual(self.check_batch("t-1").status_code, 400)
+        self.assertEqual(self.check_batch([None]).status_code, 400)
+
+
+class DealPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(7):
+            client = Client.objects.create(email=f"brand{i}@example.com", brand_name=f"Brand {i}")
+            Deal.objects.create(client=client, subject=f"Deal {i}", thread_id=f"t-{i}", status="NEW" if i % 2 else "COMPLETED")
+
+    def test_keyset_pages_cover_every_deal_once(self):
+        seen = []
+        cursor = None
+        while True:
+            deals, cursor = deal_page(cursor=cursor, limit=3)
+            seen.extend(deal.thread_id for deal in deals)
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [f"t-{i}" for i in reversed(range(7))])
+
+    def test_dashboard_query_count_is_independent_of_page_size(self):
+        user = User.objects.create_user("creator", password="pw")
+        self.client.force_login(user)
+
+        # session, user, status counts, one joined page query
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("dashboard"))
+
+        self.assertContains(response, "brand6@example.com")
+        self.assertContains(response, "Brand 6")
+
+    def test_api_requires_login(self):
+        response = self.client.get(reverse("list_deals"))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response["Location"].startswith("/login/"))
+        self.assertNotIn(b"brand", response.content)
+
+    def test_api_filters_by_status_and_follows_cursor(self):
+        self.client.force_login(User.objects.create_user("creator", password="pw"))
+        response = self.client.get(reverse("list_deals"), {"status": "NEW", "limit": 2})
+        body = response.json()
+        self.assertEqual([d["thread_id"] for d in body["results"]], ["t-5", "t-3"])
+        self.assertEqual(body["results"][0]["client_email"], "brand5@example.com")
+
+        response = self.client.get(reverse("list_deals"), {"status": "NEW", "limit": 2, "cursor": body["next_cursor"]})
+        body = response.json()
+        self.assertEqual([d["thread_id"] for d in body["results"]], ["t-1"])
+        self.assertIsNone(body["next_cursor"])
+
+    def test_api_rejects_bad_parameters(self):
+        self.client.force_login(User.objects.create_user("creator", password="pw"))
+        self.assertEqual(self.client.get(reverse("list_deals"), {"cursor": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("list_deals"), {"status": "BOGUS"}).status_code, 400)
+
+
+class DealDetailTests(TestCase):
+    """The deal page shows the newest page of the thread as previews, however long the thread is."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("creator")
+        cls.brand = Client.objects.create(email="brand@example.com", brand_name="Glow")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def make_thread(self, thread_id, count, body="Offer {i}"):
+        deal = Deal.objects.create(client=self.brand, subject="Collab", thread_id=thread_id)
+        start = timezone.now()
+        emails = [
+            EmailMessage(deal=deal, direction="INCOMING" if i % 2 == 0 else "OUTGOING", subject="Collab",
+                         body=body.format(i=i), from_email="brand@example.com", to_email="creator@example.com")
+            for i in range(count)
+        ]
+        attach_bodies(emails)
+        EmailMessage.objects.bulk_create(emails)
+        # created_at is auto_now_add; spread the thread out so its order is known
+        for i, email in enumerate(emails):
+            EmailMessage.objects.filter(pk=email.pk).update(created_at=start + timedelta(minutes=i))
+        return deal
+
+    def test_page_shows_newest_messages_in_order(self):
+        deal = self.make_thread("long", 25)
+
+        response = self.client.get(reverse("deal_detail", args=[deal.id]))
+
+        previews = [email.preview for email in response.context["email_messages"]]
+        self.assertEqual(previews, [f"Offer {i}" for i in range(5, 25)])
+        self.assertContains(response, "Load older messages")
+        self.assertNotContains(response, "Offer 4<")
+
+    def test_older_pages_from_json(self):
+        deal = self.make_thread("long", 25)
+        _, cursor = thread_page(deal)
+
+        response = self.client.get(reverse("deal_emails", args=[deal.id]), {"before": cursor, "limit": 3})
+
+        page = response.json()
+        self.assertEqual([email["preview"] for email in page["results"]], ["Offer 2", "Offer 3", "Offer 4"])
+        self.assertIsNotNone(page["older_cursor"])
+        page = self.client.get(reverse("deal_emails", args=[deal.id]), {"before": page["older_cursor"]}).json()
+        self.assertEqual([email["preview"] for email in page["results"]], ["Offer 0", "Offer 1"])
+        self.assertIsNone(page["older_cursor"])
+
+        self.assertEqual(self.client.get(reverse("deal_emails", args=[deal.id]), {"before": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("deal_emails", args=[0])).status_code, 404)
+
+    def test_long_bodies_are_previewed(self):
+        body = "Quoted reply chain ✓ " * 2000
+        deal = self.make_thread("quoted", 1, body=body)
+        email = deal.emails.get()
+        # A body stored inline by an older version
+        inline = self.make_thread("inline", 1, body=body).emails.get()
+        EmailMessage.objects.filter(pk=inline.pk).update(body_blob=None, inline_body=body)
+
+        for thread in (deal, inline.deal):
+            [preview] = thread_page(thread)[0]
+            self.assertEqual(preview.preview, body[:PREVIEW_CHARS])
+            self.assertTrue(preview.truncated)
+
+        response = self.client.get(reverse("email_body", args=[deal.id, email.id]))
+        self.assertEqual(response.json(), {"id": email.id, "body": body})
+        other = self.make_thread("other", 1)
+        self.assertEqual(self.client.get(reverse("email_body", args=[other.id, email.id])).status_code, 404)
+
+    def test_short_bodies_are_whole(self):
+        deal = self.make_thread("short", 1, body="x" * PREVIEW_CHARS)
+        [email] = thread_page(deal)[0]
+        self.assertFalse(email.truncated)
+
+    def test_cost_does_not_grow_with_thread(self):
+        short = self.make_thread("short", 2)
+        long = self.make_thread("long", 300, body="Offer {i} " + "quoted history " * 500)
+
+        def page_queries(deal):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse("deal_detail", args=[deal.id]))
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(page_queries(short), page_queries(long))
+
+    def test_requires_login(self):
+        deal = self.make_thread("t", 1)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("deal_emails", args=[deal.id])).status_code, 302)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("creator", password="pw"))
+        client = Client.objects.create(email="brand@example.com", brand_name="Brand")
+        self.deal = Deal.objects.create(client=client, subject="Collab", thread_id="t-1", status="PENDING_CREATOR")
+
+    @override_settings(N8N_WEBHOOK_URL="http://n8n.invalid/hook")
+    def test_accept_enqueues_side_effects_without_calling_out(self):
+        with mock.patch("deals.outbox.get_webhook_client") as get_client:
+            response = self.client.post(reverse("accept_deal", args=[self.deal.id]))
+
+        self.assertEqual(response.status_code, 302)
+        get_client.assert_not_called()
+        self.deal.refresh_from_db()
+        self.assertEqual(self.deal.status, "COMPLETED")
+        kinds = sorted(OutboxMessage.objects.filter(deal=self.deal).values_list("kind", flat=True))
+        self.assertEqual(kinds, ["EMAIL", "WEBHOOK"])
+        webhook = OutboxMessage.objects.get(kind="WEBHOOK")
+        self.assertEqual(webhook.payload["body"]["action"], "accept")
+
+    @override_settings(
+        N8N_WEBHOOK_URL="http://n8n.invalid/hook",
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    )
+    def test_worker_delivers_and_marks_sent(self):
+        self.client.post(reverse("reject_deal", args=[self.deal.id]))
+
+        with mock.patch("deals.outbox.get_webhook_client") as get_client:
+            self.assertEqual(process_due(), (2, 0))
+
+        get_client.return_value.post.assert_called_once()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Update on your deal", mail.outbox[0].subject)
+        self.assertFalse(OutboxMessage.objects.exclude(status="SENT").exists())
+
+    @override_settings(N8N_WEBHOOK_URL="http://n8n.invalid/hook", OUTBOX_MAX_ATTEMPTS=2, OUTBOX_BACKOFF_SECONDS=10)
+    def test_failures_back_off_then_dead_letter(self):
+        message = enqueue_webhook(self.deal, "accept")
+
+        with mock.patch("deals.outbox.get_webhook_client") as get_client:
+            get_client.return_value.post.side_effect = WebhookError("n8n down")
+            self.assertEqual(process_due(), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual(message.attempts, 1)
+            self.assertEqual(message.status, "PENDING")
+            self.assertGreater(message.next_attempt_at, timezone.now())
+            self.assertEqual(process_due(), (0, 0))  # not due yet
+
+            OutboxMessage.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(process_due(), (0, 1))
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, "DEAD")
+        self.assertIn("n8n down", message.last_error)
+
+    @override_settings(N8N_WEBHOOK_URL="http://n8n.invalid/hook", OUTBOX_LEASE_SECONDS=300)
+    def test_slow_batch_keeps_its_lease(self):
+        enqueue_webhook(self.deal, "accept")
+        enqueue_webhook(self.deal, "reject")
+        clock = [timezone.now()]
+        competing_claims = []
+
+        def post(url, payload):
+            # Each delivery takes 200 s: the batch outlives the lease it was claimed with
+            clock[0] += timedelta(seconds=200)
+            competing_claims.append(claim_due())
+
+        with mock.patch("django.utils.timezone.now", side_effect=lambda: clock[0]), \
+                mock.patch("deals.outbox.get_webhook_client") as get_client:
+            get_client.return_value.post.side_effect = post
+            self.assertEqual(process_due(), (2, 0))
+
+        self.assertEqual(competing_claims, [[], []])
+        self.assertEqual(get_client.return_value.post.call_count, 2)
+        self.assertEqual(set(OutboxMessage.objects.values_list("status", flat=True)), {"SENT"})
+
+    @override_settings(N8N_WEBHOOK_URL="http://n8n.invalid/hook")
+    def test_skips_messages_claimed_by_another_worker(self):
+        enqueue_webhook(self.deal, "accept")
+        second = enqueue_webhook(self.deal, "reject")
+
+        def post(url, payload):
+            # Another worker took over the second message meanwhile
+            OutboxMessage.objects.filter(pk=second.pk).update(next_attempt_at=timezone.now() + timedelta(hours=1))
+
+        with mock.patch("deals.outbox.get_webhook_client") as get_client:
+            get_client.return_value.post.side_effect = post
+            self.assertEqual(process_due(), (1, 0))
+
+        get_client.return_value.post.assert_called_once()
+        second.refresh_from_db()
+        self.assertEqual(second.status, "PENDING")
+
+
+class FakeSMTPConnection:
+    """Stands in for an SMTP backend; can drop the connection on a given send."""
+
+    def __init__(self, log, drop_on=None):
+        self.log = log
+        self.drop_on = drop_on
+        self.sent = 0
+
+    def open(self):
+        self.log.append("open")
+
+    def close(self):
+        self.log.append("close")
+
+    def send_messages(self, messages):
+        self.sent += 1
+        if self.sent == self.drop_on:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.log.extend(message.subject for message in messages)
+        return len(messages)
+
+
+@override_settings(N8N_WEBHOOK_URL=None)
+class MailDispatcherTests(TestCase):
+    def setUp(self):
+        client = Client.objects.create(email="brand@example.com")
+        self.deals = [
+            Deal.objects.create(client=client, subject=f"Deal {i}", thread_id=f"t-{i}") for i in range(3)
+        ]
+
+    def test_outbox_batch_shares_one_connection(self):
+        log = []
+        for deal in self.deals:
+            enqueue_acceptance_email(deal)
+
+        dispatcher = MailDispatcher(connection_factory=lambda **kwargs: FakeSMTPConnection(log))
+        self.assertEqual(process_due(dispatcher=dispatcher), (3, 0))
+
+        self.assertEqual(log.count("open"), 1)
+        self.assertEqual(dispatcher.metrics()["messages_per_connection"], 3)
+
+    def test_reconnects_once_when_server_drops_connection(self):
+        log = []
+        connections = iter([FakeSMTPConnection(log, drop_on=2), FakeSMTPConnection(log)])
+        dispatcher = MailDispatcher(connection_factory=lambda **kwargs: next(connections))
+        emails = [mail.EmailMessage(subject=f"m{i}", to=["a@example.com"]) for i in range(3)]
+
+        errors = dispatcher.send_messages(emails)
+
+        self.assertEqual(errors, [None, None, None])
+        self.assertEqual(log, ["open", "m0", "close", "open", "m1", "m2"])
+        self.assertEqual(dispatcher.metrics()["connections_opened"], 2)
+
+
+class StubN8NServer:
+    """Local HTTP server answering POSTs with a scripted list of status codes."""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests += 1
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/webhook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WebhookClientTests(SimpleTestCase):
+    def make_client(self, **kwargs):
+        kwargs.setdefault("retries", 2)
+        return WebhookClient(timeout=2, backoff_seconds=0, sleep=lambda seconds: None, **kwargs)
+
+    def test_retries_server_errors_then_succeeds(self):
+        stub = StubN8NServer([503, 500, 200])
+        self.addCleanup(stub.close)
+        client = self.make_client()
+
+        response = client.post(stub.url, {"action": "accept"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stub.requests, 3)
+        stats = client.stats()
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["failures"], 2)
+        self.assertEqual(stats["breaker"], "closed")
+
+    def test_client_errors_are_not_retried(self):
+        stub = StubN8NServer([404])
+        self.addCleanup(stub.close)
+
+        with self.assertRaises(WebhookError):
+            self.make_client().post(stub.url, {})
+        self.assertEqual(stub.requests, 1)
+
+    def test_breaker_opens_and_stops_calling_n8n(self):
+        stub = StubN8NServer([500] * 10)
+        self.addCleanup(stub.close)
+        now = [0.0]
+        client = self.make_client(retries=0, breaker=CircuitBreaker(threshold=2, reset_seconds=30, clock=lambda: now[0]))
+
+        for _ in range(2):
+            with self.assertRaises(WebhookError):
+                client.post(stub.url, {})
+        with self.assertRaises(CircuitOpenError):
+            client.post(stub.url, {})
+        self.assertEqual(stub.requests, 2)
+
+        # After the reset window one trial call goes through; success closes the breaker
+        now[0] = 31.0
+        stub.statuses = [200]
+        client.post(stub.url, {})
+        self.assertEqual(client.breaker.state, "closed")
+        self.assertEqual(stub.requests, 3)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTests(TestCase):
+    """
+    Run the hot read paths, EXPLAIN every SELECT they issue and fail if any
+    of them scans a deals table without an index.
+    """
+
+    FULL_SCAN = re.compile(r"\bSCAN (deals_\w+)$")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        client = Client.objects.create(email="brand@example.com")
+        for i in range(3):
+            deal = Deal.objects.create(client=client, subject=f"Deal {i}", thread_id=f"t-{i}")
+            EmailMessage.objects.create(deal=deal, direction="INCOMING", subject="s", body="b",
+                                        from_email="brand@example.com", to_email="creator@example.com")
+        cls.deal = deal
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        known_threads.clear()
+
+    def assertIndexedPlans(self, func, allow_sort=False):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        selects = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                self.assertIsNone(self.FULL_SCAN.search(step), f"Full table scan:\n{sql}\n{plan}")
+                if not allow_sort and "ORDER BY" in sql:
+                    self.assertNotIn("TEMP B-TREE", step, f"Sort without index:\n{sql}\n{plan}")
+
+    def test_dashboard_pages(self):
+        _, cursor = deal_page(limit=1)
+        self.assertIndexedPlans(lambda: self.client.get(reverse("dashboard")))
+        self.assertIndexedPlans(lambda: self.client.get(reverse("dashboard"), {"cursor": cursor}))
+
+    def test_deals_api_with_status_and_cursor(self):
+        _, cursor = deal_page(limit=1)
+        self.assertIndexedPlans(lambda: self.client.get(reverse("list_deals"), {"status": "NEW", "cursor": cursor}))
+
+    def test_status_counts_use_covering_index(self):
+        self.assertIndexedPlans(deal_status_counts)
+
+    def test_status_totals_read_counter_rows(self):
+        self.assertIndexedPlans(deal_status_totals)
+
+    def test_deal_detail_thread(self):
+        self.assertIndexedPlans(lambda: self.client.get(reverse("deal_detail", args=[self.deal.id])))
+        email = self.deal.emails.get()
+        cursor = encode_cursor(email)
+        self.assertIndexedPlans(lambda: self.client.get(reverse("deal_emails", args=[self.deal.id]), {"before": cursor}))
+        self.assertIndexedPlans(lambda: self.client.get(reverse("email_body", args=[self.deal.id, email.id])))
+
+    def test_duplicate_lookup(self):
+        email, _ = validate_email_payload(email_payload(thread_id="t-1", body="b"))
+        self.assertIndexedPlans(lambda: find_duplicate(email))
+
+    def test_thread_exists_check(self):
+        self.assertIndexedPlans(lambda: self.client.get(reverse("check_deal_exists"), {"thread_id": "t-1"}))
+
+    def test_search(self):
+        # Results are sorted by relevance, which no index can provide
+        for params in ({"q": "deal"}, {"q": "deal", "type": "deals"}):
+            self.assertIndexedPlans(lambda: self.client.get(reverse("search"), params), allow_sort=True)
+        self.assertIndexedPlans(lambda: self.client.get(reverse("dashboard"), {"q": "deal"}), allow_sort=True)
+
+    def test_admin_search(self):
+        self.assertIndexedPlans(lambda: self.client.get("/admin/deals/emailmessage/", {"q": "brand"}), allow_sort=True)
+        self.assertIndexedPlans(lambda: self.client.get("/admin/deals/deal/", {"q": "t-1"}), allow_sort=True)
+
+    def test_admin_changelist_filters(self):
+        self.assertIndexedPlans(lambda: self.client.get("/admin/deals/deal/", {"status__exact": "NEW"}))
+        self.assertIndexedPlans(lambda: self.client.get("/admin/deals/emailmessage/", {"direction__exact": "INCOMING"}))
+        # Filtering messages through the deal join has to sort the matches, but must still seek
+        self.assertIndexedPlans(
+            lambda: self.client.get("/admin/deals/emailmessage/", {"deal__status__exact": "NEW"}),
+            allow_sort=True,
+        )
+
+    def test_admin_changelists_unfiltered(self):
+        self.assertIndexedPlans(lambda: self.client.get("/admin/deals/deal/"))
+        self.assertIndexedPlans(lambda: self.client.get("/admin/deals/emailmessage/"))
+
+
+@skipUnless(np is not None, "numpy is required for the text model")
+class TrainClassifierTests(TestCase):
+    USEFUL = "We would love a paid partnership: one instagram reel and a youtube integration, budget attached."
+    SPAM = "Congratulations winner! Cheap backlinks and casino bonus, click here to claim your crypto prize."
+
+    def setUp(self):
+        client = Client.objects.create(email="brand@example.com")
+        for i in range(20):
+            useful = i % 2 == 0
+            deal = Deal.objects.create(client=client, subject="Hi", thread_id=f"t{i}",
+                                       status="COMPLETED" if useful else "REJECTED")
+            EmailMessage.objects.create(deal=deal, direction="INCOMING", subject="Hi",
+                                        body=self.USEFUL if useful else self.SPAM,
+                                        from_email="brand@example.com", to_email="creator@example.com")
+            # Our own replies are not training data
+            EmailMessage.objects.create(deal=deal, direction="OUTGOING", subject="Re: Hi", body=self.SPAM,
+                                        from_email="creator@example.com", to_email="brand@example.com")
+
+    def test_trains_benchmarks_and_saves_model(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "models", "text_model")
+            out = io.StringIO()
+            call_command("train_classifier", "--output", path, stdout=out)
+
+            self.assertIn("20 emails from 20 deals", out.getvalue())
+            self.assertIn("emails/s", out.getvalue())
+            model = import_ai_module("text_model").TextModel.load(path)
+            self.assertIsInstance(model.weights, np.memmap)
+
+            results = model.classify_many(["A paid partnership reel with budget?", "Claim your casino crypto prize"])
+            self.assertEqual([r["category"] for r in results], ["useful", "spam"])
+
+    def test_model_store_swaps_to_new_version(self):
+        text_model = import_ai_module("text_model")
+        now = [0.0]
+        with tempfile.TemporaryDirectory() as tmp:
+            store = text_model.ModelStore(tmp, check_interval=1.0, clock=lambda: now[0])
+            self.assertIsNone(store.get())
+
+            first = text_model.TextModel.train([self.USEFUL, self.SPAM], [True, False], min_df=1)
+            first_version = first.save(tmp)
+            now[0] += 1
+            self.assertEqual(store.get().version, first_version)
+
+            second_version = text_model.TextModel.train([self.USEFUL, self.SPAM], [True, False], min_df=1).save(tmp)
+            self.assertEqual(store.get().version, first_version)  # not re-checked yet
+            now[0] += 1
+            self.assertEqual(store.get().version, second_version)
+            self.assertEqual(store.get().classify(self.USEFUL)["category"], "useful")
+
+            for _ in range(text_model.KEEP_VERSIONS):
+                text_model.TextModel.train([self.USEFUL, self.SPAM], [True, False], min_df=1).save(tmp)
+            self.assertEqual(len(os.listdir(os.path.join(tmp, "versions"))), text_model.KEEP_VERSIONS)
+
+    def test_needs_both_classes(self):
+        Deal.objects.filter(status="REJECTED").delete()
+        with self.assertRaisesMessage(CommandError, "both useful and not-useful"):
+            call_command("train_classifier", "--output", os.devnull, stdout=io.StringIO())
+
+
+class ProcessEmailTests(TestCase):
+    def setUp(self):
+        # Keyword rules and built-in templates, whatever model is trained locally
+        pipeline = import_ai_module("pipeline").EmailPipeline()
+        patcher = mock.patch("deals.services.get_pipeline", return_value=pipeline)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_json(self, data):
+        return self.client.post(reverse("process_email"), data=json.dumps(data), content_type="application/json")
+
+    def test_useful_email_gets_classified_drafted_and_saved(self):
+        response = self.post_json(email_payload(brand_name="Acme", template="counter_offer_detailed",
+                                                min_price=12000, deliverables=["1 reel", "2 stories"]))
+
+        self.assertEqual(response.status_code, 201)
+        ai = response.json()["ai"]
+        self.assertEqual(ai["category"], "useful")
+        self.assertIn("Hi Acme,", ai["reply"])
+        self.assertIn("For 1 reel and 2 stories, our fee starts from ₹12000.", ai["reply"])
+        deal = Deal.objects.get(thread_id="thread-1")
+        self.assertEqual(deal.ai_generated_reply, ai["reply"])
+        self.assertEqual(deal.emails.count(), 1)
+
+    def test_spam_is_saved_without_a_draft(self):
+        response = self.post_json(email_payload(body="Buy cheap products now!"))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["ai"]["category"], "spam")
+        self.assertIsNone(response.json()["ai"]["reply"])
+        self.assertIsNone(Deal.objects.get(thread_id="thread-1").ai_generated_reply)
+
+    def test_outgoing_email_is_not_classified(self):
+        response = self.post_json(email_payload(direction="OUTGOING"))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.json()["ai"])
+        self.assertEqual(response.json()["deal_status"], "WAITING_FOR_CLIENT")
+
+    def test_bad_reply_fields_save_nothing(self):
+        response = self.post_json(email_payload(min_price="lots"))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Deal.objects.exists())
+
+    def test_pipeline_failure_is_a_json_error(self):
+        with mock.patch("deals.services.get_pipeline") as get_pipeline:
+            get_pipeline.return_value.process.side_effect = RuntimeError("model file is corrupt")
+            response = self.post_json(email_payload())
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {"error": "Server error: model file is corrupt"})
+        self.assertFalse(Deal.objects.exists())
+
+    def test_pipeline_is_imported_from_the_flask_ai_package(self):
+        self.assertEqual(import_ai_module("pipeline").__name__, "flask_ai.pipeline")
+        self.assertNotIn("pipeline", sys.modules)
+
+
+class LoadTestingCommandTests(TestCase):
+    def test_generate_data_builds_consistent_threads(self):
+        call_command("generate_data", "--deals", "60", "--clients", "10", "--batch-size", "25",
+                     "--seed", "1", stdout=io.StringIO())
+
+        self.assertEqual(Deal.objects.count(), 60)
+        self.assertEqual(Client.objects.count(), 10)
+        for deal in Deal.objects.prefetch_related("emails"):
+            directions = [email.direction for email in deal.emails.all()]
+            self.assertEqual(directions[0], "INCOMING")
+            if deal.status == "WAITING_FOR_CLIENT":
+                self.assertEqual(directions[-1], "OUTGOING")
+        # Bulk inserts still go through the status counter triggers
+        self.assertEqual(recount_deal_statuses(), {})
+
+    def test_benchmark_reports_each_endpoint_and_cleans_up(self):
+        call_command("generate_data", "--deals", "20", "--seed", "1", stdout=io.StringIO())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "bench.json")
+            call_command("benchmark", "--requests", "6", "--concurrency", "1", "--output", output,
+                         "--seed", "1", stdout=io.StringIO())
+            with open(output) as fh:
+                report = json.load(fh)
+
+        self.assertEqual(set(report["results"]), {"save_email", "dashboard", "deal_detail", "check_deal_exists"})
+        for result in report["results"].values():
+            self.assertEqual(result["requests"], 6)
+            self.assertEqual(result["errors"], 0)
+            self.assertGreater(result["queries"]["mean"], 0)
+            self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p99"])
+        self.assertFalse(Deal.objects.filter(thread_id__startswith="bench-").exists())
+
+
+@override_settings(REQUEST_TIMING_HEADERS=True)
+class RequestTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("creator"))
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("dashboard"))
+
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="4 queries"')
+        self.assertRegex(timing, r"view;dur=[\d.]+, tpl;dur=[\d.]+, total;dur=[\d.]+")
+        template_ms = float(re.search(r"tpl;dur=([\d.]+)", timing).group(1))
+        self.assertGreater(template_ms, 0)
+
+    def test_no_header_unless_enabled(self):
+        with override_settings(REQUEST_TIMING_HEADERS=False):
+            self.assertNotIn("Server-Timing", self.client.get(reverse("dashboard")))
+        # Unset, it follows DEBUG
+        with override_settings(DEBUG=False):
+            del settings.REQUEST_TIMING_HEADERS
+            self.assertNotIn("Server-Timing", self.call_middleware(HttpResponse))
+
+    def call_middleware(self, view):
+        return RequestTimingMiddleware(lambda request: view())(RequestFactory().get("/deals/"))
+
+    @override_settings(N_PLUS_ONE_THRESHOLD=3)
+    def test_flags_repeated_statements(self):
+        client = Client.objects.create(email="brand@example.com")
+
+        def per_row_lookups():
+            for _ in range(4):
+                Client.objects.get(pk=client.pk)
+            return HttpResponse()
+
+        with self.assertLogs("deals.requests", "WARNING") as logs:
+            response = self.call_middleware(per_row_lookups)
+        self.assertIn('desc="4 queries"', response["Server-Timing"])
+        self.assertIn("Possible N+1 on GET /deals/: query ran 4 times", logs.output[0])
+
+    @override_settings(SLOW_REQUEST_QUERIES=1)
+    def test_logs_requests_over_thresholds(self):
+        def two_queries():
+            Deal.objects.count()
+            Client.objects.count()
+            return HttpResponse()
+
+        with self.assertLogs("deals.requests", "WARNING") as logs:
+            self.call_middleware(two_queries)
+        self.assertIn("Slow request GET /deals/ (200)", logs.output[0])
+        self.assertIn("2 queries", logs.output[0])
+
+
+class MetricsTests(TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def post_email(self, **fields):
+        payload = {
+            "thread_id": "metrics-thread", "subject": "Collab", "body": "Hi",
+            "from_email": "brand@example.com", "to_email": "creator@example.com",
+            **fields,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("save_email"), data=json.dumps(payload),
+                                    content_type="application/json")
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("check_deal_exists"), {"thread_id": "missing"})
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn("deals_http_requests_total{", response.content.decode())
+
+    def test_requests_labelled_by_route(self):
+        labels = {"route": "api/deals/check/", "method": "GET", "status": "200"}
+        before = self.sample("deals_http_requests_total", **labels)
+
+        self.client.get("/api/deals/check/", {"thread_id": "a"})
+        self.client.get("/api/deals/check/", {"thread_id": "b"})
+
+        self.assertEqual(self.sample("deals_http_requests_total", **labels), before + 2)
+
+    def test_ingest_counts_emails_and_transitions(self):
+        incoming = self.sample("deals_emails_ingested_total", direction="INCOMING")
+        created = self.sample("deals_status_transitions_total", from_status="none", to_status="NEW")
+        replied = self.sample("deals_status_transitions_total", from_status="NEW", to_status="WAITING_FOR_CLIENT")
+
+        self.post_email(direction="INCOMING")
+        self.post_email(direction="OUTGOING", from_email="creator@example.com", to_email="brand@example.com")
+
+        self.assertEqual(self.sample("deals_emails_ingested_total", direction="INCOMING"), incoming + 1)
+        self.assertEqual(
+            self.sample("deals_status_transitions_total", from_status="none", to_status="NEW"), created + 1)
+        self.assertEqual(
+            self.sample("deals_status_transitions_total", from_status="NEW", to_status="WAITING_FOR_CLIENT"),
+            replied + 1)
+
+    def test_counted_on_commit(self):
+        before = self.sample("deals_emails_ingested_total", direction="INCOMING")
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            ingest_emails([{
+                "thread_id": "rolled-back", "subject": "Collab", "body": "Hi",
+                "from_email": "brand@example.com", "to_email": "creator@example.com",
+                "direction": "INCOMING",
+            }])
+
+        # Not counted until the transaction commits (a rollback never counts)
+        self.assertEqual(self.sample("deals_emails_ingested_total", direction="INCOMING"), before)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.sample("deals_emails_ingested_total", direction="INCOMING"), before + 1)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Client.objects.create(email="team@glow.example.com", brand_name="Glow")
+        cls.deal = Deal.objects.create(client=cls.brand, subject="Skincare launch", thread_id="glow-1")
+        cls.other = Deal.objects.create(client=cls.brand, subject="Headphones", thread_id="glow-2")
+        cls.email = cls.add_email(cls.deal, "Skincare launch", "We would love a collaboration on our serum launch.")
+        cls.add_email(cls.other, "Headphones", "Our headphones need a review video.")
+
+    @classmethod
+    def add_email(cls, deal, subject, body):
+        return EmailMessage.objects.create(deal=deal, direction="INCOMING", subject=subject, body=body,
+                                           from_email=deal.client.email, to_email="creator@example.com")
+
+    def ids(self, query):
+        return [email.id for email in search_emails(query)]
+
+    def test_stemmed_and_prefix_matches(self):
+        self.assertEqual(self.ids("collaborations"), [self.email.id])
+        self.assertEqual(self.ids("serum coll"), [self.email.id])
+        self.assertEqual(self.ids("serum headphones"), [])
+        self.assertEqual(self.ids("glow"), self.ids("team glow"))
+        self.assertEqual(search_emails("*** OR"), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.email.body = "Budget is 5000 for two stories."
+        self.email.save()
+        self.assertEqual(self.ids("serum"), [])
+        self.assertEqual(self.ids("stories"), [self.email.id])
+
+        EmailMessage.objects.filter(pk=self.email.pk).update(subject="Moisturiser")
+        self.assertEqual(self.ids("moisturiser"), [self.email.id])
+
+        self.deal.delete()
+        self.assertEqual(self.ids("stories"), [])
+
+    def test_ranks_subject_matches_first(self):
+        body_only = self.add_email(self.other, "Re: Headphones", "Is the skincare deal still on?")
+        self.assertEqual(self.ids("skincare"), [self.email.id, body_only.id])
+
+    def test_search_deals(self):
+        self.add_email(self.deal, "Re: Skincare launch", "Any news on the serum?")
+
+        deals = search_deals("serum")
+
+        self.assertEqual([deal.id for deal in deals], [self.deal.id])
+        self.assertIn("serum", deals[0].snippet)
+
+    def test_search_deals_scores_each_deal_by_its_best_email(self):
+        reply = self.add_email(self.other, "Re: Headphones", "Could the serum review wait a week?")
+        best = self.add_email(self.other, "Serum review", "Serum, serum, serum: a serum review.")
+
+        # pending check, ranking (one pass over the matches), deals, snippet bodies
+        with self.assertNumQueries(4):
+            deals = search_deals("serum")
+
+        self.assertEqual([deal.id for deal in deals], [self.other.id, self.deal.id])
+        self.assertEqual(deals[0].snippet, best.body)
+        self.assertNotEqual(deals[0].snippet, reply.body)
+
+    def test_ranks_only_the_newest_matches(self):
+        newer = self.add_email(self.other, "Re: Headphones", "Is the skincare deal still on?")
+
+        with mock.patch("deals.search.MAX_CANDIDATES", 1):
+            self.assertEqual(self.ids("skincare"), [newer.id])
+            self.assertEqual([deal.id for deal in search_deals("skincare")], [self.other.id])
+        self.assertEqual(self.ids("skincare"), [self.email.id, newer.id])
+
+    def test_other_databases_fall_back_to_substring_matches(self):
+        migration = importlib.import_module("deals.migrations.0009_email_search_index")
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = "mysql"
+        migration.create_index(None, schema_editor)
+        schema_editor.execute.assert_not_called()
+
+        reply = self.add_email(self.deal, "Re: Skincare launch", "Sounds good")
+        with mock.patch.object(connection, "vendor", "mysql"):
+            self.assertEqual(self.ids("skincare LAUNCH"), [reply.id, self.email.id])
+            self.assertEqual([deal.id for deal in search_deals("glow.example")], [self.deal.id, self.other.id])
+            self.assertEqual(list(EmailMessage.objects.filter(pk__in=matching_email_ids("headphones"))),
+                             list(self.other.emails.all()))
+
+            # Bodies saved there stay inline, where the substring match reads them
+            note = self.add_email(self.other, "Update", "Shipping the tripod next week")
+            self.assertIsNone(note.body_blob_id)
+            self.assertEqual(self.ids("tripod"), [note.id])
+
+    def test_snippet(self):
+        text = "word " * 100 + "needle " + "word " * 100
+        snippet = make_snippet(text, ["needle"], length=60)
+        self.assertTrue(snippet.startswith("…word"))
+        self.assertIn("needle", snippet)
+        self.assertTrue(snippet.endswith("…"))
+
+    def test_search_api_requires_login(self):
+        response = self.client.get(reverse("search"), {"q": "review"})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response["Location"].startswith("/login/"))
+        self.assertNotIn(b"review", response.content)
+
+    def test_search_api(self):
+        self.client.force_login(User.objects.create_user("creator"))
+        response = self.client.get(reverse("search"), {"q": "review"})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["deal_id"] for r in results], [self.other.id])
+        self.assertIn("review video", results[0]["snippet"])
+
+        response = self.client.get(reverse("search"), {"q": "launch", "type": "deals"})
+        self.assertEqual([r["deal_id"] for r in response.json()["results"]], [self.deal.id])
+
+        self.assertEqual(self.client.get(reverse("search")).status_code, 400)
+        self.assertEqual(self.client.get(reverse("search"), {"q": "x", "type": "clients"}).status_code, 400)
+
+    def test_dashboard_search_box(self):
+        self.client.force_login(User.objects.create_user("creator"))
+
+        response = self.client.get(reverse("dashboard"), {"q": "serum"})
+
+        self.assertContains(response, "Skincare launch")
+        self.assertNotContains(response, "Headphones")
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/admin/deals/emailmessage/", {"q": "serum"})
+        self.assertContains(response, "1 result")
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if "LIKE" in q["sql"]])
+
+        response = self.client.get("/admin/deals/deal/", {"q": "glow-2"})
+        self.assertContains(response, "1 result")
+        response = self.client.get("/admin/deals/deal/", {"q": "serum"})
+        self.assertContains(response, "1 result")
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite search index")
+class SearchIndexOutsideDjangoTests(TransactionTestCase):
+    def test_other_connections_can_write_emails(self):
+        brand = Client.objects.create(email="team@glow.example.com")
+        deal = Deal.objects.create(client=brand, subject="Skincare launch", thread_id="glow-1")
+        kept, deleted = [
+            EmailMessage.objects.create(deal=deal, direction="INCOMING", subject="Skincare launch",
+                                        body=f"We would love a serum review, take {i}.",
+                                        from_email=brand.email, to_email="creator@example.com")
+            for i in range(2)
+        ]
+
+        # e.g. the sqlite3 shell or a backup tool: no functions registered by the app
+        with sqlite3.connect(connection.settings_dict["NAME"], uri=True) as other:
+            other.execute("UPDATE deals_emailmessage SET subject = 'Headphones' WHERE id = ?", [kept.id])
+            other.execute("DELETE FROM deals_emailmessage WHERE id = ?", [deleted.id])
+        other.close()
+
+        self.assertEqual([email.id for email in search_emails("headphones serum")], [kept.id])
+        self.assertEqual(search_emails("skincare"), [])
+
+    def test_rebuild_command_restores_the_index(self):
+        brand = Client.objects.create(email="team@glow.example.com")
+        deal = Deal.objects.create(client=brand, subject="Skincare launch", thread_id="glow-1")
+        email = EmailMessage.objects.create(deal=deal, direction="INCOMING", subject="Skincare launch",
+                                            body="We would love a serum review.",
+                                            from_email=brand.email, to_email="creator@example.com")
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO deals_email_fts (deals_email_fts) VALUES ('delete-all')")
+        self.assertEqual(search_emails("serum"), [])
+
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+
+        self.assertIn("Indexed 1 emails.", out.getvalue())
+        self.assertEqual([e.id for e in search_emails("serum")], [email.id])
+
+
+class EmailBodyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Client.objects.create(email="team@glow.example.com", brand_name="Glow")
+        cls.deal = Deal.objects.create(client=cls.brand, subject="Skincare launch", thread_id="glow-1")
+
+    def add_email(self, body, **fields):
+        return EmailMessage.objects.create(deal=self.deal, direction="INCOMING", subject="Skincare launch",
+                                           body=body, from_email=self.brand.email, to_email="creator@example.com",
+                                           **fields)
+
+    def test_bodies_are_compressed_and_shared(self):
+        text = "Thanks for reaching out for collaboration. " * 50
+        first, second = self.add_email(text), self.add_email(text)
+
+        self.assertEqual(EmailBody.objects.count(), 1)
+        self.assertEqual(first.body_blob_id, second.body_blob_id)
+        stored = EmailBody.objects.get()
+        self.assertEqual(stored.size, len(text))
+        self.assertLess(len(stored.data), stored.size // 10)
+
+        email = EmailMessage.objects.get(pk=first.pk)
+        self.assertEqual(email.inline_body, "")
+        with self.assertNumQueries(1):
+            self.assertEqual(email.body, text)
+
+    def test_bulk_ingest_stores_bodies(self):
+        ingest_emails([email_payload(thread_id=f"t-{i}", body=f"Offer {i % 2}") for i in range(4)])
+
+        self.assertEqual(EmailBody.objects.count(), 2)
+        bodies = [email.body for email in EmailMessage.objects.select_related("body_blob").order_by("id")]
+        self.assertEqual(bodies, ["Offer 0", "Offer 1", "Offer 0", "Offer 1"])
+
+    def test_compress_bodies_moves_inline_rows(self):
+        emails = [self.add_email(f"We would love a serum review, take {i}.") for i in range(3)]
+        # Rows as an older version stored them
+        for email in emails:
+            EmailMessage.objects.filter(pk=email.pk).update(body_blob=None, inline_body=email.body)
+        EmailBody.objects.all().delete()
+        self.assertEqual(len(search_emails("serum")), 3)
+
+        out = io.StringIO()
+        call_command("compress_bodies", "--batch-size", "2", stdout=out)
+        with connection.cursor() as cursor:
+            # Moving the text doesn't change it, so nothing is left to reindex
+            cursor.execute("SELECT COUNT(*) FROM deals_email_fts_pending")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+        self.assertIn("Converted 3 emails", out.getvalue())
+        self.assertFalse(EmailMessage.objects.filter(body_blob__isnull=True).exists())
+        self.assertEqual({email.body for email in search_emails("serum")}, {email.body for email in emails})
+        call_command("compress_bodies", stdout=out)
+        self.assertIn("Converted 0 emails", out.getvalue())
+
+    def test_other_databases_keep_bodies_inline(self):
+        with mock.patch.object(connection, "vendor", "mysql"):
+            with self.assertRaisesMessage(CommandError, "Bodies stay inline on mysql"):
+                call_command("compress_bodies", stdout=io.StringIO())
+
+    def test_prune_keeps_used_bodies(self):
+        email = self.add_email("First draft")
+        email.body = "Final text"
+        email.save()
+
+        call_command("compress_bodies", "--prune", stdout=io.StringIO())
+
+        self.assertEqual(list(EmailBody.objects.values_list("digest", flat=True)), [email.body_blob.digest])
+        self.assertEqual([e.id for e in search_emails("final")], [email.id])
+        self.assertEqual(search_emails("draft"), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid FROM deals_email_fts WHERE deals_email_fts MATCH 'draft'")
+            self.assertEqual(cursor.fetchall(), [])
+
+    def test_admin_edits_body(self):
+        email = self.add_email("Old text")
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        url = reverse("admin:deals_emailmessage_change", args=[email.pk])
+        self.assertContains(self.client.get(url), "Old text")
+
+        response = self.client.post(url, {
+            "deal": self.deal.pk, "direction": "INCOMING", "subject": "Skincare launch", "body": "New text",
+            "from_email": self.brand.email, "to_email": "creator@example.com",
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(EmailMessage.objects.get(pk=email.pk).body, "New text")
+
+
+class AdminChangelistTests(TestCase):
+    """Changelist pages cost a fixed number of queries, however many rows they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.add_deals(5)
+
+    @classmethod
+    def add_deals(cls, count):
+        start = Deal.objects.count()
+        for i in range(start, start + count):
+            client = Client.objects.create(email=f"brand{i}@example.com", brand_name=f"Brand {i}")
+            deal = Deal.objects.create(client=client, subject=f"Deal {i}", thread_id=f"admin-{i}")
+            for _ in range(i % 3 + 1):
+                EmailMessage.objects.create(deal=deal, direction="INCOMING", subject="s", body="b",
+                                            from_email=client.email, to_email="creator@example.com")
+            enqueue_webhook(deal, "accept")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def changelist(self, url, queries, **params):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_per_page(self):
+        # session, user, status counters (summary + paginator), page
+        pages = [("/admin/deals/deal/", 5),
+                 # session, user, table estimate, exact count (small table), page
+                 ("/admin/deals/client/", 5), ("/admin/deals/emailmessage/", 5),
+                 ("/admin/deals/outboxmessage/", 5)]
+        for url, queries in pages:
+            self.changelist(url, queries)
+
+        self.add_deals(20)
+        for url, queries in pages:
+            response = self.changelist(url, queries)
+            self.assertGreaterEqual(len(response.context["cl"].result_list), 25)
+
+    def test_annotated_columns_sort(self):
+        response = self.changelist("/admin/deals/deal/", 5, o="-8.1")
+        counts = [deal.email_count for deal in response.context["cl"].result_list]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertEqual(counts[0], 3)
+
+        response = self.changelist("/admin/deals/client/", 5, o="4")
+        self.assertEqual([c.deal_count for c in response.context["cl"].result_list], [1] * 5)
+
+        response = self.changelist("/admin/deals/deal/", 5, o="2")
+        emails = [deal.client.email for deal in response.context["cl"].result_list]
+        self.assertEqual(emails, sorted(emails))
+
+        response = self.changelist("/admin/deals/emailmessage/", 5, o="-2")
+        deal_ids = [email.deal_id for email in response.context["cl"].result_list]
+        self.assertEqual(deal_ids, sorted(deal_ids, reverse=True))
+
+    @mock.patch("deals.admin.ESTIMATED_COUNT_THRESHOLD", 1)
+    def test_estimated_counts_skip_count_star(self):
+        for url in ("/admin/deals/deal/", "/admin/deals/emailmessage/", "/admin/deals/client/"):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertFalse([q["sql"] for q in ctx.captured_queries if "COUNT(*)" in q["sql"]], url)
+            self.assertGreaterEqual(response.context["cl"].result_count, 5)
+
+        # Filtered lists are still counted exactly
+        response = self.client.get("/admin/deals/emailmessage/", {"direction__exact": "OUTGOING"})
+        self.assertEqual(response.context["cl"].result_count, 0)
 
-# Create your tests here.
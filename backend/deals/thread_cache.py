@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+
+class ThreadCache:
+    """
+    In-process LRU of thread_id -> exists, with a TTL.
+
+    Entries are discarded when this process commits a Deal create or delete
+    (post_save/post_delete signals, plus the bulk ingest path, which bypasses
+    signals), so it never serves a stale answer for its own writes. Other
+    worker processes can't reach it, so threads_exist() only stores "exists"
+    answers: a deal created elsewhere is seen at once, and the TTL bounds how
+    long one deleted elsewhere is still reported.
+    """
+
+    def __init__(self, max_size=100000, ttl=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, thread_ids):
+        """Return ({thread_id: exists} for fresh cached ids, [missing ids])."""
+        now = self.clock()
+        found, missing = {}, []
+        with self._lock:
+            for thread_id in thread_ids:
+                entry = self._entries.get(thread_id)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(thread_id)
+                    found[thread_id] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.append(thread_id)
+                    self.misses += 1
+        return found, missing
+
+    def set_many(self, values):
+        expires = self.clock() + self.ttl
+        with self._lock:
+            for thread_id, exists in values.items():
+                self._entries[thread_id] = (exists, expires)
+                self._entries.move_to_end(thread_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard_many(self, thread_ids):
+        with self._lock:
+            for thread_id in thread_ids:
+                self._entries.pop(thread_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+known_threads = ThreadCache(
+    max_size=getattr(settings, "THREAD_CACHE_SIZE", 100000),
+    ttl=getattr(settings, "THREAD_CACHE_TTL", 300),
+)
+
+
+def invalidate_threads(thread_ids):
+    """Drop `thread_ids` from the cache once the current transaction commits."""
+    thread_ids = list(thread_ids)
+    transaction.on_commit(lambda: known_threads.discard_many(thread_ids))
@@ -2,15 +2,21 @@ from django.urls import path
 from django.shortcuts import redirect
 from .views import (
     save_email, 
+    save_emails,
+    process_email,
     dashboard, 
     deal_detail, 
+    deal_emails,
+    email_body,
     accept_deal, 
     reject_deal, 
     update_ai_reply,
     login_view,
     logout_view,
     save_dashboard_deal,
-    check_deal_exists
+    check_deal_exists,
+    list_deals,
+    search,
 )
 
 def home(request):
@@ -27,12 +33,18 @@ urlpatterns = [
 
     # API endpoints (under /api/)
     path("save-email/", save_email, name="save_email"),
+    path("save-emails/", save_emails, name="save_emails"),
+    path("process-email/", process_email, name="process_email"),
+    path("deals/", list_deals, name="list_deals"),
     path("deals/check/", check_deal_exists, name="check_deal_exists"),
+    path("search/", search, name="search"),
     
 
     # Dashboard views
     path("dashboard/", dashboard, name="dashboard"),
     path("deal/<int:deal_id>/", deal_detail, name="deal_detail"),
+    path("deal/<int:deal_id>/emails/", deal_emails, name="deal_emails"),
+    path("deal/<int:deal_id>/emails/<int:email_id>/", email_body, name="email_body"),
     path("deal/<int:deal_id>/accept/", accept_deal, name="accept_deal"),
     path("deal/<int:deal_id>/reject/", reject_deal, name="reject_deal"),
     path("deal/<int:deal_id>/update-reply/", update_ai_reply, name="update_ai_reply"),
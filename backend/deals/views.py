@@ -7,18 +7,17 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_http_methods, require_GET
 from django.utils import timezone
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-
-
-def _sanitize_header(value):
-    """Sanitize header values by removing newlines and collapsing whitespace."""
-    if value is None:
-        return ""
-    return " ".join(str(value).splitlines()).strip()
+from django.db import transaction
 import json
-import requests
 
+from .metrics import record_deal_events
 from .models import Deal, EmailMessage, Client
+from .search import MAX_RESULTS, search_deals, search_emails
+from .outbox import enqueue_acceptance_email, enqueue_rejection_email, enqueue_webhook
+from .services import (
+    DEFAULT_PAGE_SIZE, THREAD_PAGE_SIZE, deal_page, deal_status_totals, ingest_email, ingest_email_with_ai,
+    ingest_emails, thread_page, threads_exist, validate_email_payload,
+)
 
 
 #  SAVE EMAIL (n8n ENTRY POINT)
@@ -34,6 +33,12 @@ def save_email(request):
     - to_email (required)
     - direction (required: INCOMING or OUTGOING)
     - ai_generated_reply (optional) - AI generated reply text
+    - idempotency_key or message_id (optional) - identifies the email across
+      retries; an Idempotency-Key header works too
+
+    A retry of an email already saved (same key, or without one the same
+    thread_id, direction, from_email and body) changes nothing and returns
+    the original result with "duplicate": true and status 200.
     """
     if request.method != "POST":
         return JsonResponse({"error": "Method not allowed. Use POST."}, status=405)
@@ -50,114 +55,175 @@ def save_email(request):
             "error": "Invalid JSON. Please send JSON data only."
         }, status=400)
 
-    # Validate required fields
-    required_fields = ['thread_id', 'subject', 'body', 'from_email', 'to_email', 'direction']
-    missing_fields = [field for field in required_fields if not data.get(field)]
-    
-    if missing_fields:
+    cleaned, error = validate_email_payload(data)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+    _apply_idempotency_header(request, cleaned)
+
+    try:
+        result = ingest_email(cleaned)
+    except Exception as e:
         return JsonResponse({
-            "error": f"Missing required fields: {', '.join(missing_fields)}"
-        }, status=400)
+            "error": f"Server error: {str(e)}"
+        }, status=500)
 
-    thread_id = data.get("thread_id")
-    subject = data.get("subject")
-    body = data.get("body")
-    from_email = data.get("from_email")
-    to_email = data.get("to_email")
-    direction = data.get("direction", "INCOMING").upper()
+    return JsonResponse({"status": "success", **result}, status=200 if result["duplicate"] else 201)
 
-    # Validate direction
-    if direction not in ['INCOMING', 'OUTGOING']:
-        return JsonResponse({
-            "error": "direction must be either 'INCOMING' or 'OUTGOING'"
-        }, status=400)
+
+def _apply_idempotency_header(request, cleaned):
+    """An Idempotency-Key request header takes the place of the idempotency_key field."""
+    key = request.headers.get("Idempotency-Key", "").strip()
+    if key:
+        cleaned["idempotency_key"] = key
+
+
+#  PROCESS EMAIL (classify + draft reply + save in one call)
+@csrf_exempt
+@require_POST
+def process_email(request):
+    """
+    In-process alternative to n8n calling Flask /classify_email and
+    /generate_reply before save_email. Takes the save_email fields; for
+    INCOMING emails it classifies the body and, if useful, drafts
+    ai_generated_reply from a reply template, then saves everything in one
+    transaction. Optional reply fields: template, min_price, currency,
+    brand_name, deliverables. Spam is saved without a draft.
+    """
+    try:
+        data = json.loads(request.body)
+    except (json.JSONDecodeError, ValueError):
+        return JsonResponse({"error": "Invalid JSON. Please send JSON data only."}, status=400)
+
+    cleaned, error = validate_email_payload(data)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+    _apply_idempotency_header(request, cleaned)
 
     try:
-        # 1️ Get or create Client using from_email
-        client, client_created = Client.objects.get_or_create(
-            email=from_email,
-            defaults={'brand_name': data.get('brand_name', '')}
-        )
+        result = ingest_email_with_ai(cleaned, data)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({
+            "error": f"Server error: {str(e)}"
+        }, status=500)
 
-        # 2 Get or create Deal using thread_id (1 thread = 1 Deal)
-        # Initial status: NEW for new deals (don't set PENDING until we reply and client replies back)
-        initial_status = "NEW"
-        deal, deal_created = Deal.objects.get_or_create(
-            thread_id=thread_id,
-            defaults={
-                "client": client,
-                "subject": subject,
-                "status": initial_status
-            }
-        )
+    return JsonResponse({"status": "success", **result}, status=200 if result["duplicate"] else 201)
 
-        # Update subject if it changed
-        if deal.subject != subject:
-            deal.subject = subject
-            deal.save()
 
-        #  Save AI-generated reply if provided
-        ai_reply = data.get("ai_generated_reply", "")
-        if ai_reply:
-            deal.ai_generated_reply = ai_reply
-            deal.save()
+#  BULK SAVE EMAILS (n8n backfill / burst entry point)
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
 
-        #  Create EmailMessage linked to the Deal
-        email_message = EmailMessage.objects.create(
-            deal=deal,
-            direction=direction,
-            subject=subject,
-            body=body,
-            from_email=from_email,
-            to_email=to_email,
-        )
 
-        # 5️Update Deal status based on direction:
-        # - OUTGOING (we replied with AI) → WAITING_FOR_CLIENT (waiting for client response)
-        # - INCOMING (client replied) → PENDING_CREATOR (if we were WAITING, meaning it's their 2nd reply)
-        if direction == "OUTGOING":
-            # We replied with AI, so now waiting for client response
-            deal.status = "WAITING_FOR_CLIENT"
-            deal.our_reply_sent_at = timezone.now()
-            deal.updated_at = timezone.now()
-            deal.save()
-        elif direction == "INCOMING":
-            # Client replied - if we were WAITING for their response, move to PENDING
-            # (This means client sent 2nd email after our AI reply)
-            if deal.status == "WAITING_FOR_CLIENT":
-                deal.status = "PENDING_CREATOR"
-                deal.client_replied_at = timezone.now()
-                deal.updated_at = timezone.now()
-                deal.save()
-            # If status is NEW, keep it as NEW (first email, we haven't replied yet)
+class PayloadTooLarge(Exception):
+    pass
+
+
+def _parse_bulk_payload(request, max_items, max_bytes):
+    """
+    Parse a JSON array or an NDJSON stream (one JSON object per line).
+    The body is read from the request stream so large backfills are not
+    rejected by DATA_UPLOAD_MAX_MEMORY_SIZE; BULK_INGEST_MAX_BYTES and
+    BULK_INGEST_MAX_ITEMS bound it instead. NDJSON is parsed line by line
+    and reading stops as soon as either limit is passed.
+    Raises PayloadTooLarge, or ValueError for malformed JSON.
+    """
+    try:
+        declared = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        declared = 0
+    if declared > max_bytes:
+        raise PayloadTooLarge(f"Request body is {declared} bytes. Maximum is {max_bytes}.")
+
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        items = []
+        size = 0
+        for line in request:
+            size += len(line)
+            if size > max_bytes:
+                raise PayloadTooLarge(f"Request body is over {max_bytes} bytes.")
+            if line.strip():
+                items.append(json.loads(line))
+                if len(items) > max_items:
+                    raise PayloadTooLarge(f"Too many emails in one request. Maximum is {max_items}.")
+        return items
+
+    # Without a declared length (chunked uploads) read one byte past the limit to detect overflow
+    raw = request.read(max_bytes + 1)
+    if len(raw) > max_bytes:
+        raise PayloadTooLarge(f"Request body is over {max_bytes} bytes.")
+    if raw.lstrip()[:1] == b"[":
+        items = json.loads(raw)
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array.")
+    else:
+        items = [json.loads(line) for line in raw.splitlines() if line.strip()]
+    if len(items) > max_items:
+        raise PayloadTooLarge(f"Too many emails in one request ({len(items)}). Maximum is {max_items}.")
+    return items
+
+
+@csrf_exempt
+def save_emails(request):
+    """
+    Bulk variant of save_email for n8n.
+    POST /api/save-emails/ with either:
+    - a JSON array of save_email payloads, or
+    - NDJSON (Content-Type: application/x-ndjson), one payload per line
 
+    Every item is validated independently; the response lists one result per
+    item in input order with the same fields save_email returns, or an error.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed. Use POST."}, status=405)
+
+    max_items = getattr(settings, "BULK_INGEST_MAX_ITEMS", 10000)
+    max_bytes = getattr(settings, "BULK_INGEST_MAX_BYTES", 50 * 1024 * 1024)
+    try:
+        items = _parse_bulk_payload(request, max_items, max_bytes)
+    except PayloadTooLarge as e:
+        return JsonResponse({"error": str(e)}, status=413)
+    except (json.JSONDecodeError, ValueError):
         return JsonResponse({
-            "status": "success",
-            "deal_id": deal.id,
-            "deal_created": deal_created,
-            "email_message_id": email_message.id,
-            "deal_status": deal.status
-        }, status=201)
+            "error": "Invalid JSON. Send a JSON array or NDJSON (one object per line)."
+        }, status=400)
+
+    if not items:
+        return JsonResponse({"error": "No emails provided."}, status=400)
 
+    try:
+        results = ingest_emails(items)
     except Exception as e:
         return JsonResponse({
             "error": f"Server error: {str(e)}"
         }, status=500)
 
+    saved = sum(1 for result in results if result["status"] == "success")
+    return JsonResponse({
+        "status": "success",
+        "saved": saved,
+        "failed": len(results) - saved,
+        "results": results,
+    }, status=201)
+
 
 #  DASHBOARD
 @login_required
 def dashboard(request):
-    deals = Deal.objects.all().order_by("-created_at")
-
-    stats = {
-        "NEW": deals.filter(status="NEW").count(),
-        "WAITING_FOR_CLIENT": deals.filter(status="WAITING_FOR_CLIENT").count(),
-        "PENDING_CREATOR": deals.filter(status="PENDING_CREATOR").count(),
-        "COMPLETED": deals.filter(status="COMPLETED").count(),
-        "REJECTED": deals.filter(status="REJECTED").count(),
-        "AUTO_REJECTED": deals.filter(status="AUTO_REJECTED").count(),
-    }
+    # A search shows the best-matching deals instead of the newest ones
+    query = request.GET.get("q", "").strip()
+    cursor = request.GET.get("cursor")
+    if query:
+        deals, next_cursor, cursor = search_deals(query), None, None
+    else:
+        # One keyset page of deals; an invalid or stale cursor falls back to the first page
+        try:
+            deals, next_cursor = deal_page(cursor=cursor)
+        except ValueError:
+            cursor = None
+            deals, next_cursor = deal_page()
+
+    stats = deal_status_totals()
     
     # Status colors for badge styling
     status_colors = {
@@ -171,7 +237,11 @@ def dashboard(request):
 
     return render(request, "deals/dashboard.html", {
         "deals": deals,
+        "query": query,
+        "next_cursor": next_cursor,
+        "is_first_page": not cursor,
         "stats": stats,
+        "total_deals": sum(stats.values()),
         "status_colors": status_colors
     })
 
@@ -179,8 +249,10 @@ def dashboard(request):
 # DEAL DETAIL
 @login_required
 def deal_detail(request, deal_id):
-    deal = get_object_or_404(Deal, id=deal_id)
-    messages_qs = deal.emails.all().order_by("created_at")
+    deal = get_object_or_404(Deal.objects.select_related("client"), id=deal_id)
+    # The newest page of the thread, as previews; older pages and full
+    # bodies are fetched by the page from deal_emails / email_body
+    email_messages, older_cursor = thread_page(deal)
     
     # Show Accept/Reject buttons if status is NEW or PENDING_CREATOR
     can_accept_reject = deal.status in ["NEW", "PENDING_CREATOR"]
@@ -197,65 +269,89 @@ def deal_detail(request, deal_id):
 
     return render(request, "deals/deal_detail.html", {
         "deal": deal,
-        "email_messages": messages_qs,
+        "email_messages": email_messages,
+        "older_cursor": older_cursor,
+        # Empty cards the page fills in for older messages
+        "message_templates": [{"direction": direction} for direction, _ in EmailMessage.DIRECTION_CHOICES],
         "can_accept_reject": can_accept_reject,
         "status_colors": status_colors
     })
 
 
-# ACCEPT DEAL
+def _thread_email_json(email):
+    return {
+        "id": email.id,
+        "direction": email.direction,
+        "subject": email.subject,
+        "from_email": email.from_email,
+        "to_email": email.to_email,
+        "created_at": email.created_at.isoformat(),
+        "preview": email.preview,
+        "truncated": email.truncated,
+    }
+
+
+# DEAL THREAD PAGES (JSON)
 @login_required
-@require_POST
-def accept_deal(request, deal_id):
-    deal = get_object_or_404(Deal, id=deal_id)
+@require_GET
+def deal_emails(request, deal_id):
+    """
+    A page of a deal's thread for the deal page, oldest first.
+    GET /deal/<deal_id>/emails/?before=<older_cursor>&limit=20
 
-    deal.status = "COMPLETED"
-    deal.updated_at = timezone.now()
-    deal.save()
+    - before (optional) - `older_cursor` from the page or the previous call
+    - limit (optional) - emails per page, capped at 100
 
-    # Trigger n8n webhook
-    if hasattr(settings, "N8N_WEBHOOK_URL") and settings.N8N_WEBHOOK_URL:
-        try:
-            requests.post(settings.N8N_WEBHOOK_URL, json={
-                "action": "accept",
-                "thread_id": deal.thread_id,
-                "deal_id": deal.id,
-                "ai_reply": deal.ai_generated_reply,
-                "from_email": deal.client.email
-            }, timeout=5)
-        except Exception as e:
-            # Log error but don't fail the request
-            print(f"Failed to send webhook: {e}")
-
-    # Send acceptance email to client (SMTP)
+    Returns {"results": [...], "older_cursor": "..."}; older_cursor is null
+    at the start of the thread. Bodies are previews: fetch the full text of
+    `truncated` ones from email_body.
+    """
+    deal = get_object_or_404(Deal.objects.only("id"), id=deal_id)
     try:
-        sanitized_subject = _sanitize_header(deal.subject)
-        subject = f"Congratulations — your deal '{sanitized_subject}' is complete"
-        plain_body = (
-            f"Hello {deal.client.brand_name or deal.client.email},\n\n"
-            f"Congratulations! Your deal titled '{deal.subject}' has been completed successfully.\n\n"
-            "Thank you for working with us.\n\n"
-            "Best regards,\n"
-            "The Team"
-        )
-        html_body = (
-            f"<p>Hello {deal.client.brand_name or deal.client.email},</p>"
-            f"<p>Congratulations! Your deal titled <strong>{deal.subject}</strong> has been completed successfully.</p>"
-            "<p>Thank you for working with us.</p>"
-            "<p>Best regards,<br/>The Team</p>"
-        )
+        limit = int(request.GET.get("limit", THREAD_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
 
-        from_email = settings.DEFAULT_FROM_EMAIL
-        # Check if email credentials are configured
-        if not settings.EMAIL_HOST_USER or not settings.EMAIL_HOST_PASSWORD:
-            raise Exception("Email credentials not configured. Set EMAIL_HOST_USER and EMAIL_HOST_PASSWORD environment variables.")
-        
-        msg = EmailMultiAlternatives(subject=subject, body=plain_body, from_email=from_email, to=[deal.client.email])
-        msg.attach_alternative(html_body, "text/html")
-        msg.send(fail_silently=False)
-    except Exception as e:
-        messages.error(request, f"Failed to send acceptance email: {str(e)}")
-        print(f"Failed to send acceptance email: {e}")
+    try:
+        emails, older_cursor = thread_page(deal, before=request.GET.get("before"), limit=limit)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    return JsonResponse({
+        "results": [_thread_email_json(email) for email in emails],
+        "older_cursor": older_cursor,
+    })
+
+
+@login_required
+@require_GET
+def email_body(request, deal_id, email_id):
+    """
+    The full body of one email of a deal.
+    GET /deal/<deal_id>/emails/<email_id>/ -> {"id": ..., "body": "..."}
+    """
+    email = get_object_or_404(
+        EmailMessage.objects.select_related("body_blob").only("id", "inline_body", "body_blob__data"),
+        id=email_id, deal_id=deal_id,
+    )
+    return JsonResponse({"id": email.id, "body": email.body})
+
+
+# ACCEPT DEAL
+@login_required
+@require_POST
+def accept_deal(request, deal_id):
+    deal = get_object_or_404(Deal.objects.select_related("client"), id=deal_id)
+
+    # Status change, n8n webhook and acceptance email are committed together;
+    # the process_outbox worker delivers the side effects.
+    with transaction.atomic():
+        old_status = deal.status
+        deal.status = "COMPLETED"
+        deal.save(update_fields=["status", "updated_at"])
+        record_deal_events(transitions=[(old_status, deal.status)])
+        enqueue_webhook(deal, "accept")
+        enqueue_acceptance_email(deal)
 
     messages.success(request, "Deal accepted")
     return redirect("deal_detail", deal_id=deal.id)
@@ -265,57 +361,17 @@ def accept_deal(request, deal_id):
 @login_required
 @require_POST
 def reject_deal(request, deal_id):
-    deal = get_object_or_404(Deal, id=deal_id)
-
-    deal.status = "REJECTED"
-    deal.updated_at = timezone.now()
-    deal.save()
-
-    # Trigger n8n webhook
-    if hasattr(settings, "N8N_WEBHOOK_URL") and settings.N8N_WEBHOOK_URL:
-        try:
-            requests.post(settings.N8N_WEBHOOK_URL, json={
-                "action": "reject",
-                "thread_id": deal.thread_id,
-                "deal_id": deal.id,
-                "ai_reply": deal.ai_generated_reply,
-                "from_email": deal.client.email
-            }, timeout=5)
-        except Exception as e:
-            # Log error but don't fail the request
-            print(f"Failed to send webhook: {e}")
-
-    # Send polite rejection email to client (SMTP)
-    try:
-        sanitized_subject = _sanitize_header(deal.subject)
-        subject = f"Update on your deal '{sanitized_subject}'"
-        plain_body = (
-            f"Hello {deal.client.brand_name or deal.client.email},\n\n"
-            "Thank you for reaching out and for your interest in collaborating with us. "
-            "After careful consideration, we regret to inform you that we are unable to proceed with this collaboration at this time.\n\n"
-            "We appreciate your understanding and hope we can work together on future opportunities.\n\n"
-            "Best regards,\n"
-            "The Team"
-        )
-        html_body = (
-            f"<p>Hello {deal.client.brand_name or deal.client.email},</p>"
-            "<p>Thank you for reaching out and for your interest in collaborating with us. "
-            "After careful consideration, we regret to inform you that we are unable to proceed with this collaboration at this time.</p>"
-            "<p>We appreciate your understanding and hope we can work together on future opportunities.</p>"
-            "<p>Best regards,<br/>The Team</p>"
-        )
-
-        from_email = settings.DEFAULT_FROM_EMAIL
-        # Check if email credentials are configured
-        if not settings.EMAIL_HOST_USER or not settings.EMAIL_HOST_PASSWORD:
-            raise Exception("Email credentials not configured. Set EMAIL_HOST_USER and EMAIL_HOST_PASSWORD environment variables.")
-        
-        msg = EmailMultiAlternatives(subject=subject, body=plain_body, from_email=from_email, to=[deal.client.email])
-        msg.attach_alternative(html_body, "text/html")
-        msg.send(fail_silently=False)
-    except Exception as e:
-        messages.error(request, f"Failed to send rejection email: {str(e)}")
-        print(f"Failed to send rejection email: {e}")
+    deal = get_object_or_404(Deal.objects.select_related("client"), id=deal_id)
+
+    # Status change, n8n webhook and rejection email are committed together;
+    # the process_outbox worker delivers the side effects.
+    with transaction.atomic():
+        old_status = deal.status
+        deal.status = "REJECTED"
+        deal.save(update_fields=["status", "updated_at"])
+        record_deal_events(transitions=[(old_status, deal.status)])
+        enqueue_webhook(deal, "reject")
+        enqueue_rejection_email(deal)
 
     messages.success(request, "Deal rejected")
     return redirect("deal_detail", deal_id=deal.id)
@@ -367,17 +423,26 @@ def logout_view(request):
 
 #  CHECK DEAL EXISTS
 @csrf_exempt
-@require_GET
+@require_http_methods(["GET", "POST"])
 def check_deal_exists(request):
     """
-    API endpoint to check if a deal exists based on thread_id.
+    API endpoint to check if deals exist based on thread_id.
+
+    Single:
     GET /api/deals/check/?thread_id=<thread_id>
-    
-    Returns:
         - {"exists": true} if deal exists
         - {"exists": false} if deal does not exist
         - {"error": "thread_id parameter is required"} if thread_id is missing
+
+    Batch (one round trip for a whole inbox poll):
+    POST /api/deals/check/ with {"thread_ids": ["id1", "id2", ...]}
+        - {"exists": {"id1": true, "id2": false, ...}}
+
+    Answers come from an in-process cache of known threads where possible.
     """
+    if request.method == "POST":
+        return _check_deals_exist_batch(request)
+
     thread_id = request.GET.get("thread_id")
     
     if not thread_id:
@@ -385,13 +450,159 @@ def check_deal_exists(request):
             "error": "thread_id parameter is required"
         }, status=400)
     
-    exists = Deal.objects.filter(thread_id=thread_id).exists()
+    exists = threads_exist([thread_id])[thread_id]
     
     return JsonResponse({
         "exists": exists
     })
 
 
+def _check_deals_exist_batch(request):
+    try:
+        data = json.loads(request.body)
+    except (json.JSONDecodeError, ValueError):
+        return JsonResponse({
+            "error": "Invalid JSON. Please send JSON data only."
+        }, status=400)
+
+    thread_ids = data.get("thread_ids") if isinstance(data, dict) else None
+    if not isinstance(thread_ids, list) or not all(isinstance(t, str) and t for t in thread_ids):
+        return JsonResponse({
+            "error": "thread_ids must be a list of non-empty strings"
+        }, status=400)
+
+    max_items = getattr(settings, "BULK_INGEST_MAX_ITEMS", 10000)
+    if len(thread_ids) > max_items:
+        return JsonResponse({
+            "error": f"Too many thread_ids in one request ({len(thread_ids)}). Maximum is {max_items}."
+        }, status=413)
+
+    return JsonResponse({
+        "exists": threads_exist(thread_ids)
+    })
+
+
+#  LIST DEALS (JSON)
+@login_required
+@require_GET
+def list_deals(request):
+    """
+    API endpoint listing deals newest first with cursor pagination.
+    GET /api/deals/?status=NEW&status=PENDING_CREATOR&limit=50&cursor=<next_cursor>
+
+    - status (optional, repeatable or comma separated) - filter by status
+    - limit (optional) - page size, capped at 200
+    - cursor (optional) - `next_cursor` from the previous page
+
+    Returns {"results": [...], "next_cursor": "..."}; next_cursor is null on the last page.
+    """
+    statuses = [
+        status.strip().upper()
+        for value in request.GET.getlist("status")
+        for status in value.split(",")
+        if status.strip()
+    ]
+    valid_statuses = [choice[0] for choice in Deal.STATUS_CHOICES]
+    invalid = [status for status in statuses if status not in valid_statuses]
+    if invalid:
+        return JsonResponse({
+            "error": f"Invalid status: {', '.join(invalid)}"
+        }, status=400)
+
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+
+    queryset = Deal.objects.all()
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+
+    try:
+        deals, next_cursor = deal_page(queryset, cursor=request.GET.get("cursor"), limit=limit)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    return JsonResponse({
+        "results": [
+            {
+                "id": deal.id,
+                "thread_id": deal.thread_id,
+                "subject": deal.subject,
+                "status": deal.status,
+                "client_email": deal.client.email,
+                "brand_name": deal.client.brand_name,
+                "created_at": deal.created_at.isoformat(),
+                "updated_at": deal.updated_at.isoformat(),
+            }
+            for deal in deals
+        ],
+        "next_cursor": next_cursor,
+    })
+
+
+#  SEARCH EMAILS (JSON)
+@login_required
+@require_GET
+def search(request):
+    """
+    Full-text search over email subjects and bodies, best matches first.
+    GET /api/search/?q=sponsored+video&type=emails&limit=20
+
+    - q (required) - words to search for; all must match, the last one as a prefix
+    - type (optional) - "emails" (default) or "deals" (one result per deal, scored by its best email)
+    - limit (optional) - number of results, capped at 100
+
+    Returns {"query": "...", "type": "...", "results": [...]}.
+    """
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({"error": "q is required"}, status=400)
+
+    kind = request.GET.get("type", "emails")
+    if kind not in ("emails", "deals"):
+        return JsonResponse({"error": "type must be 'emails' or 'deals'"}, status=400)
+
+    try:
+        limit = int(request.GET.get("limit", 20))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    if kind == "deals":
+        results = [
+            {
+                "deal_id": deal.id,
+                "thread_id": deal.thread_id,
+                "subject": deal.subject,
+                "status": deal.status,
+                "client_email": deal.client.email,
+                "brand_name": deal.client.brand_name,
+                "snippet": deal.snippet,
+                "score": deal.score,
+            }
+            for deal in search_deals(query, limit)
+        ]
+    else:
+        results = [
+            {
+                "email_id": email.id,
+                "deal_id": email.deal_id,
+                "deal_status": email.deal.status,
+                "direction": email.direction,
+                "subject": email.subject,
+                "from_email": email.from_email,
+                "to_email": email.to_email,
+                "created_at": email.created_at.isoformat(),
+                "snippet": email.snippet,
+                "score": email.score,
+            }
+            for email in search_emails(query, limit)
+        ]
+
+    return JsonResponse({"query": query, "type": kind, "results": results})
+
+
 #  SAVE DASHBOARD DEAL (Manual Deal Creation)
 @csrf_exempt
 def save_dashboard_deal(request):
@@ -462,6 +673,7 @@ def save_dashboard_deal(request):
             from_email=from_email,
             to_email=to_email
         )
+        record_deal_events(["INCOMING"], [(None, deal.status)])
 
         return JsonResponse({
             "status": "success",
@@ -0,0 +1,189 @@
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import WEBHOOK_FAILURES, WEBHOOK_LATENCY
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling out while the breaker is open (n8n considered down)."""
+
+    def __init__(self, retry_in):
+        self.retry_in = retry_in
+        super().__init__("n8n webhook circuit is open; skipping call")
+
+
+class WebhookError(Exception):
+    """The webhook call failed after all retries."""
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker. After `threshold` consecutive failed calls it
+    opens for `reset_seconds`; the first call after that is a trial (half-open)
+    which closes the breaker on success or re-opens it on failure.
+    """
+
+    def __init__(self, threshold=5, reset_seconds=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self._state() == "open":
+                raise CircuitOpenError(self.opened_at + self.reset_seconds - self.clock())
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state() == "half-open" or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+
+class WebhookClient:
+    """
+    Shared HTTP client for the n8n webhook.
+
+    Uses one pooled, keep-alive requests.Session, retries connection errors,
+    timeouts, 429 and 5xx responses with jittered exponential backoff, and
+    stops calling n8n altogether while the circuit breaker is open.
+    Per-attempt latency is kept for the last `latency_window` calls.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_size=10, timeout=5.0, retries=2, backoff_seconds=0.5,
+                 breaker=None, latency_window=1000, sleep=time.sleep):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.latencies = deque(maxlen=latency_window)
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def _record(self, started, ok):
+        elapsed = time.perf_counter() - started
+        WEBHOOK_LATENCY.labels("ok" if ok else "error").observe(elapsed)
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+
+    def _backoff(self, attempt):
+        # Full jitter: anywhere between 0 and base * 2^attempt
+        return random.uniform(0, self.backoff_seconds * 2 ** attempt)
+
+    def post(self, url, payload):
+        """POST `payload` as JSON. Returns the response or raises WebhookError / CircuitOpenError."""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            WEBHOOK_FAILURES.labels("circuit_open").inc()
+            raise
+
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.sleep(self._backoff(attempt - 1))
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(started, ok=False)
+                last_error = e
+                continue
+
+            if response.status_code in self.RETRY_STATUSES:
+                self._record(started, ok=False)
+                last_error = WebhookError(f"n8n webhook returned HTTP {response.status_code}")
+                continue
+
+            self._record(started, ok=response.ok)
+            if not response.ok:
+                # Client errors won't get better on retry and don't mean n8n is down
+                self.breaker.record_success()
+                WEBHOOK_FAILURES.labels("error").inc()
+                raise WebhookError(f"n8n webhook returned HTTP {response.status_code}")
+            self.breaker.record_success()
+            return response
+
+        self.breaker.record_failure()
+        WEBHOOK_FAILURES.labels("error").inc()
+        raise WebhookError(f"n8n webhook failed after {self.retries + 1} attempts: {last_error}")
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            calls, failures = self.calls, self.failures
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "calls": calls,
+            "failures": failures,
+            "breaker": self.breaker.state,
+            "latency_p50": percentile(0.50),
+            "latency_p95": percentile(0.95),
+            "latency_p99": percentile(0.99),
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_webhook_client():
+    """Process-wide WebhookClient configured from the N8N_WEBHOOK_* settings."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WebhookClient(
+                pool_size=getattr(settings, "N8N_WEBHOOK_POOL_SIZE", 10),
+                timeout=getattr(settings, "N8N_WEBHOOK_TIMEOUT", 5.0),
+                retries=getattr(settings, "N8N_WEBHOOK_RETRIES", 2),
+                backoff_seconds=getattr(settings, "N8N_WEBHOOK_BACKOFF_SECONDS", 0.5),
+                breaker=CircuitBreaker(
+                    threshold=getattr(settings, "N8N_WEBHOOK_BREAKER_THRESHOLD", 5),
+                    reset_seconds=getattr(settings, "N8N_WEBHOOK_BREAKER_RESET_SECONDS", 30.0),
+                ),
+            )
+        return _client
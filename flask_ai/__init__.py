@@ -0,0 +1,7 @@
+"""
+Flask AI service: email classification and reply drafting.
+
+Run it from the repository root with `python -m flask_ai.app` (debug server)
+or `python -m flask_ai.serve` (production). The Django backend imports the
+same modules as a library (flask_ai.pipeline).
+"""
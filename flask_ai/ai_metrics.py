@@ -0,0 +1,42 @@
+"""
+Prometheus metrics for the Flask AI service, served at /metrics.
+
+Under gunicorn (serve.py) set PROMETHEUS_MULTIPROC_DIR to an empty, writable
+directory: each worker writes its values to its own memory-mapped file and
+/metrics sums all of them at scrape time.
+"""
+
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+
+HTTP_REQUESTS = Counter(
+    "ai_http_requests_total", "HTTP requests by URL rule, method and status code.",
+    ["route", "method", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "ai_http_request_duration_seconds", "HTTP request latency by URL rule and method.",
+    ["route", "method"], buckets=LATENCY_BUCKETS,
+)
+CLASSIFY_BATCH_SIZE = Histogram(
+    "ai_classifier_batch_size", 'Bodies per classify call, by model ("text" or "keyword").',
+    ["model"], buckets=BATCH_BUCKETS,
+)
+CLASSIFY_LATENCY = Histogram(
+    "ai_classifier_duration_seconds", "Time to classify one batch (cache lookups included), by model.",
+    ["model"], buckets=LATENCY_BUCKETS,
+)
+
+
+def metrics_payload():
+    """(body, content type) for /metrics: this process, or every worker in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,7 +1,63 @@
-from flask import Flask, request, jsonify
+import json
+import os
+import time
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+
+from .ai_metrics import HTTP_LATENCY, HTTP_REQUESTS, metrics_payload
+from .pipeline import EmailPipeline
 
 app = Flask(__name__)
 
+# Classifier, reply templates and result caches live in one EmailPipeline
+# (pipeline.py), built once at startup. The same class can be imported by the
+# Django backend to run the pipeline in-process.
+#
+# CLASSIFIER_RULES: JSON keyword rules ({"threshold": ..., "terms": {...},
+#   "negative_terms": {...}}) instead of the built-in ones.
+# TEXT_MODEL_PATH: trained TF-IDF model (`python manage.py train_classifier` in
+#   backend/). Its arrays are memory-mapped, so all workers share one copy, and
+#   a newly trained version is picked up within MODEL_CHECK_INTERVAL seconds
+#   without a restart. The keyword rules are used until a model exists.
+# REPLY_TEMPLATES: JSON reply templates ({"name": {"text": "... {currency}{min_price} ...",
+#   "decision": ...}}); REPLY_DEFAULT_TEMPLATE picks the default one.
+# RESULT_CACHE_SIZE / RESULT_CACHE_TTL: LRU cache of results keyed by a hash of
+#   the normalized body, the parameters and the model / template version.
+pipeline = EmailPipeline.from_settings(
+    classifier_rules=os.environ.get("CLASSIFIER_RULES"),
+    text_model_path=os.environ.get(
+        "TEXT_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "text_model")
+    ),
+    model_check_interval=float(os.environ.get("MODEL_CHECK_INTERVAL", 1.0)),
+    reply_templates=os.environ.get("REPLY_TEMPLATES"),
+    default_template=os.environ.get("REPLY_DEFAULT_TEMPLATE", "counter_offer"),
+    cache_size=int(os.environ.get("RESULT_CACHE_SIZE", 10000)),
+    cache_ttl=float(os.environ.get("RESULT_CACHE_TTL", 600)),
+)
+
+# Maximum number of bodies accepted by one batch request
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 10000))
+
+# Items scored per step by the NDJSON streaming endpoints; each step's results
+# are flushed to the client before the next one starts.
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 256))
+
+# request count and latency per URL rule, for /metrics
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    started = g.get("started")
+    if started is not None:
+        HTTP_LATENCY.labels(route, request.method).observe(time.perf_counter() - started)
+    return response
+
+
 # root route
 @app.route("/", methods=["GET"])
 def index():
@@ -13,41 +69,168 @@ def health():
     return jsonify({"status": "Flask AI running"})
 
 
+# result cache hit / miss counters
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify(pipeline.stats())
+
+
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    body, content_type = metrics_payload()
+    return Response(body, content_type=content_type)
+
+
 # classify email
 @app.route("/classify_email", methods=["POST"])
 def classify_email():
     data = request.get_json()
-    body = data.get("body", "").lower()
+    results, model = pipeline.classify_many([data.get("body", "")])
 
-    if "collab" in body or "sponsor" in body:
-        category = "useful"
-    else:
-        category = "spam"
+    return jsonify({"category": results[0]["category"], "score": results[0]["score"], "model": model})
 
-    return jsonify({"category": category})
+
+# classify many emails in one call
+@app.route("/classify_batch", methods=["POST"])
+def classify_batch():
+    data = request.get_json(silent=True) or {}
+    bodies = data.get("bodies")
+
+    if not isinstance(bodies, list) or not all(isinstance(body, str) for body in bodies):
+        return jsonify({"error": "bodies must be a list of strings"}), 400
+    if len(bodies) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Too many bodies ({len(bodies)}). Maximum is {MAX_BATCH_SIZE}."}), 413
+
+    results, model = pipeline.classify_many(bodies)
+    return jsonify({"results": results, "model": model})
 
 
 # generate reply
 @app.route("/generate_reply", methods=["POST"])
 def generate_reply():
     data = request.get_json()
-    min_price = data.get("min_price", 5000)
+    result = pipeline.render_replies([data])[0]
+
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+
+# generate many replies in one call
+@app.route("/generate_reply_batch", methods=["POST"])
+def generate_reply_batch():
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({"error": "items must be a list of objects"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Too many items ({len(items)}). Maximum is {MAX_BATCH_SIZE}."}), 413
+
+    return jsonify({"results": pipeline.render_replies(items)})
+
+
+#  NDJSON STREAMING
+#
+# POST one JSON value per line (Content-Type: application/x-ndjson), or a JSON
+# object with the usual "bodies" / "items" list. Input is read lazily and
+# results come back as NDJSON, {"index": n, ...} per item in input order,
+# flushed every STREAM_CHUNK_SIZE items, so there is no batch size limit. A
+# chunk the pipeline fails on gets {"index": n, "error": "Server error: ..."}
+# lines, and the stream goes on.
+
+def _stream_input(field):
+    """Return an iterator over the request's items, or None if a JSON body is malformed."""
+    if request.mimetype == "application/json":
+        items = (request.get_json(silent=True) or {}).get(field)
+        return iter(items) if isinstance(items, list) else None
+
+    def lines():
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield ValueError("invalid JSON line")
+    return lines()
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ndjson_response(items, process_chunk):
+    """Stream process_chunk(chunk) -> [result] over `items` as NDJSON lines."""
+    def generate():
+        index = 0
+        for chunk in _chunks(items, STREAM_CHUNK_SIZE):
+            try:
+                results = process_chunk(chunk)
+            except Exception as e:
+                # The 200 status is already sent: fail this chunk's items on
+                # their own lines and carry on with the next chunk
+                app.logger.exception("Stream chunk of %d items failed", len(chunk))
+                results = [{"error": f"Server error: {e}"}] * len(chunk)
+            lines = []
+            for result in results:
+                lines.append(json.dumps({"index": index, **result}, ensure_ascii=False) + "\n")
+                index += 1
+            yield "".join(lines)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def _classify_chunk(chunk):
+    bodies, errors = [], {}
+    for position, item in enumerate(chunk):
+        body = item.get("body", "") if isinstance(item, dict) else item
+        if isinstance(body, str):
+            bodies.append(body)
+        else:
+            errors[position] = str(item) if isinstance(item, ValueError) else "body must be a string"
+    results, model = pipeline.classify_many(bodies) if bodies else ([], None)
+    results = iter(results)
+    return [
+        {"error": errors[position]} if position in errors else {**next(results), "model": model}
+        for position in range(len(chunk))
+    ]
+
+
+def _reply_chunk(chunk):
+    valid = [item for item in chunk if isinstance(item, dict)]
+    results = iter(pipeline.render_replies(valid))
+    return [
+        next(results) if isinstance(item, dict)
+        else {"error": str(item) if isinstance(item, ValueError) else "item must be an object"}
+        for item in chunk
+    ]
 
-    reply = f"""
-Hi,
 
-Thanks for reaching out for collaboration.
-Our standard collaboration fee starts from ₹{min_price}.
-Please let us know if this works for you.
+# classify emails, streaming results
+@app.route("/classify_stream", methods=["POST"])
+def classify_stream():
+    items = _stream_input("bodies")
+    if items is None:
+        return jsonify({"error": "bodies must be a list"}), 400
+    return _ndjson_response(items, _classify_chunk)
 
-Regards,
-Influencer
-"""
 
-    return jsonify({
-        "reply": reply.strip(),
-        "decision": "counter_offer"
-    })
+# generate replies, streaming results
+@app.route("/generate_reply_stream", methods=["POST"])
+def generate_reply_stream():
+    items = _stream_input("items")
+    if items is None:
+        return jsonify({"error": "items must be a list"}), 400
+    return _ndjson_response(items, _reply_chunk)
 
 
 if __name__ == "__main__":
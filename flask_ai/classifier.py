@@ -0,0 +1,161 @@
+"""
+Keyword / phrase email classifier.
+
+All configured terms are compiled into one Aho-Corasick automaton, which
+reports every term occurring in a body (including overlapping and nested
+ones: "sponsorship" matches both "sponsor" and "sponsorship") in a single
+pass whose cost does not depend on how many terms there are. Terms match
+case-insensitively as substrings, like the original `"collab" in body`
+checks.
+
+Terms without whitespace can't span a space, so bodies are split into
+whitespace-separated tokens and each distinct token is run through the
+automaton once and remembered: email vocabulary repeats, so most tokens are
+answered by a set lookup. Terms containing whitespace (phrases) are matched
+by running the automaton over the whole body.
+"""
+
+import json
+from collections import deque
+
+
+DEFAULT_RULES = {
+    # Score >= threshold → "useful", otherwise "spam"
+    "threshold": 1.0,
+    # term → weight; each distinct term counts once per email
+    "terms": {
+        "collab": 1.0,
+        "sponsor": 1.0,
+    },
+    # Terms that pull the score down (weights are subtracted)
+    "negative_terms": {},
+}
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher: find(text) returns every term in text."""
+
+    def __init__(self, terms):
+        # Trie of the terms; state 0 is the root
+        self._goto = [{}]
+        self._output = [()]
+        for term in terms:
+            state = 0
+            for char in term:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (term,)
+
+        # Failure links, breadth first: the longest proper suffix of each
+        # state's path that is also a trie path. A state also outputs every
+        # term ending at its failure state (the terms nested at its end).
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+                queue.append(next_state)
+
+    def find(self, text):
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class TermMatcher:
+    """
+    Every term occurring in a text. Results for single tokens are kept in a
+    bounded in-process memo (started afresh when it reaches `memo_size`
+    tokens; replaced rather than cleared, so concurrent lookups stay valid).
+    """
+
+    def __init__(self, terms, memo_size=200000):
+        terms = [term for term in terms if term]
+        self.memo_size = memo_size
+        self._words = AhoCorasick([term for term in terms if term.split() == [term]])
+        phrases = [term for term in terms if term.split() != [term]]
+        self._phrases = AhoCorasick(phrases) if phrases else None
+        # token -> terms in it, and tokens known to contain none
+        self._token_terms = {}
+        self._plain_tokens = set()
+
+    def find(self, text):
+        tokens = set(text.split())
+        found = set()
+        token_terms, plain_tokens = self._token_terms, self._plain_tokens
+        for token in tokens.intersection(token_terms):
+            found.update(token_terms[token])
+        unseen = tokens.difference(plain_tokens, token_terms)
+        if unseen:
+            found.update(self._remember(unseen))
+        if self._phrases is not None:
+            found.update(self._phrases.find(text))
+        return found
+
+    def _remember(self, tokens):
+        if len(self._token_terms) + len(self._plain_tokens) + len(tokens) > self.memo_size:
+            self._token_terms, self._plain_tokens = {}, set()
+        token_terms, plain_tokens = self._token_terms, self._plain_tokens
+        found = set()
+        for token in tokens:
+            terms = self._words.find(token)
+            if terms:
+                token_terms[token] = tuple(terms)
+                found.update(terms)
+            else:
+                plain_tokens.add(token)
+        return found
+
+
+class KeywordClassifier:
+    def __init__(self, terms, negative_terms=None, threshold=1.0):
+        self.threshold = float(threshold)
+        self.weights = {term.lower(): float(weight) for term, weight in terms.items()}
+        for term, weight in (negative_terms or {}).items():
+            self.weights[term.lower()] = -abs(float(weight))
+        self.weights.pop("", None)
+        self.matcher = TermMatcher(self.weights)
+
+    @classmethod
+    def from_rules(cls, rules):
+        return cls(
+            terms=rules.get("terms", {}),
+            negative_terms=rules.get("negative_terms", {}),
+            threshold=rules.get("threshold", 1.0),
+        )
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as fh:
+            return cls.from_rules(json.load(fh))
+
+    def classify(self, body):
+        """Return {"category", "score", "matches"} for one email body."""
+        matches = self.matcher.find(body.lower()) if body else set()
+        score = sum((self.weights[term] for term in matches), 0.0)
+        return {
+            "category": "useful" if score >= self.threshold else "spam",
+            "score": score,
+            "matches": sorted(matches),
+        }
+
+    def classify_many(self, bodies):
+        classify = self.classify
+        return [classify(body) for body in bodies]
@@ -0,0 +1,3 @@
+# test_apis.py is a script against a running server (python test_apis.py),
+# not part of the unit tests
+collect_ignore = ["test_apis.py"]
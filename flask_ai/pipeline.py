@@ -0,0 +1,140 @@
+"""
+Email AI pipeline: classification and reply drafting as a library.
+
+The Flask endpoints are thin wrappers around one EmailPipeline, and the Django
+backend can import the same class (deals/ai.py) to classify and draft replies
+in-process, skipping the HTTP round trips to this service.
+"""
+
+import time
+
+from .ai_metrics import CLASSIFY_BATCH_SIZE, CLASSIFY_LATENCY
+from .classifier import DEFAULT_RULES, KeywordClassifier
+from .reply_templates import DEFAULT_TEMPLATES, TemplateError, TemplateRegistry
+from .result_cache import ResultCache, result_key
+
+
+def load_model_store(path, check_interval=1.0):
+    """ModelStore for a trained text model directory, or None without NumPy."""
+    try:
+        from .text_model import ModelStore
+    except ImportError:
+        return None
+    return ModelStore(path, check_interval=check_interval)
+
+
+class EmailPipeline:
+    """
+    Classifies bodies with the trained text model when one is available (else
+    the keyword rules) and renders replies from the template registry. Results
+    are cached by content hash and invalidated when the model or templates change.
+    """
+
+    def __init__(self, classifier=None, model_store=None, templates=None,
+                 cache_size=10000, cache_ttl=600.0):
+        self.classifier = classifier or KeywordClassifier.from_rules(DEFAULT_RULES)
+        self.model_store = model_store
+        self.templates = templates or TemplateRegistry(DEFAULT_TEMPLATES)
+        self.classify_cache = ResultCache(max_size=cache_size, ttl=cache_ttl)
+        self.reply_cache = ResultCache(max_size=cache_size, ttl=cache_ttl)
+
+    @classmethod
+    def from_settings(cls, classifier_rules=None, text_model_path=None, model_check_interval=1.0,
+                      reply_templates=None, default_template="counter_offer",
+                      cache_size=10000, cache_ttl=600.0):
+        """Build a pipeline from file paths; None means the built-in default."""
+        return cls(
+            classifier=(
+                KeywordClassifier.from_file(classifier_rules) if classifier_rules
+                else KeywordClassifier.from_rules(DEFAULT_RULES)
+            ),
+            model_store=load_model_store(text_model_path, model_check_interval) if text_model_path else None,
+            templates=(
+                TemplateRegistry.from_file(reply_templates, default=default_template) if reply_templates
+                else TemplateRegistry(DEFAULT_TEMPLATES, default=default_template)
+            ),
+            cache_size=cache_size,
+            cache_ttl=cache_ttl,
+        )
+
+    def classify_many(self, bodies):
+        """
+        Classify a batch. Returns (results, model) where model is "text" for
+        the trained model or "keyword" for the rules.
+        """
+        started = time.perf_counter()
+        text_model = self.model_store.get() if self.model_store is not None else None
+        if text_model is not None:
+            model, name, version = text_model, "text", f"text:{text_model.version}"
+        else:
+            model, name, version = self.classifier, "keyword", "keyword"
+        version = self.classify_cache.use_version(version)
+
+        keys = [result_key(body) for body in bodies]
+        found, missing = self.classify_cache.get_many(keys)
+        if missing:
+            # Score each distinct uncached body once, in one vectorised call
+            pending = {}
+            for key, body in zip(keys, bodies):
+                if key not in found:
+                    pending.setdefault(key, body)
+            computed = dict(zip(pending, model.classify_many(list(pending.values()))))
+            self.classify_cache.set_many(computed, version)
+            found.update(computed)
+        CLASSIFY_BATCH_SIZE.labels(name).observe(len(bodies))
+        CLASSIFY_LATENCY.labels(name).observe(time.perf_counter() - started)
+        return [found[key] for key in keys], name
+
+    def render_replies(self, items):
+        """
+        Render one reply per request dict (template, min_price, currency,
+        brand_name, deliverables, body). Invalid items get {"error": ...}.
+        """
+        templates = self.templates
+        version = self.reply_cache.use_version(templates.version)
+
+        keys, prepared = [], []
+        for item in items:
+            try:
+                template, values = templates.prepare(item)
+            except TemplateError as e:
+                keys.append(None)
+                prepared.append({"error": str(e)})
+                continue
+            keys.append(result_key(item.get("body", ""), template=template.name, **values))
+            prepared.append((template, values))
+
+        found, _ = self.reply_cache.get_many([key for key in keys if key is not None])
+        rendered = {}
+        results = []
+        for key, entry in zip(keys, prepared):
+            if key is None:
+                results.append(entry)
+                continue
+            result = found.get(key) or rendered.get(key)
+            if result is None:
+                template, values = entry
+                result = rendered[key] = {"reply": template.render(values), "decision": template.decision}
+            results.append(result)
+        self.reply_cache.set_many(rendered, version)
+        return results
+
+    def process(self, body, reply_params=None):
+        """
+        Classify one incoming email and, if it is useful, draft a reply with
+        `reply_params` (see render_replies). Returns
+        {"category", "score", "model", "reply", "decision"}; reply and
+        decision are None for spam. Raises TemplateError for bad parameters.
+        """
+        results, model = self.classify_many([body])
+        result = {"category": results[0]["category"], "score": results[0]["score"], "model": model,
+                  "reply": None, "decision": None}
+        if result["category"] == "useful":
+            rendered = self.render_replies([{**(reply_params or {}), "body": body}])[0]
+            if "error" in rendered:
+                raise TemplateError(rendered["error"])
+            result.update(rendered)
+        return result
+
+    def stats(self):
+        return {"classify": self.classify_cache.stats(), "reply": self.reply_cache.stats()}
@@ -0,0 +1,157 @@
+"""
+Reply template registry.
+
+Templates are `str.format`-style text ("... from {currency}{min_price}.")
+that are parsed once when the registry is built: each becomes a list of
+literal / variable parts, so rendering is a join with no parsing. Variables
+are typed; request values are checked and converted before rendering, and a
+template may only use the variables declared in VARIABLES.
+"""
+
+import hashlib
+import json
+import math
+import numbers
+import string
+
+
+class TemplateError(ValueError):
+    """Unknown template, bad template text, or a variable of the wrong type."""
+
+
+def _price(value):
+    if isinstance(value, bool):
+        raise TemplateError("min_price must be a number")
+    if isinstance(value, str):
+        try:
+            value = float(value.replace(",", ""))
+        except ValueError:
+            raise TemplateError("min_price must be a number")
+    if not isinstance(value, numbers.Real) or not math.isfinite(value) or value < 0:
+        raise TemplateError("min_price must be a non-negative number")
+    return str(int(value)) if float(value).is_integer() else f"{value:.2f}"
+
+
+def _text(name):
+    def convert(value):
+        if not isinstance(value, str):
+            raise TemplateError(f"{name} must be a string")
+        return value.strip()
+    return convert
+
+
+def _deliverables(value):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise TemplateError("deliverables must be a string or a list of strings")
+    items = [item.strip() for item in value if item.strip()]
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+# variable -> (converter, default)
+VARIABLES = {
+    "min_price": (_price, 5000),
+    "currency": (_text("currency"), "₹"),
+    "brand_name": (_text("brand_name"), "there"),
+    "deliverables": (_deliverables, "the collaboration"),
+}
+
+
+DEFAULT_TEMPLATES = {
+    "counter_offer": {
+        "decision": "counter_offer",
+        "text": (
+            "Hi,\n"
+            "\n"
+            "Thanks for reaching out for collaboration.\n"
+            "Our standard collaboration fee starts from {currency}{min_price}.\n"
+            "Please let us know if this works for you.\n"
+            "\n"
+            "Regards,\n"
+            "Influencer"
+        ),
+    },
+    "counter_offer_detailed": {
+        "decision": "counter_offer",
+        "text": (
+            "Hi {brand_name},\n"
+            "\n"
+            "Thanks for reaching out for collaboration.\n"
+            "For {deliverables}, our fee starts from {currency}{min_price}.\n"
+            "Please let us know if this works for you.\n"
+            "\n"
+            "Regards,\n"
+            "Influencer"
+        ),
+    },
+}
+
+
+class ReplyTemplate:
+    def __init__(self, name, text, decision="counter_offer"):
+        self.name = name
+        self.decision = decision
+        self.parts = []  # (literal, variable or None)
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            raise TemplateError(f"Template {name!r}: {e}")
+        for literal, field, format_spec, conversion in parsed:
+            if field is not None and (field not in VARIABLES or format_spec or conversion):
+                raise TemplateError(f"Template {name!r} uses unknown or formatted variable {{{field}}}")
+            self.parts.append((literal, field))
+        self.variables = sorted({field for _, field in self.parts if field})
+
+    def render(self, values):
+        """Render with already-converted `values` (see TemplateRegistry.prepare)."""
+        return "".join(literal + values[field] if field else literal for literal, field in self.parts)
+
+
+class TemplateRegistry:
+    def __init__(self, templates, default="counter_offer"):
+        self.templates = {
+            name: ReplyTemplate(name, spec["text"], spec.get("decision", "counter_offer"))
+            for name, spec in templates.items()
+        }
+        if default not in self.templates:
+            raise TemplateError(f"Default template {default!r} is not defined")
+        self.default = default
+        # Changes whenever any template changes; used to invalidate cached replies
+        source = json.dumps(templates, sort_keys=True, ensure_ascii=False)
+        self.version = hashlib.blake2b(source.encode("utf-8"), digest_size=8).hexdigest()
+
+    @classmethod
+    def from_file(cls, path, default="counter_offer"):
+        """Load {"name": {"text": ..., "decision": ...}} templates from a JSON file."""
+        with open(path, encoding="utf-8") as fh:
+            return cls(json.load(fh), default=default)
+
+    def get(self, name=None):
+        if name is not None and not isinstance(name, str):
+            raise TemplateError("template must be a string")
+        try:
+            return self.templates[name or self.default]
+        except KeyError:
+            raise TemplateError(f"Unknown template {name!r}")
+
+    def prepare(self, data):
+        """
+        Pick the template named by data["template"] and convert the variables
+        it uses from `data`, falling back to defaults.
+        Returns (template, values); raises TemplateError.
+        """
+        template = self.get(data.get("template"))
+        values = {}
+        for variable in template.variables:
+            convert, default = VARIABLES[variable]
+            value = data.get(variable)
+            values[variable] = convert(default if value is None else value)
+        return template, values
+
+    def render(self, data):
+        """Return {"reply", "decision"} for one request payload."""
+        template, values = self.prepare(data)
+        return {"reply": template.render(values), "decision": template.decision}
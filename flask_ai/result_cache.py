@@ -0,0 +1,108 @@
+"""
+Content-hash result cache for the classify / reply endpoints.
+
+n8n often sends the same body more than once (retries, forwarded threads,
+mass mailings), so results are cached by a hash of the normalized body plus
+the request parameters and the version of the model or template that
+produced them. Changing the version empties the cache, and results computed
+under a version that has since been replaced are not stored.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_body(body):
+    """Case- and whitespace-insensitive form of an email body."""
+    return " ".join((body or "").split()).lower()
+
+
+def result_key(body, **params):
+    """Stable 16-byte key for a normalized body and its parameters."""
+    payload = json.dumps([normalize_body(body), params], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
+
+class ResultCache:
+    """In-process LRU of result_key -> result, with a TTL and hit/miss counters."""
+
+    def __init__(self, max_size=10000, ttl=600.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def use_version(self, version):
+        """
+        Drop every entry if results are now produced by a different model /
+        template version. Returns `version`, to pass on to set_many().
+        """
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self._entries.clear()
+                    self.version = version
+        return version
+
+    def get_many(self, keys):
+        """Return ({key: result} for fresh cached keys, [missing keys])."""
+        now = self.clock()
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.append(key)
+                    self.misses += 1
+        return found, missing
+
+    def get(self, key):
+        """Cached result for `key`, or None."""
+        return self.get_many([key])[0].get(key)
+
+    def set_many(self, values, version=None):
+        """
+        Store results. With `version` (the one the caller looked up under),
+        nothing is stored if the cache has switched to another version since:
+        those results came from the replaced model or templates.
+        """
+        expires = self.clock() + self.ttl
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            for key, result in values.items():
+                self._entries[key] = (result, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def set(self, key, result, version=None):
+        self.set_many({key: result}, version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,95 @@
+"""
+Production server for the Flask AI service.
+
+    pip install -r flask_ai/requirements.txt
+    PROMETHEUS_MULTIPROC_DIR=/tmp/flask_ai_metrics python -m flask_ai.serve
+
+(from the repository root). `python -m flask_ai.app` is Flask's debug server. This runs the same app under
+gunicorn instead: FLASK_AI_WORKERS pre-forked processes (default: one per
+CPU core, since classification is CPU bound), each serving FLASK_AI_THREADS
+requests at once, so concurrent n8n calls spread across cores instead of
+queueing. Trained models are memory-mapped, so extra workers share them.
+
+On SIGTERM / SIGINT workers stop accepting connections and get up to
+FLASK_AI_GRACEFUL_TIMEOUT seconds to finish in-flight requests, including
+NDJSON streams, before they are killed.
+
+/metrics needs PROMETHEUS_MULTIPROC_DIR (an empty, writable directory,
+cleared before each start) to report every worker instead of whichever one
+answered the scrape.
+
+gunicorn needs fork() and doesn't run on Windows. Where it can't be imported
+the app is served by waitress instead (installed by requirements.txt on
+Windows): one process with FLASK_AI_THREADS threads on FLASK_AI_BIND, so the
+worker, timeout and metrics directory settings don't apply.
+
+Settings (environment):
+    FLASK_AI_BIND              host:port (default 0.0.0.0:5000)
+    FLASK_AI_WORKERS           worker processes (default: CPU count)
+    FLASK_AI_THREADS           threads per worker (default 4)
+    FLASK_AI_TIMEOUT           seconds before a stuck worker is restarted (default 120)
+    FLASK_AI_GRACEFUL_TIMEOUT  seconds to drain on shutdown (default 30)
+    PROMETHEUS_MULTIPROC_DIR   shared metrics directory (see above)
+"""
+
+import multiprocessing
+import os
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    # Windows: serve with waitress (see serve_with_waitress)
+    BaseApplication = None
+
+
+class FlaskAIServer(BaseApplication or object):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from .app import app
+        return app
+
+
+def child_exit(server, worker):
+    # Drop a dead worker's live gauges; its counters stay in the totals
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def server_options():
+    return {
+        "bind": os.environ.get("FLASK_AI_BIND", "0.0.0.0:5000"),
+        "workers": int(os.environ.get("FLASK_AI_WORKERS", multiprocessing.cpu_count())),
+        "worker_class": "gthread",
+        "threads": int(os.environ.get("FLASK_AI_THREADS", 4)),
+        "timeout": int(os.environ.get("FLASK_AI_TIMEOUT", 120)),
+        "graceful_timeout": int(os.environ.get("FLASK_AI_GRACEFUL_TIMEOUT", 30)),
+        # Load app.py once in the master; workers fork with rules and templates compiled
+        "preload_app": True,
+        "accesslog": "-",
+        "child_exit": child_exit,
+    }
+
+
+def serve_with_waitress():
+    from waitress import serve
+    from .app import app
+    serve(
+        app,
+        listen=os.environ.get("FLASK_AI_BIND", "0.0.0.0:5000"),
+        threads=int(os.environ.get("FLASK_AI_THREADS", 4)),
+    )
+
+
+if __name__ == "__main__":
+    if BaseApplication is None:
+        serve_with_waitress()
+    else:
+        FlaskAIServer(server_options()).run()
@@ -67,6 +67,113 @@ def test_classify_email():
         print(f"Error: {e}")
         return False
 
+def test_classify_batch():
+    """Classify batch endpoint test"""
+    print("\n" + "="*50)
+    print("5. Testing POST /classify_batch")
+    print("="*50)
+    try:
+        data = {"bodies": [
+            "Hi, I want to collaborate with you",
+            "Buy cheap products now!",
+            "We'd like to sponsor your next video",
+        ]}
+        response = requests.post(f"{BASE_URL}/classify_batch", json=data)
+        print(f"Status Code: {response.status_code}")
+        print(f"Request: {json.dumps(data, indent=2)}")
+        print(f"Response: {json.dumps(response.json(), indent=2)}")
+        categories = [item["category"] for item in response.json()["results"]]
+        return response.status_code == 200 and categories == ["useful", "spam", "useful"]
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_cache_stats():
+    """Result cache test: a repeated body is a cache hit"""
+    print("\n" + "="*50)
+    print("6. Testing GET /cache_stats")
+    print("="*50)
+    try:
+        # Caches are per worker process; under serve.py each request may land
+        # on a different worker, so repeat enough times to hit every one.
+        data = {"body": "Hi, I want to collaborate with you"}
+        for _ in range(20):
+            requests.post(f"{BASE_URL}/classify_email", json=data)
+        response = requests.get(f"{BASE_URL}/cache_stats")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {json.dumps(response.json(), indent=2)}")
+        return response.status_code == 200 and response.json()["classify"]["hits"] > 0
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_generate_reply_batch():
+    """Generate reply batch endpoint test"""
+    print("\n" + "="*50)
+    print("7. Testing POST /generate_reply_batch")
+    print("="*50)
+    try:
+        data = {"items": [
+            {"min_price": 10000},
+            {"template": "counter_offer_detailed", "brand_name": "Acme", "currency": "$",
+             "min_price": 1500, "deliverables": ["1 reel", "2 stories"]},
+            {"min_price": "not a number"},
+        ]}
+        response = requests.post(f"{BASE_URL}/generate_reply_batch", json=data)
+        print(f"Status Code: {response.status_code}")
+        print(f"Request: {json.dumps(data, indent=2)}")
+        print(f"Response: {json.dumps(response.json(), indent=2, ensure_ascii=False)}")
+        results = response.json()["results"]
+        return (
+            response.status_code == 200
+            and "₹10000" in results[0]["reply"]
+            and "For 1 reel and 2 stories, our fee starts from $1500." in results[1]["reply"]
+            and "error" in results[2]
+        )
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_classify_stream():
+    """NDJSON streaming classify endpoint test"""
+    print("\n" + "="*50)
+    print("8. Testing POST /classify_stream")
+    print("="*50)
+    try:
+        lines = "\n".join(json.dumps({"body": body}) for body in [
+            "Hi, I want to collaborate with you",
+            "Buy cheap products now!",
+        ])
+        response = requests.post(
+            f"{BASE_URL}/classify_stream", data=lines,
+            headers={"Content-Type": "application/x-ndjson"}, stream=True,
+        )
+        results = [json.loads(line) for line in response.iter_lines() if line]
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {json.dumps(results, indent=2)}")
+        return response.status_code == 200 and [r["category"] for r in results] == ["useful", "spam"]
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_metrics():
+    """Prometheus metrics endpoint test"""
+    print("\n" + "="*50)
+    print("9. Testing GET /metrics")
+    print("="*50)
+    try:
+        response = requests.get(f"{BASE_URL}/metrics")
+        samples = [line for line in response.text.splitlines()
+                   if line.startswith(("ai_http_requests_total", "ai_classifier_batch_size_count"))]
+        print(f"Status Code: {response.status_code}")
+        print("Samples:\n" + "\n".join(samples))
+        return (response.status_code == 200
+                and any(line.startswith("ai_http_requests_total") for line in samples)
+                and any(line.startswith("ai_classifier_batch_size_count") for line in samples))
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
 def test_generate_reply():
     """Generate reply endpoint test"""
     print("\n" + "="*50)
@@ -104,7 +211,7 @@ def main():
     print("="*50)
     print(f"\nTesting APIs at: {BASE_URL}")
     print("\nNote: Make sure Flask server is running!")
-    print("Run: python app.py")
+    print("Run: python -m flask_ai.app  (or python -m flask_ai.serve for the production server)")
     
     results = []
     
@@ -113,6 +220,11 @@ def main():
     results.append(("Health (/health)", test_health()))
     results.append(("Classify Email (/classify_email)", test_classify_email()))
     results.append(("Generate Reply (/generate_reply)", test_generate_reply()))
+    results.append(("Classify Batch (/classify_batch)", test_classify_batch()))
+    results.append(("Cache Stats (/cache_stats)", test_cache_stats()))
+    results.append(("Generate Reply Batch (/generate_reply_batch)", test_generate_reply_batch()))
+    results.append(("Classify Stream (/classify_stream)", test_classify_stream()))
+    results.append(("Metrics (/metrics)", test_metrics()))
     
     # Summary
     print("\n" + "="*50)
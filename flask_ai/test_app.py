@@ -0,0 +1,163 @@
+import json
+
+import pytest
+
+from flask_ai import app as app_module
+from flask_ai.pipeline import EmailPipeline
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Keyword rules and the built-in templates, whatever model is on disk
+    monkeypatch.setattr(app_module, "pipeline", EmailPipeline())
+    return app_module.app.test_client()
+
+
+def test_generate_reply_uses_the_default_template(client):
+    response = client.post("/generate_reply", json={"min_price": 800, "currency": "$"})
+
+    assert response.status_code == 200
+    assert response.json["decision"] == "counter_offer"
+    assert response.json["reply"].startswith("Hi,\n")
+    assert "starts from $800." in response.json["reply"]
+
+
+def test_generate_reply_picks_the_named_template(client):
+    response = client.post("/generate_reply", json={
+        "template": "counter_offer_detailed",
+        "brand_name": "Glow",
+        "deliverables": ["one reel", "two stories"],
+        "min_price": "1,250.5",
+        "currency": "€",
+    })
+
+    assert response.status_code == 200
+    assert response.json["reply"].startswith("Hi Glow,\n")
+    assert "For one reel and two stories, our fee starts from €1250.50." in response.json["reply"]
+
+
+def test_generate_reply_rejects_unknown_template(client):
+    response = client.post("/generate_reply", json={"template": "discount"})
+
+    assert response.status_code == 400
+    assert response.json == {"error": "Unknown template 'discount'"}
+
+
+def test_generate_reply_batch_returns_one_result_per_item(client):
+    response = client.post("/generate_reply_batch", json={"items": [
+        {"min_price": 100},
+        {"template": "counter_offer_detailed", "brand_name": "Glow"},
+        {"min_price": -1},
+        {"template": "discount"},
+        {"min_price": 100},
+    ]})
+
+    assert response.status_code == 200
+    results = response.json["results"]
+    assert len(results) == 5
+    assert "starts from ₹100." in results[0]["reply"]
+    assert results[1]["reply"].startswith("Hi Glow,\n")
+    assert results[2] == {"error": "min_price must be a non-negative number"}
+    assert results[3] == {"error": "Unknown template 'discount'"}
+    assert results[4] == results[0]
+
+
+@pytest.mark.parametrize("payload", [{}, {"items": "not a list"}, {"items": [{"min_price": 1}, "text"]}])
+def test_generate_reply_batch_rejects_malformed_items(client, payload):
+    response = client.post("/generate_reply_batch", json=payload)
+
+    assert response.status_code == 400
+    assert response.json == {"error": "items must be a list of objects"}
+
+
+def test_generate_reply_batch_size_limit(client, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_BATCH_SIZE", 2)
+
+    response = client.post("/generate_reply_batch", json={"items": [{}] * 3})
+
+    assert response.status_code == 413
+    assert response.json == {"error": "Too many items (3). Maximum is 2."}
+    assert client.post("/generate_reply_batch", json={"items": [{}] * 2}).status_code == 200
+
+
+def test_classify_batch_keeps_input_order(client):
+    bodies = ["Sponsored post?", "Hello", "", "Let's collab", "Hello"]
+
+    response = client.post("/classify_batch", json={"bodies": bodies})
+
+    assert response.status_code == 200
+    assert response.json["model"] == "keyword"
+    assert [result["category"] for result in response.json["results"]] == [
+        "useful", "spam", "spam", "useful", "spam",
+    ]
+
+
+@pytest.mark.parametrize("payload", [{}, {"bodies": "Hello"}, {"bodies": ["Hello", 1]}])
+def test_classify_batch_rejects_malformed_bodies(client, payload):
+    response = client.post("/classify_batch", json=payload)
+
+    assert response.status_code == 400
+    assert response.json == {"error": "bodies must be a list of strings"}
+
+
+def test_classify_batch_size_limit(client, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_BATCH_SIZE", 2)
+
+    response = client.post("/classify_batch", json={"bodies": ["a", "b", "c"]})
+
+    assert response.status_code == 413
+    assert response.json == {"error": "Too many bodies (3). Maximum is 2."}
+    assert client.post("/classify_batch", json={"bodies": ["a", "b"]}).status_code == 200
+
+
+def ndjson_lines(response):
+    assert response.mimetype == "application/x-ndjson"
+    text = response.get_data(as_text=True)
+    assert text.endswith("\n")
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_classify_stream_frames_one_line_per_item(client, monkeypatch):
+    monkeypatch.setattr(app_module, "STREAM_CHUNK_SIZE", 2)
+    body = '"Let\'s collab"\n\n{"body": "Hello"}\nnot json\n{"body": 5}\n"Sponsored"\n'
+
+    response = client.post("/classify_stream", data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    lines = ndjson_lines(response)
+    assert [line["index"] for line in lines] == [0, 1, 2, 3, 4]
+    assert [line.get("category") for line in lines] == ["useful", "spam", None, None, "useful"]
+    assert lines[2] == {"index": 2, "error": "invalid JSON line"}
+    assert lines[3] == {"index": 3, "error": "body must be a string"}
+
+
+def test_generate_reply_stream_accepts_a_json_list(client):
+    response = client.post("/generate_reply_stream", json={"items": [{"min_price": 100}, "text"]})
+
+    lines = ndjson_lines(response)
+    assert "starts from ₹100." in lines[0]["reply"]
+    assert lines[1] == {"index": 1, "error": "item must be an object"}
+    assert client.post("/generate_reply_stream", json={"items": "text"}).status_code == 400
+
+
+def test_stream_reports_pipeline_errors_and_goes_on(client, monkeypatch):
+    monkeypatch.setattr(app_module, "STREAM_CHUNK_SIZE", 2)
+    real_classify_many = app_module.pipeline.classify_many
+    calls = []
+
+    def classify_many(bodies):
+        calls.append(bodies)
+        if len(calls) == 2:
+            raise RuntimeError("model unavailable")
+        return real_classify_many(bodies)
+
+    monkeypatch.setattr(app_module.pipeline, "classify_many", classify_many)
+    bodies = ["collab 1", "collab 2", "collab 3", "collab 4", "collab 5"]
+
+    response = client.post("/classify_stream", json={"bodies": bodies})
+
+    assert response.status_code == 200
+    lines = ndjson_lines(response)
+    assert [line["index"] for line in lines] == [0, 1, 2, 3, 4]
+    assert [line.get("category") for line in lines] == ["useful", "useful", None, None, "useful"]
+    assert lines[2] == {"index": 2, "error": "Server error: model unavailable"}
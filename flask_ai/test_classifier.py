@@ -0,0 +1,88 @@
+import random
+
+from flask_ai.classifier import AhoCorasick, KeywordClassifier, TermMatcher
+
+
+def test_reports_nested_and_overlapping_terms():
+    assert AhoCorasick(["sponsor", "sponsorship", "ship"]).find("a sponsorship deal") == {"sponsor", "sponsorship", "ship"}
+    assert AhoCorasick(["ab", "bc"]).find("abc") == {"ab", "bc"}
+    assert AhoCorasick(["abcd", "bc", "c"]).find("xabcx") == {"bc", "c"}
+    assert AhoCorasick(["he", "she", "his", "hers"]).find("ushers") == {"he", "she", "hers"}
+
+
+def test_matches_substring_checks():
+    random.seed(7)
+    terms = ["".join(random.choice("abc ") for _ in range(random.randint(1, 4))) for _ in range(40)]
+    matcher = TermMatcher(terms)
+    for _ in range(200):
+        text = "".join(random.choice("abc  ") for _ in range(random.randint(0, 30)))
+        assert matcher.find(text) == {term for term in set(terms) if term and term in text}
+        assert matcher.find(text) == matcher.find(text)  # answered from the token memo
+
+
+def test_phrases_span_tokens():
+    matcher = TermMatcher(["paid partnership", "ship"])
+    assert matcher.find("a paid partnership offer") == {"paid partnership", "ship"}
+    assert matcher.find("paid\npartnership") == {"ship"}
+
+
+def test_token_memo_is_bounded():
+    matcher = TermMatcher(["collab"], memo_size=3)
+    assert matcher.find("one two collab") == {"collab"}
+    assert matcher.find("three four collaboration") == {"collab"}
+    assert len(matcher._token_terms) + len(matcher._plain_tokens) <= 3
+
+
+def test_classify_scores_each_term_once():
+    classifier = KeywordClassifier({"Sponsor": 1.0, "sponsorship": 0.5}, negative_terms={"unsubscribe": 2.0})
+    result = classifier.classify("SPONSORSHIP! sponsor sponsor")
+    assert result == {"category": "useful", "score": 1.5, "matches": ["sponsor", "sponsorship"]}
+    assert classifier.classify("Sponsor us. Unsubscribe here.")["category"] == "spam"
+    assert classifier.classify("")["matches"] == []
+
+
+class CountingTransitions(dict):
+    """One automaton state's transitions, counting every lookup in them."""
+
+    def __init__(self, transitions, counter):
+        super().__init__(transitions)
+        self.counter = counter
+
+    def __contains__(self, char):
+        self.counter[0] += 1
+        return super().__contains__(char)
+
+    def get(self, char, default=None):
+        self.counter[0] += 1
+        return super().get(char, default)
+
+
+def test_work_does_not_depend_on_rule_count():
+    random.seed(11)
+
+    def word():
+        return "".join(random.choice("etaoinshrdlucmfwypvbgk") for _ in range(random.randint(3, 9)))
+
+    vocabulary = [word() for _ in range(3000)] + ["collaboration", "sponsored"]
+    # ~2KB bodies
+    bodies = [" ".join(random.choice(vocabulary) for _ in range(330))[:2048] for _ in range(200)]
+    # Each distinct token goes through the automaton once (then the memo answers)
+    scanned = sum(len(token) for token in {token for body in bodies for token in body.split()})
+    results = {}
+    for count in (2, 50, 500, 2000):
+        terms = {"collab": 1.0, "sponsor": 1.0}
+        while len(terms) < count:
+            # Shares prefixes with the body words but never matches, so every
+            # rule set finds the same terms and only the rule count changes
+            terms[word() + "q"] = 1.0
+        classifier = KeywordClassifier(terms)
+        automaton = classifier.matcher._words
+        counter = [0]
+        automaton._goto = [CountingTransitions(transitions, counter) for transitions in automaton._goto]
+        results[count] = [result["matches"] for result in classifier.classify_many(bodies)]
+
+        # Per character: one transition, plus failure links that never
+        # outnumber the transitions taken, whatever the number of rules
+        assert counter[0] <= 3 * scanned, (count, counter[0], scanned)
+
+    assert all(matches == results[2] for matches in results.values())
@@ -0,0 +1,108 @@
+from flask_ai.classifier import KeywordClassifier
+from flask_ai.pipeline import EmailPipeline
+from flask_ai.result_cache import ResultCache, result_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_result_key_ignores_case_and_whitespace():
+    assert result_key("Hello  World\n", min_price=5) == result_key("hello world", min_price=5)
+    assert result_key("hello world", min_price=5) != result_key("hello world", min_price=6)
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ResultCache(ttl=10.0, clock=clock)
+    cache.set("a", 1)
+
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10.0
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_size=2, clock=FakeClock())
+    cache.set_many({"a": 1, "b": 2})
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", 3)
+
+    found, missing = cache.get_many(["a", "b", "c"])
+    assert found == {"a": 1, "c": 3}
+    assert missing == ["b"]
+    assert cache.stats()["size"] == 2
+
+
+def test_version_change_empties_the_cache():
+    cache = ResultCache(clock=FakeClock())
+    cache.use_version("v1")
+    cache.set("a", 1)
+
+    assert cache.use_version("v1") == "v1"
+    assert cache.get("a") == 1
+    cache.use_version("v2")
+    assert cache.get("a") is None
+    assert cache.stats()["version"] == "v2"
+
+
+def test_results_of_a_replaced_version_are_not_stored():
+    cache = ResultCache(clock=FakeClock())
+    version = cache.use_version("v1")
+    cache.use_version("v2")  # hot swap while the v1 results were being computed
+
+    cache.set("a", "v1 result", version)
+    assert cache.get("a") is None
+
+    cache.set("a", "v2 result", cache.use_version("v2"))
+    assert cache.get("a") == "v2 result"
+
+
+class FakeModel:
+    def __init__(self, version, during_classify=None):
+        self.version = version
+        self.during_classify = during_classify
+
+    def classify_many(self, bodies):
+        if self.during_classify:
+            self.during_classify()
+        return [{"category": "useful", "score": float(self.version), "matches": []} for _ in bodies]
+
+
+class FakeStore:
+    def __init__(self, model):
+        self.model = model
+
+    def get(self):
+        return self.model
+
+
+def test_pipeline_drops_results_of_a_model_swapped_out_mid_request():
+    pipeline = EmailPipeline(classifier=KeywordClassifier({"collab": 1.0}), model_store=FakeStore(None))
+
+    def hot_swap():
+        # Version 2 is loaded and another request classifies with it
+        pipeline.model_store.model = FakeModel(2)
+        pipeline.classify_many(["other"])
+
+    pipeline.model_store.model = FakeModel(1, during_classify=hot_swap)
+    results, model = pipeline.classify_many(["hello"])
+    assert (results[0]["score"], model) == (1.0, "text")
+
+    # The version 1 result was not cached under version 2
+    results, _ = pipeline.classify_many(["hello"])
+    assert results[0]["score"] == 2.0
+    assert pipeline.classify_cache.stats()["version"] == "text:2"
+
+
+def test_pipeline_caches_keyword_results():
+    pipeline = EmailPipeline(classifier=KeywordClassifier({"collab": 1.0}))
+    pipeline.classify_many(["Let's collab"])
+    pipeline.classify_many(["let's   COLLAB"])
+    assert pipeline.classify_cache.stats()["hits"] == 1
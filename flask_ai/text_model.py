@@ -0,0 +1,257 @@
+"""
+Local TF-IDF + naive Bayes email classifier.
+
+Trained offline (see the Django `train_classifier` command) from emails whose
+deal ended COMPLETED (worth it) or REJECTED / AUTO_REJECTED (not worth it).
+For two classes, multinomial naive Bayes collapses to a linear model over
+TF-IDF features: score = x · w + b with w = log P(term | useful) -
+log P(term | spam). Batch scoring builds one sparse matrix for all bodies
+(row / column / value arrays) and reduces it with NumPy, so there is no
+per-email Python arithmetic beyond tokenizing.
+
+Saved models are a directory of versions, each a set of flat `.npy` arrays
+opened with mmap, so every worker process shares the same physical pages and
+starts in milliseconds:
+
+    text_model/
+        CURRENT                 name of the live version
+        versions/<version>/
+            terms.npy           sorted, fixed-width UTF-8 terms (the vocabulary index)
+            idf.npy, weights.npy
+            meta.json           bias, threshold
+
+A new version is written under a temporary name, renamed into place, and then
+published by atomically replacing CURRENT; ModelStore notices and swaps.
+
+Runs on CPU with NumPy only; no network, no pickles.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Longer terms (rare, long bigrams) are left out of the vocabulary to keep the
+# fixed-width terms array small.
+MAX_TERM_BYTES = 64
+
+# Older versions kept on disk after a save, for workers still mapping them
+KEEP_VERSIONS = 3
+
+
+def tokenize(text):
+    """Lowercased word unigrams plus adjacent-word bigrams."""
+    words = TOKEN_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class TextModel:
+    def __init__(self, terms, idf, weights, bias, threshold=0.5, version=None):
+        self.terms = terms                     # sorted bytes array; position = column
+        self.idf = np.asanyarray(idf, dtype=np.float32)
+        self.weights = np.asanyarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.threshold = float(threshold)
+        self.version = version
+
+    def _sparse_tfidf(self, bodies):
+        """
+        TF-IDF rows for `bodies` as COO arrays (rows, cols, values), with
+        sublinear tf and L2-normalised rows. Unknown terms are dropped.
+        """
+        width = self.terms.dtype.itemsize
+        rows, tokens, counts = [], [], []
+        for row, body in enumerate(bodies):
+            for term, count in Counter(tokenize(body or "")).items():
+                encoded = term.encode("utf-8")
+                if len(encoded) <= width:
+                    rows.append(row)
+                    tokens.append(encoded)
+                    counts.append(count)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.float32)
+        if len(self.terms) and tokens:
+            # Vectorised vocabulary lookup: binary search every token at once
+            keys = np.array(tokens, dtype=self.terms.dtype)
+            cols = np.searchsorted(self.terms, keys)
+            cols[cols == len(self.terms)] = 0
+            known = self.terms[cols] == keys
+            rows, cols, counts = rows[known], cols[known], counts[known]
+        else:
+            cols = np.zeros(0, dtype=np.int64)
+            rows, counts = rows[:0], counts[:0]
+
+        values = (1.0 + np.log(counts)) * self.idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(bodies)))
+        norms[norms == 0] = 1.0
+        return rows, cols, values / norms[rows]
+
+    def decision_function(self, bodies):
+        """Raw linear scores (log-odds of "useful") for a batch of bodies."""
+        rows, cols, values = self._sparse_tfidf(bodies)
+        return np.bincount(rows, weights=values * self.weights[cols], minlength=len(bodies)) + self.bias
+
+    def predict_proba(self, bodies):
+        return 1.0 / (1.0 + np.exp(-self.decision_function(bodies)))
+
+    def classify_many(self, bodies):
+        """Return [{"category", "score"}] per body, like KeywordClassifier.classify_many."""
+        probabilities = self.predict_proba(bodies)
+        return [
+            {"category": "useful" if p >= self.threshold else "spam", "score": round(float(p), 4)}
+            for p in probabilities
+        ]
+
+    def classify(self, body):
+        return self.classify_many([body])[0]
+
+    @classmethod
+    def train(cls, bodies, labels, min_df=2, max_features=50000, alpha=1.0):
+        """
+        Fit on `bodies` with boolean `labels` (True = useful).
+        Terms seen in fewer than `min_df` emails are ignored; the
+        `max_features` most frequent remaining terms form the vocabulary.
+        """
+        labels = np.asarray(labels, dtype=bool)
+        if labels.all() or not labels.any():
+            raise ValueError("Training data needs both useful and not-useful examples.")
+
+        document_frequency = Counter()
+        for body in bodies:
+            document_frequency.update(set(tokenize(body or "")))
+        candidates = (
+            (term.encode("utf-8"), df) for term, df in document_frequency.most_common()
+            if df >= min_df
+        )
+        selected = [(term, df) for term, df in candidates if len(term) <= MAX_TERM_BYTES][:max_features]
+        if not selected:
+            raise ValueError("No term appears in at least min_df emails; lower min_df or add data.")
+
+        selected.sort()
+        terms = np.array([term for term, _ in selected])
+        n = len(bodies)
+        df = np.array([df for _, df in selected], dtype=np.float32)
+        idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+
+        model = cls(terms, idf, np.zeros(len(terms), dtype=np.float32), 0.0)
+        rows, cols, values = model._sparse_tfidf(bodies)
+
+        # Per-class feature mass, smoothed
+        useful_rows = labels[rows]
+        useful_mass = np.bincount(cols[useful_rows], weights=values[useful_rows], minlength=len(terms)) + alpha
+        spam_mass = np.bincount(cols[~useful_rows], weights=values[~useful_rows], minlength=len(terms)) + alpha
+        model.weights = (np.log(useful_mass / useful_mass.sum()) - np.log(spam_mass / spam_mass.sum())).astype(np.float32)
+        model.bias = float(np.log(labels.mean()) - np.log(1.0 - labels.mean()))
+        return model
+
+    def save(self, path):
+        """
+        Write this model as a new version under the `path` directory and make
+        it the current one. Returns the version name.
+        """
+        versions = os.path.join(path, "versions")
+        os.makedirs(versions, exist_ok=True)
+        now = time.time()
+        version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}.{int(now % 1 * 1e6):06d}-{uuid.uuid4().hex[:6]}"
+
+        staging = os.path.join(versions, f".tmp-{version}")
+        os.makedirs(staging)
+        np.save(os.path.join(staging, "terms.npy"), self.terms)
+        np.save(os.path.join(staging, "idf.npy"), self.idf)
+        np.save(os.path.join(staging, "weights.npy"), self.weights)
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump({"bias": self.bias, "threshold": self.threshold}, fh)
+        os.rename(staging, os.path.join(versions, version))
+
+        pointer = os.path.join(path, f"CURRENT.tmp-{version}")
+        with open(pointer, "w", encoding="utf-8") as fh:
+            fh.write(version)
+        os.replace(pointer, os.path.join(path, "CURRENT"))
+
+        self.version = version
+        _prune_versions(versions, keep=KEEP_VERSIONS, current=version)
+        return version
+
+    @classmethod
+    def load(cls, path, version=None):
+        """Memory-map `version` (default: the current one) of the model saved under `path`."""
+        version = version or current_version(path)
+        if version is None:
+            raise FileNotFoundError(f"No model has been saved under {path}")
+        directory = os.path.join(path, "versions", version)
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        return cls(
+            np.load(os.path.join(directory, "terms.npy"), mmap_mode="r", allow_pickle=False),
+            np.load(os.path.join(directory, "idf.npy"), mmap_mode="r", allow_pickle=False),
+            np.load(os.path.join(directory, "weights.npy"), mmap_mode="r", allow_pickle=False),
+            meta["bias"],
+            meta["threshold"],
+            version=version,
+        )
+
+
+def current_version(path):
+    """Name of the live version under `path`, or None if nothing was saved yet."""
+    try:
+        with open(os.path.join(path, "CURRENT"), encoding="utf-8") as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _prune_versions(versions, keep, current):
+    # Version names sort by creation time. Workers still mapping a removed
+    # version keep their pages until they swap (POSIX unlink semantics).
+    names = sorted(name for name in os.listdir(versions) if not name.startswith(".") and name != current)
+    for name in names[:max(0, len(names) - (keep - 1))]:
+        shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+
+
+class ModelStore:
+    """
+    Holds the current TextModel for a model directory and swaps in a new one
+    when CURRENT changes. The pointer is re-read at most every
+    `check_interval` seconds, so the per-request cost is a clock read.
+    """
+
+    def __init__(self, path, check_interval=1.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self.model = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The current model, or None if none has been saved."""
+        now = self.clock()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._refresh()
+        return self.model
+
+    def _refresh(self):
+        version = current_version(self.path)
+        if version is None or (self.model is not None and version == self.model.version):
+            return
+        try:
+            self.model = TextModel.load(self.path, version)
+        except (OSError, ValueError, KeyError):
+            # Keep serving the previous version; retry on the next check
+            logger.exception("Could not load text model version %s from %s", version, self.path)